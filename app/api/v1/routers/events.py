@@ -0,0 +1,67 @@
+from datetime import UTC, datetime
+from logging import getLogger
+
+from core.authentication.auth_middleware import get_current_active_user
+from core.events import stream_events, user_topic, video_topic
+from core.storage import async_storage
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from schemas.event import EventType, VideoEvent
+from schemas.user import User
+
+router = APIRouter()
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@router.get(path="/videos/{video_id}/events", response_class=StreamingResponse)
+async def get_video_events(video_id: str, request: Request) -> StreamingResponse:
+    """
+    Streams a video's processing state changes as Server-Sent Events.
+    The first event is the video's current state
+    """
+    logger = getLogger(__name__ + ".get_video_events")
+    try:
+        video = await async_storage.video_verify_record({"_id": video_id})
+        state = VideoEvent(
+            type=EventType.STATE,
+            video_id=video.id,
+            user_id=video.user_id,
+            data=video.model_dump(),
+            date=datetime.now(UTC),
+        )
+
+        return StreamingResponse(
+            stream_events(request, [video_topic(video.id)], initial=[state]),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS,
+        )
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to get video events",
+        )
+
+
+@router.get(path="/users/me/events", response_class=StreamingResponse)
+async def get_user_events(
+    request: Request, current_user: User = Depends(get_current_active_user)
+) -> StreamingResponse:
+    """Streams state changes of all the logged in user's videos as Server-Sent Events"""
+    logger = getLogger(__name__ + ".get_user_events")
+    try:
+        return StreamingResponse(
+            stream_events(request, [user_topic(current_user.id)]),
+            media_type="text/event-stream",
+            headers=SSE_HEADERS,
+        )
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to get user events",
+        )
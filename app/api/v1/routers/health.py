@@ -1,6 +1,7 @@
 from core.config import settings
+from core.media_cache import media_cache
 from fastapi import APIRouter, responses
-from schemas.health import Health, Status
+from schemas.health import CacheStats, Health, Status
 
 router = APIRouter()
 
@@ -26,3 +27,10 @@ async def get_health(response: HealthResponse):
     }
 
     return content
+
+
+@router.get("/health/stream-cache", response_model=CacheStats)
+async def get_stream_cache_stats():
+    """Stream cache statistics of this API process"""
+
+    return media_cache.stats()
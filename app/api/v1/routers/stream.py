@@ -1,30 +1,233 @@
 import os
 from logging import getLogger
+from typing import Optional, Tuple
 
 from core.config import settings
-from core.storage import storage
-from fastapi import APIRouter, HTTPException, status
-from fastapi.responses import FileResponse
+from core.delivery import (
+    delivery_headers,
+    is_not_modified,
+    make_etag,
+    media_key,
+    media_prefix,
+    media_type,
+    parse_range,
+    resolve_media_path,
+    signed_cache_control,
+)
+from core.media_cache import CachedFile, media_cache
+from core.media_storage import media_storage
+from core.stream_signing import forbidden, verify_stream_token
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter()
 
 
-@router.get(path="/stream/{video}")
-def stream_video(video: str) -> FileResponse:
-    """Stream Video"""
-    logger = getLogger(__name__ + ".stream_video")
+def cache_ttl(path: str) -> float:
+    """Gets how long an HLS file may be served from memory"""
+    if path.endswith(".m3u8"):
+        return settings.PLAYLIST_MAX_AGE_SEC
+
+    return settings.MEDIA_CACHE_TTL_SEC
+
+
+def read_cacheable(path: str) -> Optional[CachedFile]:
+    """
+    Reads a small HLS file to cache, or returns None if it is too large
+    to cache. The file is stat'ed through its open descriptor so the ETag
+    matches the content read
+    """
+    with open(path, mode="rb") as f:
+        stat_result = os.fstat(f.fileno())
+        if not media_cache.admits(stat_result.st_size):
+            return None
+        content = f.read()
+
+    return CachedFile(
+        content=content,
+        headers=delivery_headers(path, make_etag(stat_result)),
+        media_type=media_type(path),
+        ttl=cache_ttl(path),
+    )
+
+
+def read_stored(path: str) -> Optional[CachedFile]:
+    """
+    Reads a small HLS file from a media storage that is not on this host
+    to cache, or returns None if it is too large to cache
+    """
+    key = media_key(path)
+    stored = media_storage.stat(key)
+    if stored is None:
+        raise FileNotFoundError(key)
+    if not media_cache.admits(stored.size):
+        return None
+
+    return CachedFile(
+        content=b"".join(media_storage.read(key)),
+        headers=delivery_headers(path, stored.etag),
+        media_type=media_type(path),
+        ttl=cache_ttl(path),
+    )
+
+
+def requested_range(
+    request: Request, etag: str, size: int
+) -> Optional[Tuple[int, int]]:
+    """Gets the byte range to answer a request with, None for the whole file"""
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range != etag:
+        return None
+
+    return parse_range(request.headers.get("range"), size)
+
+
+def cached_response(entry: CachedFile, request: Request) -> Response:
+    """Answers a request, including Range and If-Range, from a cached file"""
+    headers = {**entry.headers, "accept-ranges": "bytes"}
+    content = entry.content
+    status_code = status.HTTP_200_OK
+
+    byte_range = requested_range(request, headers["etag"], len(content))
+    if byte_range is not None:
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{len(content)}"
+        content = content[start : end + 1]
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+
+    if request.method == "HEAD":
+        headers["content-length"] = str(len(content))
+        content = b""
+
+    return Response(
+        content=content,
+        status_code=status_code,
+        headers=headers,
+        media_type=entry.media_type,
+    )
+
+
+def stored_response(path: str, request: Request) -> Response:
+    """
+    Answers a request, including Range and If-Range, by streaming a large
+    HLS file from a media storage that is not on this host
+    """
+    key = media_key(path)
+    stored = media_storage.stat(key)
+    if stored is None:
+        raise FileNotFoundError(key)
+
+    headers = {**delivery_headers(path, stored.etag), "accept-ranges": "bytes"}
+    if is_not_modified(request.headers.get("if-none-match"), headers["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    start, end = 0, stored.size - 1
+    status_code = status.HTTP_200_OK
+    byte_range = requested_range(request, headers["etag"], stored.size)
+    if byte_range is not None:
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{stored.size}"
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+    headers["content-length"] = str(end - start + 1)
+
+    if request.method == "HEAD":
+        return Response(
+            status_code=status_code, headers=headers, media_type=media_type(path)
+        )
+
+    return StreamingResponse(
+        media_storage.read(key, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type(path),
+    )
+
+
+async def serve_media(full_path: str, request: Request) -> Response:
+    """
+    Serves an HLS file with strong ETags, Range/If-Range support and CDN
+    friendly Cache-Control headers. Hot files are served from memory on the
+    event loop. Reads and stats of storage run in the threadpool
+    """
+    local = media_storage.local_directory(media_prefix(full_path)) is not None
+    try:
+        entry = await media_cache.load(
+            full_path, read_cacheable if local else read_stored
+        )
+        if entry is None and not local:
+            return await run_in_threadpool(stored_response, full_path, request)
+        stat_result = None if entry else await run_in_threadpool(os.stat, full_path)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
+        )
+    except TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Timed out loading file",
+        )
+
+    headers = (
+        entry.headers if entry else delivery_headers(full_path, make_etag(stat_result))
+    )
+    if is_not_modified(request.headers.get("if-none-match"), headers["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if entry is not None:
+        return cached_response(entry, request)
+
+    # FileResponse answers Range and If-Range requests, and hands the file
+    # to the server for zero-copy sending when it supports pathsend
+    return FileResponse(
+        path=full_path,
+        media_type=media_type(full_path),
+        headers=headers,
+        stat_result=stat_result,
+    )
+
+
+@router.api_route(path="/stream/signed/{token}/{path:path}", methods=["GET", "HEAD"])
+async def stream_signed_media(token: str, path: str, request: Request) -> Response:
+    """
+    Serves HLS playlists, segments and thumbnails to holders of a stream
+    token for the video. Players resolve the playlists' relative URLs
+    against the signed URL, so every file they request carries the token
+    """
+    logger = getLogger(__name__ + ".stream_signed_media")
     try:
-        path = f"./{settings.VIDEO_DIRECTORY}/{video}"
-        logger.info(f"Serving {path}")
-        # path = r"./videos/67a1fe27ef93a0385ff36090/master.m3u8"
-        if not os.path.isfile(path):
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Video not found"
-            )
-        return FileResponse(path=path, media_type="application/x-mpegURL")
-    except HTTPException as ex:
-        logger.error(ex)
-        raise ex
+        full_path = resolve_media_path(path)
+        expires = verify_stream_token(token, media_prefix(full_path))
+
+        response = await serve_media(full_path, request)
+        response.headers["cache-control"] = signed_cache_control(full_path, expires)
+        return response
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error loading video",
+        )
+
+
+@router.api_route(path="/stream/{path:path}", methods=["GET", "HEAD"])
+async def stream_media(path: str, request: Request) -> Response:
+    """
+    Serves HLS playlists, segments and thumbnails without a stream token,
+    unless STREAM_REQUIRE_TOKEN is set
+    """
+    logger = getLogger(__name__ + ".stream_media")
+    try:
+        if settings.STREAM_REQUIRE_TOKEN:
+            raise forbidden
+
+        return await serve_media(resolve_media_path(path), request)
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
     except Exception as ex:
         logger.error(ex, stack_info=True)
         raise HTTPException(
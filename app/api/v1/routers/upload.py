@@ -0,0 +1,208 @@
+import os
+import shutil
+from logging import getLogger
+from typing import Dict
+
+from core.authentication.auth_middleware import get_current_active_user
+from core.config import settings
+from core.storage import async_storage
+from core.upload import (
+    allocate_upload_file,
+    hash_file,
+    upload_session_path,
+    verify_upload_size,
+    write_upload_chunk,
+)
+from core.video_processing import ingest_video
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from schemas.upload import UploadChunk, UploadSession, UploadSessionIn
+from schemas.user import User
+from schemas.video import Video
+from starlette.concurrency import run_in_threadpool
+
+router = APIRouter()
+
+
+@router.post(path="/uploads", response_model=UploadSession)
+async def create_upload_session(
+    input: UploadSessionIn, current_user: User = Depends(get_current_active_user)
+) -> UploadSession:
+    """Creates a resumable upload session"""
+    logger = getLogger(__name__ + ".create_upload_session")
+    try:
+        verify_upload_size(input.size)
+
+        id = await async_storage.upload_session_create_record(
+            session_data=input, user_id=current_user.id
+        )
+        try:
+            await run_in_threadpool(
+                allocate_upload_file, upload_session_path(id), input.size
+            )
+        except Exception:
+            await async_storage.upload_session_delete_record({"_id": id})
+            raise
+
+        return await async_storage.upload_session_verify_record({"_id": id})
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to create upload session",
+        )
+
+
+@router.get(path="/uploads/{session_id}", response_model=UploadSession)
+async def get_upload_session(
+    session_id: str, current_user: User = Depends(get_current_active_user)
+) -> UploadSession:
+    """Gets an upload session, including the chunks received so far"""
+    logger = getLogger(__name__ + ".get_upload_session")
+    try:
+        return await async_storage.upload_session_verify_record(
+            {"_id": session_id, "user_id": current_user.id}
+        )
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to get upload session",
+        )
+
+
+@router.put(path="/uploads/{session_id}", response_model=UploadChunk)
+async def upload_chunk(
+    session_id: str,
+    offset: int,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+) -> UploadChunk:
+    """
+    Uploads the chunk starting at offset. Chunks may be sent
+    in any order and in parallel
+    """
+    logger = getLogger(__name__ + ".upload_chunk")
+    try:
+        session = await async_storage.upload_session_verify_record(
+            {"_id": session_id, "user_id": current_user.id},
+        )
+
+        if offset < 0 or offset >= session.size or offset % session.chunk_size:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Offset must be a multiple of {session.chunk_size}"
+                + f" less than {session.size}",
+            )
+
+        index = offset // session.chunk_size
+        length = min(session.chunk_size, session.size - offset)
+
+        await write_upload_chunk(
+            request=request,
+            path=upload_session_path(session.id),
+            offset=offset,
+            length=length,
+        )
+        await async_storage.upload_session_add_chunk({"_id": session.id}, index)
+
+        return UploadChunk(index=index, offset=offset, size=length)
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to upload chunk",
+        )
+
+
+@router.post(path="/uploads/{session_id}/finalize", response_model=Video)
+async def finalize_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_active_user),
+) -> Video:
+    """Assembles a completed upload session into a video"""
+    logger = getLogger(__name__ + ".finalize_upload_session")
+    try:
+        filter = {"_id": session_id, "user_id": current_user.id}
+        session = await async_storage.upload_session_verify_record(filter)
+
+        missing = session.chunk_count - len(session.received_chunks)
+        if missing > 0:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload incomplete. {missing} chunks missing",
+            )
+
+        # the session is only deleted once the upload belongs to a video, so a
+        # failure before then leaves it to be finalized again or to expire
+        id = await async_storage.video_create_record(
+            title=session.title,
+            user_id=current_user.id,
+            duration_in_sec=0,
+            description=session.description,
+            tags=session.tags,
+        )
+        output_path = f"{settings.VIDEO_DIRECTORY}/{id}"
+        try:
+            os.makedirs(output_path, exist_ok=True)
+            video_path = f"{output_path}/{id}.mp4"
+            try:
+                await run_in_threadpool(
+                    shutil.move, upload_session_path(session.id), video_path
+                )
+            except FileNotFoundError:
+                # moved by a concurrent finalize of the same session
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Upload session already finalized",
+                )
+            await async_storage.upload_session_delete_record(filter, remove_file=False)
+
+            # chunks arrive out of order, so the checksum is computed once whole
+            upload = await run_in_threadpool(hash_file, video_path)
+
+            return await ingest_video(
+                video_id=id, user_id=current_user.id, upload=upload
+            )
+        except BaseException:
+            await async_storage.video_delete_record({"_id": id})
+            raise
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to finalize upload",
+        )
+
+
+@router.delete(path="/uploads/{session_id}", response_model=Dict[str, str])
+async def abort_upload_session(
+    session_id: str, current_user: User = Depends(get_current_active_user)
+) -> Dict[str, str]:
+    """Aborts an upload session and discards the received chunks"""
+    logger = getLogger(__name__ + ".abort_upload_session")
+    try:
+        await async_storage.upload_session_delete_record(
+            {"_id": session_id, "user_id": current_user.id}
+        )
+        return {"message": "Upload session aborted successfully"}
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to abort upload session",
+        )
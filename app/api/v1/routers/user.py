@@ -4,26 +4,27 @@ from typing import Dict, Literal
 from core.authentication.auth_middleware import (
     authenticate_user,
     get_current_active_user,
+    get_current_admin_user,
 )
 from core.authentication.auth_token import create_access_token
-from core.storage import storage
+from core.storage import async_storage
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from schemas.user import User, UserIn, UserOut
+from schemas.user import User, UserIn, UserOut, UserTierUpdate
 
 router = APIRouter()
 
 
 @router.post(path="/register", response_model=UserOut)
-def register_user(input: UserIn) -> UserOut:
+async def register_user(input: UserIn) -> UserOut:
     """Registers a new user"""
     logger = getLogger(__name__ + ".register_user")
 
     try:
-        id = storage.user_create_record(user_data=input, verified=True)
+        id = await async_storage.user_create_record(user_data=input, verified=True)
 
-        return storage.user_verify_record({"_id": id})
+        return await async_storage.user_verify_record({"_id": id})
 
     except Exception as ex:
         logger.error(ex)
@@ -42,12 +43,12 @@ def register_user(input: UserIn) -> UserOut:
         str,
     ],
 )
-def login_user(input: OAuth2PasswordRequestForm = Depends()) -> UserOut:
+async def login_user(input: OAuth2PasswordRequestForm = Depends()) -> UserOut:
     """Logs in a user"""
     logger = getLogger(__name__ + ".login_user")
 
     try:
-        user = authenticate_user(email=input.username, password=input.password)
+        user = await authenticate_user(email=input.username, password=input.password)
 
         logger.info("User Authenticated")
         if not user.verified:
@@ -87,7 +88,7 @@ def login_user(input: OAuth2PasswordRequestForm = Depends()) -> UserOut:
 
 
 @router.get(path="/users/me", response_model=UserOut)
-def get_user_details(
+async def get_user_details(
     current_user: User = Depends(get_current_active_user),
 ) -> UserOut:
     """Gets the details of the logged in user"""
@@ -103,3 +104,32 @@ def get_user_details(
                 detail=str(ex),
             )
         raise ex
+
+
+@router.patch(path="/users/{user_id}/tier", response_model=UserOut)
+async def update_user_tier(
+    user_id: str,
+    input: UserTierUpdate,
+    current_user: User = Depends(get_current_admin_user),
+) -> UserOut:
+    """
+    Sets the tier of a user, which sets the priority and preset of their
+    transcoding jobs. Admins only
+    """
+    logger = getLogger(__name__ + ".update_user_tier")
+    try:
+        await async_storage.user_update_record(
+            {"_id": user_id}, update={"tier": input.tier}
+        )
+        logger.info(f"User ({user_id}) tier set to {input.tier.value}")
+
+        return await async_storage.user_verify_record({"_id": user_id})
+
+    except Exception as ex:
+        logger.error(ex)
+        if type(ex) is not HTTPException:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=str(ex),
+            )
+        raise ex
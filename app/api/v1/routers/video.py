@@ -1,29 +1,55 @@
-import json
+import math
 import os
-import subprocess
 from logging import getLogger
-from typing import Dict, List, Optional
+from typing import Annotated, Dict, List, Optional
 
-from bson.objectid import ObjectId
 from core.authentication.auth_middleware import get_current_active_user
 from core.config import settings
-from core.storage import storage
-from core.video_processing import generate_hls
-from fastapi import APIRouter, Depends, Form, HTTPException, UploadFile, status
-from fastapi.background import BackgroundTasks
-from fastapi.responses import HTMLResponse
+from core.pagination import get_video_page
+from core.storage import async_storage
+from core.stream_signing import create_playback
+from core.upload import save_upload_file, verify_upload_size
+from core.video_processing import ingest_video
+from fastapi import (
+    APIRouter,
+    Depends,
+    Form,
+    HTTPException,
+    Query,
+    UploadFile,
+    status,
+)
+from fastapi.responses import HTMLResponse, Response
+from schemas.base import Page
+from schemas.job import Job
 from schemas.user import User
-from schemas.video import Video, VideoUpdate
+from schemas.video import (
+    Video,
+    VideoOrder,
+    VideoPlayback,
+    VideoProgress,
+    VideoStatus,
+    VideoUpdate,
+)
 
 router = APIRouter()
 
+with open("./templates/index.html", mode="r") as f:
+    WATCH_PAGE = f.read()
+
+PageSize = Annotated[int, Query(ge=1, le=settings.VIDEO_PAGE_MAX_SIZE)]
+
+video_unavailable = HTTPException(
+    status_code=status.HTTP_409_CONFLICT, detail="Video is not available yet"
+)
+
 
 @router.get(path="/videos/{video_id}", response_model=Video)
-def get_video(video_id: str) -> Video:
+async def get_video(video_id: str) -> Video:
     """Gets a video by its id"""
     logger = getLogger(__name__ + ".get_video")
     try:
-        video = storage.video_verify_record({"_id": video_id})
+        video = await async_storage.video_verify_record({"_id": video_id})
         return video
     except HTTPException as hex:
         logger.error(hex)
@@ -36,18 +62,91 @@ def get_video(video_id: str) -> Video:
         )
 
 
+@router.get(path="/videos/{video_id}/job", response_model=Job)
+async def get_video_job(video_id: str) -> Job:
+    """Gets the status of a video's transcoding job"""
+    logger = getLogger(__name__ + ".get_video_job")
+    try:
+        return await async_storage.job_verify_record({"video_id": video_id})
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to get video job",
+        )
+
+
+@router.get(path="/videos/{video_id}/progress", response_model=VideoProgress)
+async def get_video_progress(video_id: str, response: Response) -> VideoProgress:
+    """
+    Gets the transcoding progress of a video. While the video is processing,
+    including while it is partially available, the Retry-After header
+    suggests when to poll again
+    """
+    logger = getLogger(__name__ + ".get_video_progress")
+    try:
+        video = await async_storage.video_verify_record({"_id": video_id})
+
+        if video.status == VideoStatus.AVAILABLE:
+            return VideoProgress(percent=100, date_updated=video.date_modified)
+
+        progress = video.progress or VideoProgress()
+        retry_after = settings.PROGRESS_UPDATE_INTERVAL_SEC
+        if progress.eta_sec is not None:
+            retry_after = min(max(retry_after, progress.eta_sec / 10), 60)
+        response.headers["Retry-After"] = str(math.ceil(retry_after))
+
+        return progress
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to get video progress",
+        )
+
+
+@router.get(path="/videos/{video_id}/playback", response_model=VideoPlayback)
+async def get_video_playback(
+    video_id: str, current_user: User = Depends(get_current_active_user)
+) -> VideoPlayback:
+    """Gets short-lived signed URLs to stream a video"""
+    logger = getLogger(__name__ + ".get_video_playback")
+    try:
+        video = await async_storage.video_verify_record({"_id": video_id})
+        if not video.available:
+            raise video_unavailable
+
+        return create_playback(video)
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to get video playback",
+        )
+
+
 @router.get(path="/videos/{video_id}/watch", response_class=HTMLResponse)
-def watch_video_page(video_id: str) -> Video:
+async def watch_video_page(video_id: str) -> Video:
     """Gets a video viewing page by its id"""
     logger = getLogger(__name__ + ".watch_video_page")
     try:
-        video = storage.video_verify_record({"_id": video_id})
-        url = f"http://localhost:8000/stream/{video.id}/master.m3u8"
-        html = ""
-        with open("./templates/index.html", mode="r") as f:
-            html = f.read()
+        video = await async_storage.video_verify_record({"_id": video_id})
+        if not video.available:
+            raise video_unavailable
 
-        html = html.replace("VIDEO_URL", url)
+        playback = create_playback(video)
+        html = WATCH_PAGE.replace("VIDEO_URL", playback.url).replace(
+            "POSTER_URL", playback.poster_url or ""
+        )
 
         return HTMLResponse(content=html)
     except HTTPException as hex:
@@ -61,21 +160,21 @@ def watch_video_page(video_id: str) -> Video:
         )
 
 
-@router.get(path="/videos", response_model=List[Video])
-def get_videos(
-    cursor: Optional[str] = None, limit: int = 0, only_available: bool = True
-) -> Video:
-    """Gets all available videos"""
+@router.get(path="/videos", response_model=Page[Video])
+async def get_videos(
+    cursor: Optional[str] = None,
+    limit: PageSize = settings.VIDEO_PAGE_SIZE,
+    order: VideoOrder = VideoOrder.NEWEST,
+    only_available: bool = True,
+) -> Page[Video]:
+    """Gets a page of all available videos"""
     logger = getLogger(__name__ + ".get_videos")
     try:
         filter = {}
         if only_available:
             filter["available"] = True
-        if cursor:
-            filter["_id"] = {"$gt": ObjectId(cursor)}
 
-        videos = storage.video_get_all_records(filter=filter, limit=limit)
-        return videos
+        return await get_video_page(filter, order, limit, cursor)
     except HTTPException as hex:
         logger.error(hex)
         raise hex
@@ -83,14 +182,83 @@ def get_videos(
         logger.error(ex, stack_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Unable to get video",
+            detail="Unable to get videos",
+        )
+
+
+@router.get(path="/users/me/videos", response_model=Page[Video])
+async def get_my_videos(
+    cursor: Optional[str] = None,
+    limit: PageSize = settings.VIDEO_PAGE_SIZE,
+    order: VideoOrder = VideoOrder.NEWEST,
+    current_user: User = Depends(get_current_active_user),
+) -> Page[Video]:
+    """Gets a page of the current user's videos, including those processing"""
+    logger = getLogger(__name__ + ".get_my_videos")
+    try:
+        return await get_video_page({"user_id": current_user.id}, order, limit, cursor)
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to get videos",
+        )
+
+
+@router.get(path="/users/{user_id}/videos", response_model=Page[Video])
+async def get_user_videos(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: PageSize = settings.VIDEO_PAGE_SIZE,
+    order: VideoOrder = VideoOrder.NEWEST,
+) -> Page[Video]:
+    """Gets a page of a user's available videos"""
+    logger = getLogger(__name__ + ".get_user_videos")
+    try:
+        return await get_video_page(
+            {"user_id": user_id, "available": True}, order, limit, cursor
+        )
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to get videos",
+        )
+
+
+@router.get(path="/tags/{tag}/videos", response_model=Page[Video])
+async def get_tag_videos(
+    tag: str,
+    cursor: Optional[str] = None,
+    limit: PageSize = settings.VIDEO_PAGE_SIZE,
+    order: VideoOrder = VideoOrder.NEWEST,
+) -> Page[Video]:
+    """Gets a page of the available videos with a tag"""
+    logger = getLogger(__name__ + ".get_tag_videos")
+    try:
+        return await get_video_page(
+            {"tags": tag, "available": True}, order, limit, cursor
+        )
+    except HTTPException as hex:
+        logger.error(hex)
+        raise hex
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to get videos",
         )
 
 
 @router.post(path="/videos", response_model=Video)
 async def upload_video(
     video_file: UploadFile,
-    background_tasks: BackgroundTasks,
     title: str = Form(...),
     description: Optional[str] = Form(default=None),
     tags: List[str] = Form(default=[]),
@@ -99,9 +267,11 @@ async def upload_video(
     """Uploads a video to the server"""
     logger = getLogger(__name__ + ".upload_video")
     try:
+        if video_file.size is not None:
+            verify_upload_size(video_file.size)
         os.makedirs(settings.VIDEO_DIRECTORY, exist_ok=True)
 
-        id = storage.video_create_record(
+        id = await async_storage.video_create_record(
             title=title,
             user_id=current_user.id,
             duration_in_sec=0,
@@ -112,34 +282,16 @@ async def upload_video(
         os.makedirs(output_path, exist_ok=True)
         video_path = f"{output_path}/{id}.mp4"
 
-        with open(video_path, mode="wb") as f:
-            f.write(await video_file.read())
-
-        command = [
-            "ffprobe",
-            "-v",
-            "error",
-            "-show_format",
-            "-show_streams",
-            "-print_format",
-            "json",
-            video_path,
-        ]
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        metadata: dict = json.loads(result.stdout)
-
-        update = {"duration_in_sec": float(metadata.get("format").get("duration"))}
-        storage.video_update_record(
-            filter={"_id": id, "user_id": current_user.id}, update=update
-        )
+        try:
+            upload = await save_upload_file(video_file, video_path)
+            logger.info(f"Video ({id}) uploaded with sha256 {upload.checksum}")
 
-        background_tasks.add_task(
-            generate_hls, input_file=video_path, prefix=output_path, video_id=id
-        )
-
-        return storage.video_verify_record(
-            filter={"_id": id, "user_id": current_user.id}
-        )
+            return await ingest_video(
+                video_id=id, user_id=current_user.id, upload=upload
+            )
+        except BaseException:
+            await async_storage.video_delete_record({"_id": id})
+            raise
 
     except HTTPException as hex:
         logger.error(hex)
@@ -153,7 +305,7 @@ async def upload_video(
 
 
 @router.patch(path="/videos/{video_id}", response_model=Video)
-def update_video(
+async def update_video(
     video_id: str,
     video_data: VideoUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -162,11 +314,11 @@ def update_video(
     logger = getLogger(__name__ + ".update_video")
     try:
         update = video_data.model_dump(exclude_unset=True)
-        storage.video_update_record(
+        await async_storage.video_update_record(
             filter={"_id": video_id, "user_id": current_user.id}, update=update
         )
 
-        video = storage.video_verify_record(filter={"_id": video_id})
+        video = await async_storage.video_verify_record(filter={"_id": video_id})
         return video
     except HTTPException as hex:
         logger.error(hex)
@@ -180,13 +332,15 @@ def update_video(
 
 
 @router.delete(path="/videos/{video_id}", response_model=Dict[str, str])
-def delete_video(
+async def delete_video(
     video_id: str, current_user: User = Depends(get_current_active_user)
 ) -> Video:
     """Deletes a video by its id"""
     logger = getLogger(__name__ + ".delete_video")
     try:
-        storage.video_delete_record({"_id": video_id, "user_id": current_user.id})
+        await async_storage.video_delete_record(
+            {"_id": video_id, "user_id": current_user.id}
+        )
         return {"message": "Video deleted successfully"}
     except HTTPException as hex:
         logger.error(hex)
@@ -0,0 +1,177 @@
+"""
+Measures the throughput and latency of GET /api/v1/videos/{id} under
+concurrent clients, once per DATABSE_SERVICE, by starting the API with
+uvicorn for each and driving it with keep-alive HTTP/1.1 connections.
+MONGO_SYNC runs the request handlers' queries on the synchronous driver
+in the threadpool, MONGO on the async driver. A MongoDB instance is
+required (MONGO_URI, DATABSE_NAME); a video record is created for the
+run and deleted afterwards.
+
+Usage:
+    python benchmarks/load_test.py --clients 64 --seconds 10
+    python benchmarks/load_test.py --services MONGO --url http://host:8000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+APP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIRECTORY)
+for key, value in [
+    ("MONGO_URI", "mongodb://localhost:27017"),
+    ("DATABSE_SERVICE", "MONGO"),
+    ("DATABSE_NAME", "them-tube-benchmark"),
+    ("ALLOWED_ORIGINS", "benchmark"),
+    ("SECRET_KEY", "benchmark"),
+    ("ALGORITHM", "benchmark"),
+    ("ACCESS_TOKEN_EXPIRE_DAYS", "1"),
+    # the API would otherwise reconcile the benchmark database on startup
+    ("RECOVERY_ON_STARTUP", "false"),
+]:
+    os.environ.setdefault(key, value)
+
+
+async def request(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str
+) -> int:
+    """Sends a GET request on a keep-alive connection and reads the response"""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+
+    status_line = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+
+    return int(status_line.split()[1])
+
+
+async def run_client(
+    url: str, path: str, deadline: float, latencies: List[float], errors: List[int]
+):
+    """Sends requests back to back on one connection until the deadline"""
+    address = urlsplit(url)
+    reader, writer = await asyncio.open_connection(address.hostname, address.port)
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status_code = await request(reader, writer, address.netloc, path)
+            latencies.append(time.perf_counter() - start)
+            if status_code != 200:
+                errors.append(status_code)
+    finally:
+        writer.close()
+
+
+async def load(url: str, path: str, clients: int, seconds: float) -> Dict:
+    """Drives an API with concurrent clients and summarizes the responses"""
+    latencies: List[float] = []
+    errors: List[int] = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            run_client(url, path, start + seconds, latencies, errors)
+            for _ in range(clients)
+        )
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_sec": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+async def wait_until_ready(url: str, timeout: float = 30):
+    """Waits for an API to answer its health endpoint"""
+    address = urlsplit(url)
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(
+                address.hostname, address.port
+            )
+            try:
+                await request(reader, writer, address.netloc, "/api/v1/health")
+                return
+            finally:
+                writer.close()
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--services", default="MONGO_SYNC,MONGO")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", default=None, help="load a running API instead")
+    args = parser.parse_args()
+
+    from core.storage import storage
+
+    video_id = storage.video_create_record(
+        title="load test", user_id="benchmark", duration_in_sec=0
+    )
+    path = f"/api/v1/videos/{video_id}"
+    try:
+        for service in args.services.split(","):
+            url = args.url or f"http://127.0.0.1:{args.port}"
+            server = None
+            if args.url is None:
+                server = subprocess.Popen(
+                    [
+                        sys.executable,
+                        "-m",
+                        "uvicorn",
+                        "main:app",
+                        "--port",
+                        str(args.port),
+                        "--log-level",
+                        "warning",
+                    ],
+                    cwd=APP_DIRECTORY,
+                    env={**os.environ, "DATABSE_SERVICE": service},
+                )
+            try:
+                await wait_until_ready(url)
+                result = await load(url, path, args.clients, args.seconds)
+            finally:
+                if server is not None:
+                    server.terminate()
+                    server.wait()
+
+            print(
+                f"{service:>10} {args.clients} clients"
+                + f" {result['requests_per_sec']:>8.0f} req/s"
+                + f" p50 {result['p50_ms']:.1f}ms p99 {result['p99_ms']:.1f}ms"
+                + f" errors {result['errors']}"
+            )
+    finally:
+        storage.video_delete_record({"_id": video_id})
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
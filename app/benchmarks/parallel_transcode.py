@@ -0,0 +1,124 @@
+"""
+Compares the wall-clock time of single process and chunked parallel HLS
+transcoding on a synthetic lavfi source.
+
+Usage:
+    python benchmarks/parallel_transcode.py --duration 600 --processes 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for key in [
+    "MONGO_URI",
+    "DATABSE_SERVICE",
+    "DATABSE_NAME",
+    "ALLOWED_ORIGINS",
+    "SECRET_KEY",
+    "ALGORITHM",
+]:
+    # settings are required by core.config but unused here
+    os.environ.setdefault(key, "benchmark")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_DAYS", "1")
+
+from core.media_probe import get_media_info, probe, run_command  # noqa: E402
+from core.parallel_transcoding import transcode_chunked  # noqa: E402
+from core.renditions import build_hls_command, plan_renditions  # noqa: E402
+
+
+async def make_source(path: str, duration: int, width: int, height: int):
+    """Generates a deterministic test video with a sine wave audio track"""
+    command = [
+        "ffmpeg",
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={width}x{height}:rate=30:duration={duration}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:duration={duration}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-g",
+        "60",
+        "-c:a",
+        "aac",
+        path,
+    ]
+    returncode, _, stderr = await run_command(command)
+    if returncode != 0:
+        raise RuntimeError(stderr.decode())
+
+
+async def ignore_progress(block):
+    pass
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=int, default=600)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="them-tube-bench-")
+    try:
+        source = f"{directory}/source.mp4"
+        await make_source(source, args.duration, args.width, args.height)
+        media_info = get_media_info(await probe(source))
+        renditions = plan_renditions(media_info)
+
+        single = f"{directory}/single"
+        command = build_hls_command(
+            source, single, renditions, has_audio=media_info.has_audio
+        )
+        start = time.perf_counter()
+        returncode, _, stderr = await run_command(command)
+        if returncode != 0:
+            raise RuntimeError(stderr.decode())
+        single_sec = time.perf_counter() - start
+
+        chunked = f"{directory}/chunked"
+        start = time.perf_counter()
+        await transcode_chunked(
+            input_file=source,
+            prefix=chunked,
+            renditions=renditions,
+            has_audio=media_info.has_audio,
+            audio_group=[],
+            duration_in_sec=media_info.duration_in_sec,
+            on_progress=ignore_progress,
+            processes=args.processes,
+        )
+        chunked_sec = time.perf_counter() - start
+
+        results = {
+            "duration_sec": args.duration,
+            "resolution": f"{args.width}x{args.height}",
+            "renditions": [r.name for r in renditions],
+            "processes": args.processes,
+            "single_process_sec": single_sec,
+            "chunked_sec": chunked_sec,
+            "speedup": single_sec / chunked_sec,
+        }
+        print(json.dumps(results, indent=4))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
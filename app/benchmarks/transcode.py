@@ -0,0 +1,250 @@
+"""
+Runs generate_hls end-to-end on deterministic synthetic lavfi sources
+(testsrc2 video, sine audio) and reports, per case, the real-time factor,
+CPU seconds and peak RSS of the ffmpeg processes, and bytes written per
+rendition. Each case runs in its own process so resource usage is not
+mixed between cases. generate_hls records progress on a video, so a
+MongoDB instance is required (MONGO_URI, DATABSE_NAME).
+
+Usage:
+    python benchmarks/transcode.py --output results.json
+    python benchmarks/transcode.py --baseline results.json --output new.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for key, value in [
+    ("MONGO_URI", "mongodb://localhost:27017"),
+    ("DATABSE_SERVICE", "MONGO_DB"),
+    ("DATABSE_NAME", "them-tube-benchmark"),
+    ("ALLOWED_ORIGINS", "benchmark"),
+    ("SECRET_KEY", "benchmark"),
+    ("ALGORITHM", "benchmark"),
+    ("ACCESS_TOKEN_EXPIRE_DAYS", "1"),
+]:
+    # settings are required by core.config but unused here
+    os.environ.setdefault(key, value)
+
+from core.media_probe import run_command  # noqa: E402
+
+
+async def make_source(
+    path: str, duration: int, width: int, height: int, has_audio: bool
+):
+    """Generates a deterministic test video, with a sine wave track if has_audio"""
+    command = [
+        "ffmpeg",
+        "-y",
+        "-v",
+        "error",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc2=size={width}x{height}:rate=30:duration={duration}",
+    ]
+    if has_audio:
+        command += ["-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}"]
+    command += ["-c:v", "libx264", "-preset", "ultrafast", "-g", "60"]
+    if has_audio:
+        command += ["-c:a", "aac"]
+    command.append(path)
+
+    returncode, _, stderr = await run_command(command)
+    if returncode != 0:
+        raise RuntimeError(stderr.decode())
+
+
+def directory_size(path: str) -> int:
+    """Gets the total size of the files under a directory"""
+    return sum(
+        os.path.getsize(f"{root}/{name}")
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def bytes_per_rendition(prefix: str, names: List[str]) -> Dict[str, int]:
+    """
+    Gets the bytes written for each rendition. stream_N directories are
+    named after the N-th planned output, other directories keep their name
+    """
+    sizes = {}
+    for entry in sorted(os.listdir(prefix)):
+        path = f"{prefix}/{entry}"
+        if not os.path.isdir(path):
+            continue
+        name = entry
+        if entry.startswith("stream_") and entry[len("stream_") :].isdigit():
+            index = int(entry[len("stream_") :])
+            if index < len(names):
+                name = names[index]
+        sizes[name] = directory_size(path)
+
+    return sizes
+
+
+async def run_case(case: Dict) -> Dict:
+    """Transcodes one source with generate_hls and measures it"""
+    from core.config import settings
+    from core.media_probe import get_media_info, probe
+    from core.renditions import plan_audio, plan_renditions
+    from core.storage import storage
+    from core.video_processing import generate_hls
+    from schemas.video import VideoEncoding
+
+    media_info = get_media_info(await probe(case["source"]))
+    video_id = storage.video_create_record(
+        title="benchmark",
+        user_id="benchmark",
+        duration_in_sec=media_info.duration_in_sec,
+    )
+    prefix = f"{settings.VIDEO_DIRECTORY}/{video_id}"
+    os.makedirs(prefix, exist_ok=True)
+    input_file = f"{prefix}/{video_id}.mp4"
+    os.link(case["source"], input_file)
+
+    try:
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+        await generate_hls(
+            input_file=input_file,
+            prefix=prefix,
+            video_id=video_id,
+            media_info=media_info,
+            encoding=VideoEncoding(preset=case["preset"]),
+        )
+        elapsed = time.perf_counter() - start
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        audio_group = (
+            plan_audio(media_info) if settings.HLS_AUDIO_MODE == "GROUP" else []
+        )
+        names = [r.name for r in plan_renditions(media_info)] + [
+            f"audio_{bit_rate}k" for bit_rate in audio_group
+        ]
+        cpu_sec = (after.ru_utime - before.ru_utime) + (
+            after.ru_stime - before.ru_stime
+        )
+
+        return {
+            **{key: value for key, value in case.items() if key != "source"},
+            "wall_sec": elapsed,
+            "real_time_factor": elapsed / media_info.duration_in_sec,
+            "cpu_sec": cpu_sec,
+            # the largest ffmpeg process, in KiB on Linux
+            "peak_rss_mb": after.ru_maxrss / 1024,
+            "bytes_per_rendition": bytes_per_rendition(prefix, names),
+        }
+    finally:
+        storage.video_delete_record({"_id": video_id})
+
+
+def compare(results: List[Dict], baseline: List[Dict]):
+    """Prints the change in real-time factor and CPU time against a baseline"""
+
+    def key(result: Dict):
+        return (
+            result["resolution"],
+            result["duration_sec"],
+            result["audio"],
+            result["preset"],
+        )
+
+    previous = {key(r): r for r in baseline}
+
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        print(
+            f"{result['resolution']:>9} {result['duration_sec']:>4}s"
+            + f" audio={result['audio']!s:<5}"
+            + f" rtf {old['real_time_factor']:.3f} -> {result['real_time_factor']:.3f}"
+            + f" ({result['real_time_factor'] / old['real_time_factor'] - 1:+.1%})"
+            + f" cpu {old['cpu_sec']:.1f}s -> {result['cpu_sec']:.1f}s"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--resolutions", default="1920x1080,1280x720,640x360")
+    parser.add_argument("--durations", default="10,60")
+    parser.add_argument("--audio", choices=["both", "yes", "no"], default="both")
+    parser.add_argument("--preset", default="medium")
+    parser.add_argument("--output", default=None, help="write results to a file")
+    parser.add_argument("--baseline", default=None, help="results to compare with")
+    parser.add_argument("--case", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(await run_case(json.loads(args.case))))
+        return
+
+    directory = tempfile.mkdtemp(prefix="them-tube-bench-")
+    env = {**os.environ, "VIDEO_DIRECTORY": f"{directory}/videos"}
+    audio = {"both": [True, False], "yes": [True], "no": [False]}[args.audio]
+    results = []
+    try:
+        for resolution, duration, has_audio in itertools.product(
+            args.resolutions.split(","),
+            [int(d) for d in args.durations.split(",")],
+            audio,
+        ):
+            width, height = (int(n) for n in resolution.split("x"))
+            source = f"{directory}/{resolution}-{duration}-{has_audio}.mp4"
+            await make_source(source, duration, width, height, has_audio)
+
+            case = {
+                "resolution": resolution,
+                "duration_sec": duration,
+                "audio": has_audio,
+                "preset": args.preset,
+                "source": source,
+            }
+            # a fresh process, so RUSAGE_CHILDREN only covers this case
+            process = subprocess.run(
+                [sys.executable, __file__, "--case", json.dumps(case)],
+                env=env,
+                capture_output=True,
+                check=True,
+            )
+            result = json.loads(process.stdout.decode().strip().splitlines()[-1])
+            results.append(result)
+            print(
+                f"{resolution:>9} {duration:>4}s audio={has_audio!s:<5}"
+                + f" rtf={result['real_time_factor']:.3f}"
+                + f" cpu={result['cpu_sec']:.1f}s"
+                + f" rss={result['peak_rss_mb']:.0f}MB",
+                file=sys.stderr,
+            )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline, mode="r") as f:
+            compare(results, json.load(f)["results"])
+
+    report = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+    if args.output:
+        with open(args.output, mode="w") as f:
+            json.dump(report, f, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""
+Measures GET /videos latency while concurrent uploads are being probed.
+
+Usage:
+    python benchmarks/upload_latency.py --token <jwt> --file sample.mp4
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request
+
+
+def upload(base_url: str, token: str, file_path: str) -> float:
+    """Uploads a video and returns the time taken"""
+    boundary = uuid.uuid4().hex
+    with open(file_path, mode="rb") as f:
+        content = f.read()
+
+    body = (
+        (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="title"\r\n\r\n'
+            "benchmark\r\n"
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="video_file"; '
+            f'filename="{os.path.basename(file_path)}"\r\n'
+            "Content-Type: video/mp4\r\n\r\n"
+        ).encode()
+        + content
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+    req = request.Request(
+        f"{base_url}/api/v1/videos",
+        data=body,
+        method="POST",
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": f"multipart/form-data; boundary={boundary}",
+        },
+    )
+
+    start = time.perf_counter()
+    with request.urlopen(req) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def list_videos(base_url: str) -> float:
+    """Lists videos and returns the time taken"""
+    start = time.perf_counter()
+    with request.urlopen(f"{base_url}/api/v1/videos?limit=10") as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def percentile(samples: list, pct: float) -> float:
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--file", required=True)
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with ThreadPoolExecutor(max_workers=args.uploads + args.concurrency) as pool:
+        uploads = [
+            pool.submit(upload, args.base_url, args.token, args.file)
+            for _ in range(args.uploads)
+        ]
+        latencies = list(
+            pool.map(lambda _: list_videos(args.base_url), range(args.requests))
+        )
+        upload_times = [future.result() for future in uploads]
+
+    results = {
+        "uploads": args.uploads,
+        "requests": args.requests,
+        "upload_mean_sec": statistics.mean(upload_times),
+        "list_p50_ms": percentile(latencies, 50) * 1000,
+        "list_p99_ms": percentile(latencies, 99) * 1000,
+        "list_max_ms": max(latencies) * 1000,
+    }
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
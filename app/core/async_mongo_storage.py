@@ -0,0 +1,512 @@
+import os
+from datetime import UTC, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from bson.objectid import ObjectId
+from core.authentication.hashing import hash_bcrypt
+from core.config import settings
+from core.events import ORIGIN, broker
+from core.media_cache import media_cache
+from core.media_storage import media_storage
+from core.queries import media_available_filter
+from core.upload import upload_session_path
+from fastapi import status
+from fastapi.exceptions import HTTPException
+from pymongo import DESCENDING, AsyncMongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from schemas import event as s_event
+from schemas import job as s_job
+from schemas import media as s_media
+from schemas import upload as s_upload
+from schemas import user as s_user
+from schemas import video as s_video
+from starlette.concurrency import run_in_threadpool
+
+
+class AsyncMongoStorage:
+    """
+    Storage class for interfacing with mongo db from the event loop. It
+    only has the methods of MongoStorage that request handlers call;
+    indexes, jobs and recovery go through MongoStorage
+    """
+
+    def __init__(
+        self,
+        connection_url: str = settings.MONGO_URI,
+        db_name: str = settings.DATABSE_NAME,
+    ):
+        """Initializes an AsyncMongoStorage object"""
+
+        self.client = AsyncMongoClient(connection_url)
+        self.db = self.client[db_name]
+
+    # users
+    async def user_create_record(
+        self,
+        user_data: s_user.UserIn,
+        role: s_user.Role = "user",
+        sign_in_type: s_user.SignInType = "NORMAL",
+        verified: bool = False,
+    ) -> str:
+        """Creates a user record"""
+
+        users_table = self.db["users"]
+
+        if await users_table.find_one({"email": user_data.email}):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already taken",
+            )
+
+        if len(user_data.password) < 8:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid password length."
+                + " Password length must be at least 8 characters",
+            )
+
+        date = datetime.now(UTC)
+        user = user_data.model_dump()
+        user["password"] = await run_in_threadpool(hash_bcrypt, user_data.password)
+        user["role"] = role
+        user["sign_in_type"] = sign_in_type
+        user["verified"] = verified
+        user["status"] = s_user.UserStatus.ENABLED
+        user["date_created"] = date
+        user["date_modified"] = date
+
+        id = str((await users_table.insert_one(user)).inserted_id)
+
+        return id
+
+    async def user_get_record(self, filter: Dict) -> Optional[s_user.User]:
+        """Gets a user record from the db using the supplied filter"""
+        users = self.db["users"]
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        user = await users.find_one(filter)
+
+        if user:
+            user = s_user.User(**user)
+
+        return user
+
+    async def user_verify_record(self, filter: Dict) -> s_user.User:
+        """
+        Gets a user record using the filter
+        and raises an error if a matching record is not found
+        """
+
+        user = await self.user_get_record(filter)
+
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+            )
+
+        return user
+
+    async def user_update_record(self, filter: Dict, update: Dict):
+        """Updates a user record"""
+        await self.user_verify_record(filter)
+
+        for key in ["_id", "email"]:
+            if key in update:
+                raise KeyError(f"Invalid Key. KEY {key} cannot be changed")
+        update["date_modified"] = datetime.now(UTC)
+
+        return await self.db["users"].update_one(filter, {"$set": update})
+
+    # videos
+    async def video_create_record(
+        self,
+        title: str,
+        user_id: str,
+        duration_in_sec: float,
+        description: Optional[str] = None,
+        tags: List[str] = [],
+        available: bool = False,
+    ) -> str:
+        """Creates a video record"""
+
+        videos_table = self.db["videos"]
+
+        date = datetime.now(UTC)
+        video = {
+            "title": title,
+            "user_id": user_id,
+            "description": description,
+            "tags": tags,
+            "available": available,
+            "status": (
+                s_video.VideoStatus.AVAILABLE
+                if available
+                else s_video.VideoStatus.PROCESSING
+            ),
+            "renditions": [],
+            "duration_in_sec": duration_in_sec,
+        }
+
+        video["date_created"] = date
+        video["date_modified"] = date
+
+        id = str((await videos_table.insert_one(video)).inserted_id)
+
+        return id
+
+    async def video_get_record(self, filter: Dict) -> Optional[s_video.Video]:
+        """Gets a video record from the db using the supplied filter"""
+        videos = self.db["videos"]
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        video = await videos.find_one(filter)
+
+        if video:
+            video = s_video.Video(**video)
+
+        return video
+
+    async def video_get_all_records(
+        self,
+        filter: Dict,
+        limit: int = 0,
+        sort: Optional[List[Tuple[str, int]]] = None,
+    ) -> List[s_video.Video]:
+        """Gets all video records from the db using the supplied filter"""
+        videos = self.db["videos"]
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        videos_list = [
+            s_video.Video(**video)
+            async for video in videos.find(filter, sort=sort).limit(limit)
+        ]
+
+        return videos_list
+
+    async def video_verify_record(self, filter: Dict) -> s_video.Video:
+        """
+        Gets a video record using the filter
+        and raises an error if a matching record is not found
+        """
+
+        video = await self.video_get_record(filter)
+
+        if video is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Video not found"
+            )
+
+        return video
+
+    async def video_update_record(
+        self,
+        filter: Dict,
+        update: Dict,
+        event: s_event.EventType = s_event.EventType.UPDATED,
+    ):
+        """Updates a video record and publishes the change as an event"""
+        video = await self.video_verify_record(filter)
+
+        for key in ["_id", "user_id"]:
+            if key in update:
+                raise KeyError(f"Invalid Key. KEY {key} cannot be changed")
+        update["date_modified"] = datetime.now(UTC)
+
+        result = await self.db["videos"].update_one(filter, {"$set": update})
+        await self.video_publish_event(event, video, data=update)
+
+        return result
+
+    async def video_delete_record(self, filter: Dict):
+        """
+        Deletes a video record. Shared renditions are only
+        removed with the last video that references them
+        """
+        video = await self.video_verify_record(filter)
+
+        await self.db["videos"].delete_one(filter)
+        ids = [video.id]
+        if video.media_id is not None:
+            last = await self.media_release_reference(video.media_id)
+            if video.media_id == video.id and not last:
+                ids = []
+            elif video.media_id != video.id and last:
+                ids.append(video.media_id)
+
+        for id in ids:
+            await run_in_threadpool(media_storage.delete, id)
+            path = f"./{settings.VIDEO_DIRECTORY}/{id}"
+            media_cache.invalidate(os.path.realpath(path) + os.sep)
+
+        await self.video_publish_event(s_event.EventType.DELETED, video)
+
+    # video events
+    async def video_publish_event(
+        self, type: s_event.EventType, video: s_video.Video, data: Dict = {}
+    ):
+        """
+        Publishes a video event to subscribers in this process and, when
+        EVENTS_SOURCE is CHANGE_STREAM, to other processes via video_events
+        """
+        event = s_event.VideoEvent(
+            type=type,
+            video_id=video.id,
+            user_id=video.user_id,
+            data=data,
+            origin=ORIGIN,
+            date=datetime.now(UTC),
+        )
+        broker.publish(event)
+
+        if settings.EVENTS_SOURCE == "CHANGE_STREAM":
+            await self.db["video_events"].insert_one(event.model_dump())
+
+    # upload sessions
+    async def upload_session_create_record(
+        self,
+        session_data: s_upload.UploadSessionIn,
+        user_id: str,
+        chunk_size: int = settings.UPLOAD_SESSION_CHUNK_SIZE,
+    ) -> str:
+        """Creates a resumable upload session record"""
+
+        sessions_table = self.db["upload_sessions"]
+
+        date = datetime.now(UTC)
+        session = session_data.model_dump()
+        session["user_id"] = user_id
+        session["chunk_size"] = chunk_size
+        session["chunk_count"] = -(-session_data.size // chunk_size)
+        session["received_chunks"] = []
+        session["date_created"] = date
+        session["date_modified"] = date
+        session["expires_at"] = date + timedelta(
+            hours=settings.UPLOAD_SESSION_EXPIRE_HOURS
+        )
+
+        id = str((await sessions_table.insert_one(session)).inserted_id)
+
+        return id
+
+    async def upload_session_get_record(
+        self, filter: Dict
+    ) -> Optional[s_upload.UploadSession]:
+        """Gets an upload session record from the db using the supplied filter"""
+        sessions = self.db["upload_sessions"]
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        session = await sessions.find_one(filter)
+
+        if session:
+            session = s_upload.UploadSession(**session)
+
+        return session
+
+    async def upload_session_verify_record(
+        self, filter: Dict
+    ) -> s_upload.UploadSession:
+        """
+        Gets an upload session record using the filter
+        and raises an error if a matching, unexpired record is not found
+        """
+
+        session = await self.upload_session_get_record(filter)
+
+        if session is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload session not found",
+            )
+
+        if session.expires_at.replace(tzinfo=UTC) < datetime.now(UTC):
+            await self.upload_session_delete_record({"_id": session.id})
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE, detail="Upload session expired"
+            )
+
+        return session
+
+    async def upload_session_add_chunk(self, filter: Dict, index: int):
+        """Records a chunk as received in an upload session"""
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        return await self.db["upload_sessions"].update_one(
+            filter,
+            {
+                "$addToSet": {"received_chunks": index},
+                "$set": {"date_modified": datetime.now(UTC)},
+            },
+        )
+
+    async def upload_session_delete_record(
+        self, filter: Dict, remove_file: bool = True
+    ) -> s_upload.UploadSession:
+        """
+        Atomically deletes an upload session record so that only
+        one caller can finalize or abort a session
+        """
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        session = await self.db["upload_sessions"].find_one_and_delete(filter)
+
+        if session is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload session not found",
+            )
+
+        session = s_upload.UploadSession(**session)
+        path = upload_session_path(session.id)
+        if remove_file and os.path.exists(path):
+            os.remove(path)
+
+        return session
+
+    # media
+    async def media_create_record(
+        self, media_id: str, checksum: str, size: int
+    ) -> bool:
+        """
+        Creates a reference counted media record for a video's renditions.
+        Returns False if media with the same checksum already exists
+        """
+
+        date = datetime.now(UTC)
+        media = {
+            "_id": ObjectId(media_id),
+            "checksum": checksum,
+            "size": size,
+            "status": s_media.MediaStatus.PROCESSING,
+            "references": 1,
+            "renditions": [],
+        }
+
+        media["date_created"] = date
+        media["date_modified"] = date
+
+        try:
+            await self.db["media"].insert_one(media)
+        except DuplicateKeyError:
+            return False
+
+        return True
+
+    async def media_acquire_reference(self, checksum: str) -> Optional[s_media.Media]:
+        """
+        Atomically adds a reference to the transcoded media with a checksum
+        and returns it, or None if no such media is available
+        """
+
+        media = await self.db["media"].find_one_and_update(
+            media_available_filter(checksum),
+            {"$inc": {"references": 1}, "$set": {"date_modified": datetime.now(UTC)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+        if media:
+            media = s_media.Media(**media)
+
+        return media
+
+    async def media_release_reference(self, media_id: str) -> bool:
+        """
+        Removes a reference to media. Returns True if it was the last one,
+        in which case the media record is deleted and its files may go
+        """
+
+        media = await self.db["media"].find_one_and_update(
+            {"_id": ObjectId(media_id)},
+            {"$inc": {"references": -1}, "$set": {"date_modified": datetime.now(UTC)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+        if media is None:
+            # not tracked, so nothing else can reference it
+            return True
+
+        if media["references"] > 0:
+            return False
+
+        # a concurrent acquire may have revived it in the meantime
+        result = await self.db["media"].delete_one(
+            {"_id": media["_id"], "references": {"$lte": 0}}
+        )
+
+        return result.deleted_count == 1
+
+    # jobs
+    async def job_create_record(
+        self,
+        video_id: str,
+        priority: int = 0,
+        max_attempts: int = settings.JOB_MAX_ATTEMPTS,
+    ) -> str:
+        """Creates a queued transcoding job record"""
+
+        jobs_table = self.db["jobs"]
+
+        date = datetime.now(UTC)
+        job = {
+            "video_id": video_id,
+            "status": s_job.JobStatus.QUEUED,
+            "priority": priority,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "error": None,
+            "run_after": date,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "date_started": None,
+            "date_finished": None,
+        }
+
+        job["date_created"] = date
+        job["date_modified"] = date
+
+        id = str((await jobs_table.insert_one(job)).inserted_id)
+
+        return id
+
+    async def job_get_record(self, filter: Dict) -> Optional[s_job.Job]:
+        """
+        Gets the most recent job record from the db
+        using the supplied filter
+        """
+        jobs = self.db["jobs"]
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        job = await jobs.find_one(filter, sort=[("_id", DESCENDING)])
+
+        if job:
+            job = s_job.Job(**job)
+
+        return job
+
+    async def job_verify_record(self, filter: Dict) -> s_job.Job:
+        """
+        Gets a job record using the filter
+        and raises an error if a matching record is not found
+        """
+
+        job = await self.job_get_record(filter)
+
+        if job is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+            )
+
+        return job
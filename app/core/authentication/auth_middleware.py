@@ -2,11 +2,12 @@ from typing import List
 
 from core.authentication.auth_token import verify_access_token
 from core.authentication.hashing import hash_verify
-from core.storage import storage
+from core.storage import async_storage
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from schemas.token import TokenData
 from schemas.user import User, UserStatus
+from starlette.concurrency import run_in_threadpool
 
 credentials_exception: HTTPException = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
@@ -17,16 +18,18 @@ credentials_exception: HTTPException = HTTPException(
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/login")
 
 
-def authenticate_user(email: str, password: str) -> User:
-    user = storage.user_verify_record({"email": email})
+async def authenticate_user(email: str, password: str) -> User:
+    user = await async_storage.user_verify_record({"email": email})
 
-    if not hash_verify(hashed_password=user.password, plain_password=password):
+    if not await run_in_threadpool(
+        hash_verify, hashed_password=user.password, plain_password=password
+    ):
         raise credentials_exception
 
     return user
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     """
     Gets the current user.
 
@@ -44,7 +47,7 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
             detail="Invalid token type",
         )
 
-    user = storage.user_get_record({"email": tokenData.email})
+    user = await async_storage.user_get_record({"email": tokenData.email})
 
     if user is None:
         raise credentials_exception
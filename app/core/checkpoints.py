@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+from typing import Any, List
+
+CHECKPOINT_FILE = ".done"
+
+
+def checkpoint_plan(**plan: Any) -> str:
+    """Serializes what a unit of output was encoded with, to detect stale checkpoints"""
+    return json.dumps(plan, sort_keys=True, default=str)
+
+
+def is_checkpointed(directory: str, plan: str = "") -> bool:
+    """
+    Checks if a unit of transcoding output (a chunk or a rendition) was
+    completely written with the same plan by an earlier attempt
+    """
+    try:
+        with open(f"{directory}/{CHECKPOINT_FILE}", mode="r") as f:
+            return f.read() == plan
+    except FileNotFoundError:
+        return False
+
+
+def write_checkpoint(directory: str, plan: str = ""):
+    """Marks a unit of transcoding output as completely written"""
+    path = f"{directory}/{CHECKPOINT_FILE}"
+    with open(f"{path}.tmp", mode="w") as f:
+        f.write(plan)
+    os.replace(f"{path}.tmp", path)
+
+
+def remove_checkpoint(directory: str):
+    """Marks a unit of transcoding output as no longer reusable"""
+    path = f"{directory}/{CHECKPOINT_FILE}"
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def list_checkpoints(prefix: str) -> List[str]:
+    """Lists the checkpointed directories of a video directory"""
+    if not os.path.isdir(prefix):
+        return []
+
+    return [
+        name
+        for name in os.listdir(prefix)
+        if os.path.exists(f"{prefix}/{name}/{CHECKPOINT_FILE}")
+    ]
+
+
+def clean_partial_output(prefix: str, keep: List[str] = []):
+    """
+    Removes output left in a video directory by an interrupted transcode.
+    Entries named in keep and checkpointed directories are left in place
+    """
+    if not os.path.isdir(prefix):
+        return
+
+    for name in os.listdir(prefix):
+        path = f"{prefix}/{name}"
+        if name in keep:
+            continue
+        if os.path.isdir(path):
+            if not os.path.exists(f"{path}/{CHECKPOINT_FILE}"):
+                shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
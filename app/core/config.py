@@ -2,8 +2,10 @@ import logging
 import logging.config
 import os
 from logging.handlers import TimedRotatingFileHandler
+from typing import Dict, List, Optional, Tuple
 
 from pydantic_settings import BaseSettings
+from schemas.rendition import Rendition
 
 
 def configure_logging():
@@ -51,6 +53,8 @@ class Settings(BaseSettings):
     RELEASE_ID: str = "0.1"
     API_V1_STR: str = "/api/v1"
     MONGO_URI: str
+    # MONGO, or MONGO_SYNC to run request handlers' queries on the
+    # synchronous driver in the threadpool
     DATABSE_SERVICE: str
     DATABSE_NAME: str
     ALLOWED_ORIGINS: str
@@ -58,6 +62,122 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_DAYS: int
     VIDEO_DIRECTORY: str = "videos"
+    # playlists change while renditions are published, segments never do
+    PLAYLIST_MAX_AGE_SEC: int = 2
+    SEGMENT_MAX_AGE_SEC: int = 365 * 24 * 3600
+    # in-memory cache of hot HLS files in each API process. LRU or LFU
+    MEDIA_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    MEDIA_CACHE_MAX_ENTRY_BYTES: int = 4 * 1024 * 1024
+    MEDIA_CACHE_POLICY: str = "LRU"
+    MEDIA_CACHE_TTL_SEC: float = 300
+    # how long a request waits on another request's read of the same file
+    MEDIA_CACHE_LOAD_TIMEOUT_SEC: float = 10
+    # HMAC keys of signed stream URLs by key id. To rotate, add a key, make it
+    # current, then remove the old key after STREAM_TOKEN_TTL_SEC
+    STREAM_SIGNING_KEYS: Dict[str, str] = {}
+    STREAM_SIGNING_KEY_ID: str = ""
+    STREAM_TOKEN_TTL_SEC: int = 4 * 3600
+    # expiries are rounded down to this window so that viewers of a video
+    # share URLs, and CDNs can cache them
+    STREAM_TOKEN_WINDOW_SEC: int = 3600
+    STREAM_REQUIRE_TOKEN: bool = True
+    STREAM_BASE_URL: str = "http://localhost:8000/stream"
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    MAX_UPLOAD_SIZE: int = 4 * 1024 * 1024 * 1024
+    UPLOAD_DIRECTORY: str = "uploads"
+    UPLOAD_SESSION_CHUNK_SIZE: int = 8 * 1024 * 1024
+    UPLOAD_SESSION_EXPIRE_HOURS: int = 24
+    PROBE_TIMEOUT_SEC: float = 30
+    TRANSCODE_CONCURRENCY: int = 2
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SEC: float = 30
+    JOB_POLL_INTERVAL_SEC: float = 2
+    JOB_LEASE_SEC: float = 60
+    JOB_HEARTBEAT_SEC: float = 20
+    # LOCAL, GRIDFS or S3. LOCAL is a filesystem, which may be shared
+    MEDIA_STORAGE: str = "LOCAL"
+    MEDIA_STORAGE_WRITE_CONCURRENCY: int = 8
+    MEDIA_STORAGE_READ_CHUNK_SIZE: int = 1024 * 1024
+    S3_BUCKET: str = "them-tube"
+    # e.g. http://localhost:9000 for MinIO. AWS when unset
+    S3_ENDPOINT_URL: Optional[str] = None
+    S3_REGION: Optional[str] = None
+    S3_ACCESS_KEY_ID: Optional[str] = None
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    S3_MULTIPART_CHUNK_SIZE: int = 8 * 1024 * 1024
+    WORKER_SCRATCH_DIRECTORY: str = "scratch"
+    # videos still processing after this long without an active job are
+    # re-queued or removed by the startup reconciliation pass
+    RECOVERY_STALE_AFTER_SEC: float = 3600
+    RECOVERY_ON_STARTUP: bool = True
+    # x264 presets by load. A worker uses the first preset whose limit is
+    # above the number of runnable jobs, else X264_BUSY_PRESET
+    X264_PRESET_LADDER: List[Tuple[int, str]] = [
+        (1, "slow"),
+        (8, "medium"),
+        (32, "fast"),
+    ]
+    X264_BUSY_PRESET: str = "veryfast"
+    X264_DEFAULT_PRESET: str = "medium"
+    # long sources are encoded one preset faster, premium uploads one slower
+    LONG_VIDEO_SEC: float = 1800
+    SHORT_VIDEO_SEC: float = 300
+    JOB_PRIORITY_BY_TIER: Dict[str, int] = {"standard": 0, "premium": 10}
+    JOB_SHORT_VIDEO_PRIORITY: int = 5
+    PROGRESS_UPDATE_INTERVAL_SEC: float = 5
+    # LOCAL delivers video events to subscribers of the same process only.
+    # CHANGE_STREAM also writes them to video_events, where API processes
+    # read events of transcoding workers from the change stream, or poll
+    # when MongoDB is a standalone server without change streams
+    EVENTS_SOURCE: str = "CHANGE_STREAM"
+    EVENTS_POLL_INTERVAL_SEC: float = 1
+    # events are read again for this long, as ids from several processes
+    # are not inserted in order
+    EVENTS_POLL_LOOKBACK_SEC: float = 5
+    EVENTS_QUEUE_SIZE: int = 100
+    EVENTS_KEEPALIVE_SEC: float = 15
+    EVENTS_EXPIRE_SEC: int = 3600
+    # create missing indexes when the storage connects. Turn off to manage
+    # them with indexes.py
+    INDEXES_ON_STARTUP: bool = True
+    VIDEO_PAGE_SIZE: int = 20
+    VIDEO_PAGE_MAX_SIZE: int = 100
+    # bit rates are in kbps. height is the short side, so portrait videos work
+    RENDITION_LADDER: List[Rendition] = [
+        Rendition(name="1080p", height=1080, video_bit_rate=5000, audio_bit_rate=192),
+        Rendition(name="720p", height=720, video_bit_rate=2800, audio_bit_rate=128),
+        Rendition(name="480p", height=480, video_bit_rate=1400, audio_bit_rate=96),
+    ]
+    MAX_FPS: float = 60
+    # MUXED encodes audio into every video rendition. GROUP encodes it once per
+    # AUDIO_LADDER bit rate into an EXT-X-MEDIA group shared by all renditions
+    HLS_AUDIO_MODE: str = "MUXED"
+    AUDIO_LADDER: List[int] = [128]
+    HLS_SEGMENT_SEC: int = 10
+    # MPEGTS writes a file per segment. FMP4 writes one byte-range addressed
+    # fragmented MP4 per rendition
+    HLS_PACKAGING: str = "MPEGTS"
+    # a poster, seek thumbnails and sprite sheets are cut from the same decode
+    # as the renditions. The interval grows so at most THUMBNAIL_MAX_COUNT
+    # thumbnails are made
+    THUMBNAILS: bool = True
+    THUMBNAIL_INTERVAL_SEC: float = 10
+    THUMBNAIL_MAX_COUNT: int = 300
+    THUMBNAIL_WIDTH: int = 160
+    SPRITE_COLUMNS: int = 10
+    SPRITE_ROWS: int = 10
+    POSTER_WIDTH: int = 1280
+    POSTER_TIME_SEC: float = 5
+    # sources longer than PARALLEL_TRANSCODE_MIN_DURATION_SEC are cut at
+    # keyframes into ~PARALLEL_TRANSCODE_CHUNK_SEC chunks encoded concurrently
+    PARALLEL_TRANSCODE_PROCESSES: int = 1
+    PARALLEL_TRANSCODE_CHUNK_SEC: float = 120
+    PARALLEL_TRANSCODE_MIN_DURATION_SEC: float = 600
+    KEYFRAME_PROBE_TIMEOUT_SEC: float = 300
+    # encode each rendition separately, lowest first, and publish it as soon
+    # as it is done. Decodes the source once per rendition
+    PROGRESSIVE_PUBLISHING: bool = False
+    PROGRESSIVE_PUBLISHING_PROCESSES: int = 1
 
 
 settings = Settings()
@@ -0,0 +1,54 @@
+import shutil
+from logging import getLogger
+from typing import Optional
+
+from core.config import settings
+from core.storage import async_storage
+from schemas import video as s_video
+from schemas.event import EventType
+from starlette.concurrency import run_in_threadpool
+
+
+async def deduplicate_video(
+    video_id: str, user_id: str, checksum: str
+) -> Optional[s_video.Video]:
+    """
+    Points a newly uploaded video at the renditions of an identical source
+    that was already transcoded, instead of transcoding it again. Returns
+    None if no identical source is available
+    """
+    logger = getLogger(__name__ + ".deduplicate_video")
+
+    media = await async_storage.media_acquire_reference(checksum)
+    if media is None:
+        return None
+
+    try:
+        update = {
+            "available": True,
+            "status": s_video.VideoStatus.AVAILABLE,
+            "renditions": media.renditions,
+            "duration_in_sec": media.duration_in_sec,
+            "media_info": media.media_info and media.media_info.model_dump(),
+            "thumbnails": media.thumbnails and media.thumbnails.model_dump(),
+            "media_id": media.id,
+            "checksum": checksum,
+        }
+        await async_storage.video_update_record(
+            {"_id": video_id, "user_id": user_id},
+            update=update,
+            event=EventType.AVAILABLE,
+        )
+    except BaseException:
+        await async_storage.media_release_reference(media.id)
+        raise
+
+    # the uploaded copy of the source is no longer needed
+    await run_in_threadpool(
+        shutil.rmtree, f"{settings.VIDEO_DIRECTORY}/{video_id}", ignore_errors=True
+    )
+    logger.info(f"Video ({video_id}) deduplicated to media ({media.id})")
+
+    return await async_storage.video_verify_record(
+        {"_id": video_id, "user_id": user_id}
+    )
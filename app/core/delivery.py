@@ -0,0 +1,143 @@
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from core.config import settings
+from fastapi import HTTPException, status
+
+MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".mp4": "video/mp4",
+    ".m4s": "video/iso.segment",
+    ".jpg": "image/jpeg",
+    ".vtt": "text/vtt",
+}
+
+
+def resolve_media_path(path: str, directory: str = settings.VIDEO_DIRECTORY) -> str:
+    """
+    Resolves a /stream path to a file under the video directory. Paths
+    outside it, files that are not HLS media and uploaded sources are
+    not found
+    """
+    root = os.path.realpath(directory)
+    full_path = os.path.realpath(os.path.join(root, path))
+    not_found = HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
+    )
+
+    if os.path.commonpath([root, full_path]) != root:
+        raise not_found
+    if os.path.splitext(full_path)[1] not in MEDIA_TYPES:
+        raise not_found
+
+    parts = os.path.relpath(full_path, root).split(os.sep)
+    if len(parts) == 2 and parts[1] == f"{parts[0]}.mp4":
+        # the uploaded source sits next to its renditions
+        raise not_found
+
+    return full_path
+
+
+def media_key(full_path: str, directory: str = settings.VIDEO_DIRECTORY) -> str:
+    """Gets the media storage key of a resolved media path"""
+    return os.path.relpath(full_path, os.path.realpath(directory)).replace(os.sep, "/")
+
+
+def media_prefix(full_path: str, directory: str = settings.VIDEO_DIRECTORY) -> str:
+    """Gets the video directory a resolved media path is in"""
+    return media_key(full_path, directory).split("/")[0]
+
+
+def media_type(path: str) -> str:
+    """Gets the MIME type of an HLS file"""
+    return MEDIA_TYPES.get(os.path.splitext(path)[1], "application/octet-stream")
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    """
+    Gets a strong ETag for a file. Files are replaced atomically, never
+    rewritten in place, so a new inode or mtime means new content
+    """
+    return (
+        f'"{stat_result.st_ino:x}-{stat_result.st_size:x}'
+        + f'-{stat_result.st_mtime_ns:x}"'
+    )
+
+
+def cache_control(path: str) -> str:
+    """
+    Gets the Cache-Control policy of an HLS file. Playlists are rewritten
+    as renditions are published, everything else never changes once written
+    """
+    if path.endswith(".m3u8"):
+        return f"public, max-age={settings.PLAYLIST_MAX_AGE_SEC}"
+
+    return f"public, max-age={settings.SEGMENT_MAX_AGE_SEC}, immutable"
+
+
+def signed_cache_control(path: str, expires: int) -> str:
+    """
+    Gets the Cache-Control policy of an HLS file served under a stream
+    token that expires at expires (unix seconds). Caches keep it no longer
+    than the token is valid, as they serve it without checking the token
+    """
+    max_age = (
+        settings.PLAYLIST_MAX_AGE_SEC
+        if path.endswith(".m3u8")
+        else settings.SEGMENT_MAX_AGE_SEC
+    )
+    max_age = min(max_age, max(0, expires - int(time.time())))
+
+    return f"public, max-age={max_age}"
+
+
+def delivery_headers(path: str, etag: str) -> Dict[str, str]:
+    """Gets the caching headers of an HLS file"""
+    return {"etag": etag, "cache-control": cache_control(path)}
+
+
+def is_not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    """Checks an If-None-Match header against a file's ETag"""
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in tags
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a Range header into an inclusive (start, end) byte range. None
+    means the whole file is served, which is also the answer to multiple
+    ranges. Raises 416 if the range is outside the file
+    """
+    if range_header is None:
+        return None
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+
+    first, _, last = ranges.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # a suffix range, the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"content-range": f"bytes */{size}"},
+        )
+
+    return start, min(end, size - 1)
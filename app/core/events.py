@@ -0,0 +1,193 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from datetime import UTC, datetime, timedelta
+from logging import getLogger
+from typing import AsyncIterator, Dict, List, Set
+
+from bson.objectid import ObjectId
+from core.config import settings
+from fastapi import Request
+from pymongo.errors import OperationFailure
+from schemas.event import VideoEvent
+
+# error code of $changeStream on a standalone server
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+# identifies events published by this process so relayed copies are skipped
+ORIGIN = f"{socket.gethostname()}-{os.getpid()}"
+
+
+def video_topic(video_id: str) -> str:
+    return f"video:{video_id}"
+
+
+def user_topic(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+class Subscription:
+    """A subscriber's queue of events, bound to the event loop that reads it"""
+
+    def __init__(self, topics: List[str], maxsize: int = settings.EVENTS_QUEUE_SIZE):
+        """Initializes a Subscription object"""
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.loop = asyncio.get_running_loop()
+
+    def put(self, event: VideoEvent):
+        """Queues an event. Safe to call from any thread"""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: VideoEvent):
+        # slow consumers lose their oldest events instead of growing memory
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class EventBroker:
+    """In-process pub/sub that fans video events out to subscribers"""
+
+    def __init__(self):
+        """Initializes an EventBroker object"""
+        self.subscriptions: Dict[str, Set[Subscription]] = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, topics: List[str]) -> Subscription:
+        """Subscribes to events on the given topics"""
+        subscription = Subscription(topics)
+        with self.lock:
+            for topic in topics:
+                self.subscriptions[topic].add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Removes a subscription from all its topics"""
+        with self.lock:
+            for topic in subscription.topics:
+                subscribers = self.subscriptions.get(topic)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscriptions[topic]
+
+    def publish(self, event: VideoEvent):
+        """Delivers an event to subscribers. Safe to call from any thread"""
+        with self.lock:
+            subscribers = set()
+            for topic in (video_topic(event.video_id), user_topic(event.user_id)):
+                subscribers.update(self.subscriptions.get(topic, ()))
+
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+broker = EventBroker()
+
+
+def format_sse(event: VideoEvent) -> str:
+    """Formats an event as a Server-Sent Events message"""
+    return f"event: {event.type.value}\ndata: {event.model_dump_json()}\n\n"
+
+
+async def stream_events(
+    request: Request, topics: List[str], initial: List[VideoEvent] = []
+) -> AsyncIterator[str]:
+    """
+    Yields Server-Sent Events for the given topics until the client
+    disconnects, with a comment line as keep-alive when idle
+    """
+    subscription = broker.subscribe(topics)
+    try:
+        for event in initial:
+            yield format_sse(event)
+
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(), timeout=settings.EVENTS_KEEPALIVE_SEC
+                )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            yield format_sse(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def poll_video_events(storage):
+    """
+    Publishes events written by other processes to local subscribers by
+    polling video_events, for servers without change streams. Events of
+    the last EVENTS_POLL_LOOKBACK_SEC are read again on every poll, and
+    skipped if already seen. Blocks forever
+    """
+    logger = getLogger(__name__ + ".poll_video_events")
+    lookback = timedelta(seconds=settings.EVENTS_POLL_LOOKBACK_SEC)
+    seen: Set[str] = set()
+    since = datetime.now(UTC)
+
+    while True:
+        try:
+            now = datetime.now(UTC)
+            for id, event in storage.video_event_get_records_since(since - lookback):
+                if id in seen:
+                    continue
+                seen.add(id)
+                if event.origin != ORIGIN:
+                    broker.publish(event)
+
+            since = now
+            seen = {
+                id for id in seen if ObjectId(id).generation_time >= since - lookback
+            }
+        except Exception as ex:
+            logger.error(f"Video events poll failed: {ex}")
+
+        time.sleep(settings.EVENTS_POLL_INTERVAL_SEC)
+
+
+def relay_change_stream(storage):
+    """
+    Publishes events written by other processes (e.g. transcoding workers)
+    to local subscribers by watching the video_events change stream, or by
+    polling video_events if the server has no change streams. Blocks
+    forever, so run it in a dedicated thread
+    """
+    logger = getLogger(__name__ + ".relay_change_stream")
+
+    while True:
+        try:
+            with storage.video_event_watch() as stream:
+                logger.info("Relaying video events from change stream")
+                for change in stream:
+                    event = VideoEvent(**change["fullDocument"])
+                    if event.origin != ORIGIN:
+                        broker.publish(event)
+        except OperationFailure as ex:
+            if ex.code != CHANGE_STREAMS_UNSUPPORTED:
+                logger.error(f"Change stream relay failed: {ex}. Retrying")
+                time.sleep(5)
+                continue
+            logger.info("Change streams not supported. Polling video events")
+            poll_video_events(storage)
+        except Exception as ex:
+            logger.error(f"Change stream relay failed: {ex}. Retrying")
+            time.sleep(5)
+
+
+def start_change_stream_relay(storage) -> threading.Thread:
+    """Starts relay_change_stream in a daemon thread"""
+    thread = threading.Thread(
+        target=relay_change_stream, args=(storage,), name="events-relay", daemon=True
+    )
+    thread.start()
+
+    return thread
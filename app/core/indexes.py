@@ -0,0 +1,221 @@
+from logging import getLogger
+from typing import Any, Dict, List, Tuple
+
+from bson.objectid import ObjectId
+from core.config import settings
+from core.queries import (
+    JOB_CLAIM_SORT,
+    VIDEO_SORTS,
+    job_claim_filter,
+    job_expired_filter,
+    job_runnable_filter,
+    media_available_filter,
+    upload_session_expired_filter,
+    video_after_filter,
+    video_event_since_filter,
+    video_stale_filter,
+)
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
+from schemas.video import VideoOrder
+
+# every index of the database by collection. Indexes are created by name,
+# so changing the options of an existing index needs a new name
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "videos": [
+        # listings end their sort on _id, see core.queries.VIDEO_SORTS
+        IndexModel([("available", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel(
+            [
+                ("available", ASCENDING),
+                ("date_created", DESCENDING),
+                ("_id", DESCENDING),
+            ]
+        ),
+        # a user's videos, and updates and deletes filtered on the owner
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel(
+            [("user_id", ASCENDING), ("date_created", DESCENDING), ("_id", DESCENDING)]
+        ),
+        IndexModel([("tags", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel(
+            [("tags", ASCENDING), ("date_created", DESCENDING), ("_id", DESCENDING)]
+        ),
+        IndexModel([("date_created", DESCENDING), ("_id", DESCENDING)]),
+        # videos left processing, found by the recovery pass
+        IndexModel([("status", ASCENDING), ("date_modified", ASCENDING)]),
+    ],
+    "jobs": [
+        IndexModel(
+            [
+                ("status", ASCENDING),
+                ("priority", DESCENDING),
+                ("run_after", ASCENDING),
+            ]
+        ),
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+        IndexModel([("video_id", ASCENDING)]),
+    ],
+    "media": [
+        IndexModel([("checksum", ASCENDING)], unique=True),
+    ],
+    "upload_sessions": [
+        IndexModel([("expires_at", ASCENDING)]),
+    ],
+    "video_events": [
+        IndexModel(
+            [("date", ASCENDING)], expireAfterSeconds=settings.EVENTS_EXPIRE_SEC
+        ),
+    ],
+}
+
+
+def apply_indexes(db: Database) -> List[str]:
+    """
+    Creates the registered indexes that do not exist yet. Existing indexes
+    are left as they are, so this is safe to run on every startup. Returns
+    the indexes that could not be created, e.g. because an index of the
+    same name exists with other options
+    """
+    logger = getLogger(__name__ + ".apply_indexes")
+
+    failed = []
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                db[collection].create_indexes([index])
+            except OperationFailure as ex:
+                name = f"{collection}.{index.document['name']}"
+                logger.error(f"Unable to create index {name}: {ex}")
+                failed.append(name)
+
+    return failed
+
+
+def hot_queries(date: Any = None) -> List[Tuple[str, Dict]]:
+    """
+    Gets the commands behind the storage's frequent queries, with example
+    values, by name. Each must be answered from an index
+    """
+    id = ObjectId()
+    date = date or id.generation_time
+    by_id = {"sort": dict(VIDEO_SORTS[VideoOrder.ID]), "limit": 21}
+    after_id = video_after_filter(VideoOrder.ID, id)
+    newest = {"sort": dict(VIDEO_SORTS[VideoOrder.NEWEST]), "limit": 21}
+    newest_after = video_after_filter(VideoOrder.NEWEST, id, date)
+
+    return [
+        ("users.by_email", {"find": "users", "filter": {"email": "a@b.c"}}),
+        ("videos.by_id", {"find": "videos", "filter": {"_id": id}}),
+        (
+            "videos.by_id_and_user",
+            {"find": "videos", "filter": {"_id": id, "user_id": str(id)}},
+        ),
+        (
+            "videos.available",
+            {"find": "videos", "filter": {"available": True, **after_id}, **by_id},
+        ),
+        (
+            "videos.available_newest",
+            {
+                "find": "videos",
+                "filter": {"available": True, **newest_after},
+                **newest,
+            },
+        ),
+        ("videos.newest", {"find": "videos", "filter": newest_after, **newest}),
+        (
+            "videos.by_user",
+            {"find": "videos", "filter": {"user_id": str(id), **after_id}, **by_id},
+        ),
+        (
+            "videos.by_user_newest",
+            {
+                "find": "videos",
+                "filter": {"user_id": str(id), **newest_after},
+                **newest,
+            },
+        ),
+        (
+            "videos.by_tag_newest",
+            {
+                "find": "videos",
+                "filter": {"tags": "music", "available": True, **newest_after},
+                **newest,
+            },
+        ),
+        ("videos.stale", {"find": "videos", "filter": video_stale_filter(date)}),
+        (
+            "video_events.since",
+            {
+                "find": "video_events",
+                "filter": video_event_since_filter(date),
+                "sort": {"_id": 1},
+            },
+        ),
+        (
+            "jobs.claim",
+            {
+                "findAndModify": "jobs",
+                "query": job_claim_filter(date),
+                "sort": dict(JOB_CLAIM_SORT),
+                "update": {"$inc": {"attempts": 1}},
+            },
+        ),
+        ("jobs.expired", {"find": "jobs", "filter": job_expired_filter(date)}),
+        ("jobs.runnable_count", {"count": "jobs", "query": job_runnable_filter(date)}),
+        (
+            "jobs.by_video",
+            {
+                "find": "jobs",
+                "filter": {"video_id": str(id)},
+                "sort": {"_id": -1},
+                "limit": 1,
+            },
+        ),
+        (
+            "media.by_checksum",
+            {"find": "media", "filter": media_available_filter("0" * 64)},
+        ),
+        (
+            "upload_sessions.expired",
+            {"find": "upload_sessions", "filter": upload_session_expired_filter(date)},
+        ),
+    ]
+
+
+def plan_stages(plan: Any) -> List[str]:
+    """Gets the stages of a query plan, whichever engine produced it"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages += plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages += plan_stages(value)
+
+    return stages
+
+
+def find_collection_scans(db: Database) -> List[str]:
+    """
+    Explains each hot query against the database and returns the names
+    of those whose winning plan scans the whole collection
+    """
+    logger = getLogger(__name__ + ".find_collection_scans")
+
+    scans = []
+    for name, command in hot_queries():
+        explanation = db.command("explain", command, verbosity="queryPlanner")
+        stages = plan_stages(explanation["queryPlanner"]["winningPlan"])
+        logger.info(f"{name}: {' <- '.join(stages)}")
+        if "COLLSCAN" in stages:
+            scans.append(name)
+
+    return scans
@@ -0,0 +1,242 @@
+import asyncio
+import os
+import shutil
+import socket
+import time
+from datetime import UTC, datetime, timedelta
+from logging import getLogger
+from typing import Optional
+
+from core.config import settings
+from core.media_storage import media_storage
+from core.recovery import reconcile, remove_stale_scratch
+from core.scheduling import choose_preset, get_uploader_tier
+from core.storage import storage
+from core.video_processing import generate_hls
+from schemas.job import Job, JobStatus
+from schemas.video import MediaInfo, VideoEncoding
+from starlette.concurrency import run_in_threadpool
+
+
+def default_worker_id() -> str:
+    """Gets an identifier for this worker process that is unique in the fleet"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Gets the exponential backoff delay before a failed job is retried"""
+    return timedelta(seconds=settings.JOB_RETRY_BACKOFF_SEC * 2 ** (attempts - 1))
+
+
+async def transcode(
+    video_id: str,
+    media_info: Optional[MediaInfo] = None,
+    encoding: Optional[VideoEncoding] = None,
+):
+    """
+    Converts a video to HLS. If the media storage is not reachable on this
+    host, the source is fetched into a scratch directory and the renditions
+    are uploaded back by generate_hls
+    """
+    prefix = media_storage.local_directory(video_id)
+    if prefix is not None:
+        await generate_hls(
+            input_file=f"{prefix}/{video_id}.mp4",
+            prefix=prefix,
+            video_id=video_id,
+            media_info=media_info,
+            encoding=encoding,
+        )
+        return
+
+    prefix = f"{settings.WORKER_SCRATCH_DIRECTORY}/{video_id}"
+    input_file = f"{prefix}/{video_id}.mp4"
+    try:
+        await run_in_threadpool(media_storage.fetch_source, video_id, input_file)
+        await generate_hls(
+            input_file=input_file,
+            prefix=prefix,
+            video_id=video_id,
+            media_info=media_info,
+            encoding=encoding,
+        )
+    finally:
+        await run_in_threadpool(shutil.rmtree, prefix, ignore_errors=True)
+
+
+async def run_job(job: Job, worker_id: str):
+    """Runs a leased transcoding job and records its outcome"""
+    logger = getLogger(__name__ + ".run_job")
+    lease_filter = {"_id": job.id, "lease_owner": worker_id}
+
+    video = await run_in_threadpool(storage.video_get_record, {"_id": job.video_id})
+    if video is None:
+        logger.warning(f"Job ({job.id}) dropped. Video ({job.video_id}) not found")
+        await run_in_threadpool(
+            storage.job_update_record,
+            lease_filter,
+            {
+                "status": JobStatus.FAILED,
+                "error": "Video not found",
+                "date_finished": datetime.now(UTC),
+            },
+        )
+        return
+
+    try:
+        duration_in_sec = (
+            video.media_info.duration_in_sec
+            if video.media_info
+            else video.duration_in_sec
+        )
+        queue_depth = await run_in_threadpool(storage.job_count_runnable_records)
+        tier = await run_in_threadpool(get_uploader_tier, video.user_id)
+        encoding = VideoEncoding(
+            preset=choose_preset(queue_depth, duration_in_sec, tier),
+            priority=job.priority,
+            queue_depth=queue_depth,
+        )
+        logger.info(
+            f"Job ({job.id}) encoding with preset {encoding.preset}"
+            + f" at queue depth {queue_depth}"
+        )
+
+        await transcode(job.video_id, media_info=video.media_info, encoding=encoding)
+    except Exception as ex:
+        date = datetime.now(UTC)
+        if job.attempts < job.max_attempts:
+            delay = retry_delay(job.attempts)
+            logger.warning(
+                f"Job ({job.id}) attempt {job.attempts} failed."
+                + f" Retrying in {delay.total_seconds():.0f}s"
+            )
+            update = {
+                "status": JobStatus.QUEUED,
+                "error": str(ex),
+                "run_after": date + delay,
+            }
+        else:
+            logger.error(f"Job ({job.id}) failed after {job.attempts} attempts")
+            update = {
+                "status": JobStatus.FAILED,
+                "error": str(ex),
+                "date_finished": date,
+            }
+            await run_in_threadpool(storage.video_delete_record, {"_id": job.video_id})
+    else:
+        logger.info(f"Job ({job.id}) done")
+        update = {
+            "status": JobStatus.DONE,
+            "error": None,
+            "date_finished": datetime.now(UTC),
+        }
+
+    update["lease_owner"] = None
+    update["lease_expires_at"] = None
+    await run_in_threadpool(storage.job_update_record, lease_filter, update)
+
+
+def fail_expired_jobs() -> int:
+    """
+    Fails the jobs whose worker died during their last attempt and deletes
+    their videos, as run_job does when a last attempt fails
+    """
+    logger = getLogger(__name__ + ".fail_expired_jobs")
+
+    jobs = storage.job_fail_expired_records()
+    for job in jobs:
+        logger.error(
+            f"Job ({job.id}) failed after {job.attempts} attempts. Lease expired"
+        )
+        if storage.video_get_record({"_id": job.video_id}) is not None:
+            storage.video_delete_record({"_id": job.video_id})
+
+    return len(jobs)
+
+
+async def keep_lease(job: Job, worker_id: str, task: asyncio.Task):
+    """
+    Renews a job's lease every JOB_HEARTBEAT_SEC and cancels
+    the job's task if the lease is lost to another worker
+    """
+    logger = getLogger(__name__ + ".keep_lease")
+
+    while not task.done():
+        await asyncio.sleep(settings.JOB_HEARTBEAT_SEC)
+        try:
+            renewed = await run_in_threadpool(
+                storage.job_renew_lease, job.id, worker_id
+            )
+        except Exception as ex:
+            # the lease is still valid until it expires, so try again next beat
+            logger.error(ex, stack_info=True)
+            continue
+
+        if not renewed:
+            logger.warning(f"Lease on job ({job.id}) lost. Cancelling")
+            task.cancel()
+            return
+
+
+async def run_worker(
+    concurrency: int = settings.TRANSCODE_CONCURRENCY,
+    worker_id: Optional[str] = None,
+):
+    """
+    Claims transcoding jobs on a lease and runs them,
+    with at most `concurrency` ffmpeg processes at a time
+    """
+    logger = getLogger(__name__ + ".run_worker")
+    worker_id = worker_id or default_worker_id()
+    logger.info(
+        f"Transcoding worker ({worker_id}) started with concurrency {concurrency}"
+    )
+
+    if settings.RECOVERY_ON_STARTUP:
+        await run_in_threadpool(reconcile)
+        try:
+            await run_in_threadpool(remove_stale_scratch)
+        except Exception as ex:
+            logger.error(ex, stack_info=True)
+
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def run(job: Job):
+        task = asyncio.create_task(run_job(job, worker_id))
+        heartbeat = asyncio.create_task(keep_lease(job, worker_id, task))
+        try:
+            await task
+        except asyncio.CancelledError:
+            logger.warning(f"Job ({job.id}) cancelled")
+        except Exception as ex:
+            logger.error(ex, stack_info=True)
+        finally:
+            heartbeat.cancel()
+            slots.release()
+
+    next_sweep = 0.0
+    while True:
+        if time.monotonic() >= next_sweep:
+            next_sweep = time.monotonic() + settings.JOB_LEASE_SEC
+            try:
+                await run_in_threadpool(fail_expired_jobs)
+            except Exception as ex:
+                logger.error(ex, stack_info=True)
+
+        await slots.acquire()
+        try:
+            job = await run_in_threadpool(storage.job_claim_record, worker_id)
+        except Exception as ex:
+            logger.error(ex, stack_info=True)
+            job = None
+
+        if job is None:
+            slots.release()
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL_SEC)
+            continue
+
+        logger.info(f"Job ({job.id}) claimed for video ({job.video_id})")
+        task = asyncio.create_task(run(job))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
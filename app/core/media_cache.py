@@ -0,0 +1,236 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Optional
+
+from core.config import settings
+from schemas.health import CacheStats
+from starlette.concurrency import run_in_threadpool
+
+
+class CachedFile:
+    """The content and response headers of a cached HLS file"""
+
+    __slots__ = ("content", "headers", "media_type", "expires_at", "frequency")
+
+    def __init__(
+        self, content: bytes, headers: Dict[str, str], media_type: str, ttl: float
+    ):
+        """Initializes a CachedFile object"""
+        self.content = content
+        self.headers = headers
+        self.media_type = media_type
+        self.expires_at = time.monotonic() + ttl
+        self.frequency = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one. The first caller
+    starts fn in the threadpool, and every caller, including the first,
+    awaits that call's result or exception. Waiting holds no thread, so any
+    number of requests can wait on one slow read. Must be used from the
+    event loop
+    """
+
+    def __init__(self):
+        """Initializes a SingleFlight object"""
+        self.flights: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def do(
+        self, key: str, fn: Callable[..., Any], *args, timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Calls fn(*args) in the threadpool, or waits up to timeout seconds for
+        the call already in progress for key. Raises TimeoutError if the wait
+        runs out. A caller that is cancelled does not cancel the call
+        """
+        flight = self.flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(run_in_threadpool(fn, *args))
+            self.flights[key] = flight
+            flight.add_done_callback(lambda _: self._land(key, flight))
+            return await asyncio.shield(flight)
+
+        self.coalesced += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Timed out waiting for {key}")
+
+    def _land(self, key: str, flight: asyncio.Future):
+        if self.flights.get(key) is flight:
+            del self.flights[key]
+        if not flight.cancelled():
+            # retrieved so that an error nobody waited for is not logged
+            flight.exception()
+
+
+class MediaCache:
+    """
+    In-memory cache of small HLS files (playlists, segments, thumbnails)
+    bounded by a byte budget. Files larger than max_entry_bytes are not
+    admitted so that one large file cannot flush the hot set. Entries are
+    evicted least recently used (LRU) or least frequently used (LFU) first
+    and expire after their ttl, which bounds how long a file deleted by
+    another process can still be served. Safe to use from any thread,
+    except load which must be awaited on the event loop
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = settings.MEDIA_CACHE_MAX_BYTES,
+        max_entry_bytes: int = settings.MEDIA_CACHE_MAX_ENTRY_BYTES,
+        policy: str = settings.MEDIA_CACHE_POLICY,
+    ):
+        """Initializes a MediaCache object"""
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.policy = policy
+        self.entries: OrderedDict[str, CachedFile] = OrderedDict()
+        # LFU only. Keys by access frequency, least recently used first
+        self.frequencies: Dict[int, OrderedDict[str, None]] = defaultdict(OrderedDict)
+        self.size = 0
+        self.lock = threading.Lock()
+        self.flights = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def admits(self, size: int) -> bool:
+        """
+        Checks if a file of the given size may be cached,
+        counting the files that may not
+        """
+        admitted = self.max_bytes > 0 and size <= self.max_entry_bytes
+        if not admitted:
+            with self.lock:
+                self.rejections += 1
+
+        return admitted
+
+    def get(self, key: str) -> Optional[CachedFile]:
+        """Gets a cached file, or None if it is not cached or has expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touch(key, entry)
+
+            return entry
+
+    async def load(
+        self,
+        key: str,
+        read: Callable[[str], Optional[CachedFile]],
+        timeout: float = settings.MEDIA_CACHE_LOAD_TIMEOUT_SEC,
+    ) -> Optional[CachedFile]:
+        """
+        Gets a cached file, reading it with read(key) on a miss. Concurrent
+        misses for the same key share a single read, so a segment that every
+        player requests at once is only read from storage once. Errors of the
+        read are raised to every waiting request. Returns None if the file
+        is too large to cache. Only the read runs in the threadpool, so
+        waiting requests hold no thread
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        return await self.flights.do(key, self._read, key, read, timeout=timeout)
+
+    def _read(
+        self, key: str, read: Callable[[str], Optional[CachedFile]]
+    ) -> Optional[CachedFile]:
+        entry = read(key)
+        if entry is not None:
+            self.put(key, entry)
+
+        return entry
+
+    def put(self, key: str, entry: CachedFile) -> bool:
+        """Caches a file, evicting others to stay within the byte budget"""
+        size = len(entry.content)
+        if not self.admits(size):
+            return False
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            while self.entries and self.size + size > self.max_bytes:
+                self._evict()
+
+            self.entries[key] = entry
+            self.size += size
+            self._touch(key, entry)
+
+            return True
+
+    def invalidate(self, prefix: str) -> int:
+        """Removes every cached file whose key starts with prefix"""
+        with self.lock:
+            keys = [key for key in self.entries if key.startswith(prefix)]
+            for key in keys:
+                self._remove(key)
+
+            return len(keys)
+
+    def stats(self) -> CacheStats:
+        """Gets the cache's counters"""
+        with self.lock:
+            requests = self.hits + self.misses
+            return CacheStats(
+                policy=self.policy,
+                entries=len(self.entries),
+                size=self.size,
+                max_size=self.max_bytes,
+                hits=self.hits,
+                misses=self.misses,
+                hit_ratio=self.hits / requests if requests else 0,
+                evictions=self.evictions,
+                rejections=self.rejections,
+                coalesced=self.flights.coalesced,
+            )
+
+    def _touch(self, key: str, entry: CachedFile):
+        if self.policy == "LFU":
+            if entry.frequency:
+                self._forget_frequency(key, entry)
+            entry.frequency += 1
+            self.frequencies[entry.frequency][key] = None
+        else:
+            self.entries.move_to_end(key)
+
+    def _forget_frequency(self, key: str, entry: CachedFile):
+        keys = self.frequencies[entry.frequency]
+        del keys[key]
+        if not keys:
+            del self.frequencies[entry.frequency]
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key)
+        self.size -= len(entry.content)
+        if self.policy == "LFU":
+            self._forget_frequency(key, entry)
+
+    def _evict(self):
+        if self.policy == "LFU":
+            key = next(iter(self.frequencies[min(self.frequencies)]))
+        else:
+            key = next(iter(self.entries))
+        self._remove(key)
+        self.evictions += 1
+
+
+media_cache = MediaCache()
@@ -0,0 +1,193 @@
+import asyncio
+import json
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.config import settings
+from fastapi import HTTPException, status
+from schemas.video import MediaInfo
+
+
+async def run_command(
+    command: List[str], timeout: Optional[float] = None, capture_output: bool = True
+) -> Tuple[int, bytes, bytes]:
+    """
+    Runs a command as an asyncio subprocess without blocking the event loop.
+    The process is killed if the timeout expires or the caller is cancelled
+
+    Args:
+        command: the command and its arguments
+        timeout: seconds to wait before killing the process
+        capture_output: whether stdout and stderr are captured
+
+    Returns:
+        the return code, stdout and stderr of the process
+    """
+    pipe = asyncio.subprocess.PIPE if capture_output else None
+    process = await asyncio.create_subprocess_exec(*command, stdout=pipe, stderr=pipe)
+
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+    return process.returncode, stdout or b"", stderr or b""
+
+
+async def run_with_progress(
+    command: List[str], on_progress: Callable[[Dict[str, str]], Awaitable[None]]
+) -> int:
+    """
+    Runs an ffmpeg command that writes `-progress pipe:1` output and calls
+    on_progress with each complete block of key=value pairs as it arrives.
+    The process is killed if the caller is cancelled
+
+    Returns:
+        the return code of the process
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE
+    )
+
+    try:
+        block = {}
+        async for line in process.stdout:
+            key, _, value = line.decode().strip().partition("=")
+            if not key:
+                continue
+            block[key] = value
+            # every block ends with progress=continue or progress=end
+            if key == "progress":
+                await on_progress(block)
+                block = {}
+
+        return await process.wait()
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+
+async def probe(input_file: str, timeout: float = settings.PROBE_TIMEOUT_SEC) -> dict:
+    """Gets the format and stream metadata of a video using ffprobe"""
+    logger = getLogger(__name__ + ".probe")
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-show_format",
+        "-show_streams",
+        "-print_format",
+        "json",
+        input_file,
+    ]
+
+    try:
+        returncode, stdout, stderr = await run_command(command, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"ffprobe timed out after {timeout}s on {input_file}")
+        raise
+
+    if returncode != 0:
+        logger.error(f"ffprobe failed on {input_file}: {stderr.decode()}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unable to read video metadata",
+        )
+
+    return json.loads(stdout)
+
+
+async def probe_keyframes(
+    input_file: str, timeout: float = settings.KEYFRAME_PROBE_TIMEOUT_SEC
+) -> List[float]:
+    """
+    Gets the timestamps of the video keyframes of a file.
+    Reads packet flags only, so nothing is decoded
+    """
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "csv=print_section=0",
+        input_file,
+    ]
+
+    returncode, stdout, stderr = await run_command(command, timeout=timeout)
+    if returncode != 0:
+        raise RuntimeError(f"ffprobe failed on {input_file}: {stderr.decode()}")
+
+    keyframes = []
+    for line in stdout.decode().splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(float(pts_time))
+
+    return sorted(keyframes)
+
+
+def to_float(value: str, default: float = 0) -> float:
+    """Converts an ffmpeg progress value such as "1.5x" or "N/A" to a float"""
+    try:
+        return float(value.rstrip("x"))
+    except (AttributeError, ValueError):
+        return default
+
+
+def parse_rate(value: Optional[str]) -> float:
+    """Converts an ffprobe frame rate such as "30000/1001" to a float"""
+    try:
+        numerator, _, denominator = (value or "").partition("/")
+        return float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0
+
+
+def parse_int(value: Optional[str]) -> Optional[int]:
+    """Converts an ffprobe numeric string to an int, or None if unavailable"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_media_info(metadata: dict) -> MediaInfo:
+    """Summarizes ffprobe metadata into the fields used to plan transcoding"""
+    streams = metadata.get("streams", [])
+    format = metadata.get("format", {})
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+
+    width = video.get("width", 0)
+    height = video.get("height", 0)
+    rotation = next(
+        (
+            int(side_data.get("rotation", 0))
+            for side_data in video.get("side_data_list", [])
+            if "rotation" in side_data
+        ),
+        0,
+    )
+    if abs(rotation) % 180 == 90:
+        width, height = height, width
+
+    return MediaInfo(
+        width=width,
+        height=height,
+        fps=parse_rate(video.get("avg_frame_rate"))
+        or parse_rate(video.get("r_frame_rate")),
+        video_bit_rate=parse_int(video.get("bit_rate"))
+        or parse_int(format.get("bit_rate")),
+        has_audio=audio is not None,
+        audio_bit_rate=parse_int(audio.get("bit_rate")) if audio else None,
+        duration_in_sec=float(format.get("duration") or 0),
+    )
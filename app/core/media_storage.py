@@ -0,0 +1,379 @@
+import os
+import re
+import shutil
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+
+import gridfs
+from core.checkpoints import CHECKPOINT_FILE
+from core.config import settings
+from core.delivery import make_etag, media_type
+from schemas.media import StoredFile
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:
+    # only required with MEDIA_STORAGE=S3
+    boto3 = None
+
+
+def source_key(video_id: str) -> str:
+    """Gets the key of a video's uploaded source file"""
+    return f"{video_id}/{video_id}.mp4"
+
+
+def list_rendition_files(
+    directory: str, video_id: str, names: Optional[List[str]] = None
+) -> List[List[str]]:
+    """
+    Lists the HLS files under a local directory, or under the given files
+    and directories of it, relative to it. Files are grouped into media,
+    variant playlists and the master playlist, to be stored in that order
+    """
+    paths = []
+    for name in names if names is not None else os.listdir(directory):
+        path = f"{directory}/{name}"
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                paths += [os.path.relpath(f"{root}/{f}", directory) for f in files]
+        elif os.path.exists(path):
+            paths.append(name)
+
+    groups = [[], [], []]
+    for path in sorted(paths):
+        if path == f"{video_id}.mp4" or path.endswith(".tmp"):
+            continue
+        if os.path.basename(path) == CHECKPOINT_FILE:
+            continue
+        if path == "master.m3u8":
+            groups[2].append(path)
+        elif path.endswith(".m3u8"):
+            groups[1].append(path)
+        else:
+            groups[0].append(path)
+
+    return groups
+
+
+def remove_staged_upload(video_id: str, directory: str = settings.VIDEO_DIRECTORY):
+    """Removes the local copy of an upload, once stored or deleted"""
+    shutil.rmtree(f"{directory}/{video_id}", ignore_errors=True)
+
+
+class MediaStorage(ABC):
+    """
+    Base class for backends that hold source videos and HLS renditions.
+    Files are addressed by keys relative to the video directory, e.g.
+    {video_id}/stream_0/playlist.m3u8. Uploads are staged in
+    VIDEO_DIRECTORY until stored with store_source
+    """
+
+    def local_directory(self, video_id: str) -> Optional[str]:
+        """
+        Gets the directory holding a video's media if it is
+        reachable on this host's filesystem, otherwise None
+        """
+        return None
+
+    @abstractmethod
+    def fetch_source(self, video_id: str, destination: str):
+        """Copies a video's source file to a local destination path"""
+
+    def store_source(self, video_id: str, path: str):
+        """Stores a video's uploaded source file and removes the staged copy"""
+        self.store_file(path, source_key(video_id))
+        remove_staged_upload(video_id)
+
+    def store_renditions(
+        self, video_id: str, directory: str, names: Optional[List[str]] = None
+    ):
+        """
+        Stores the HLS renditions found in a local directory, or only the
+        given files and directories of it. Files are written in parallel.
+        Playlists are written after the media they list, and master.m3u8
+        last, so readers never get a playlist of files not yet stored
+        """
+        with ThreadPoolExecutor(settings.MEDIA_STORAGE_WRITE_CONCURRENCY) as pool:
+            for group in list_rendition_files(directory, video_id, names):
+                for _ in pool.map(
+                    lambda path: self.store_file(
+                        f"{directory}/{path}", f"{video_id}/{path}"
+                    ),
+                    group,
+                ):
+                    pass
+
+    @abstractmethod
+    def store_file(self, path: str, key: str):
+        """Stores a local file under a key, replacing the file stored before"""
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[StoredFile]:
+        """Gets the size and ETag of a stored file, or None if it does not exist"""
+
+    @abstractmethod
+    def read(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[bytes]:
+        """
+        Reads a stored file from start to end (inclusive, the end of the
+        file by default) in chunks of MEDIA_STORAGE_READ_CHUNK_SIZE.
+        Raises FileNotFoundError if the file does not exist
+        """
+
+    @abstractmethod
+    def delete(self, video_id: str):
+        """Deletes every file of a video"""
+
+
+class LocalMediaStorage(MediaStorage):
+    """
+    Media storage on a local or shared (e.g. NFS) filesystem.
+    Sources live at {directory}/{video_id}/{video_id}.mp4
+    """
+
+    def __init__(self, directory: str = settings.VIDEO_DIRECTORY):
+        """Initializes a LocalMediaStorage object"""
+        self.directory = directory
+
+    def local_directory(self, video_id: str) -> Optional[str]:
+        return f"{self.directory}/{video_id}"
+
+    def fetch_source(self, video_id: str, destination: str):
+        source = f"{self.local_directory(video_id)}/{video_id}.mp4"
+        if os.path.exists(destination) and os.path.samefile(source, destination):
+            return
+
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(source, destination)
+
+    def store_source(self, video_id: str, path: str):
+        target = f"{self.directory}/{source_key(video_id)}"
+        if os.path.exists(target) and os.path.samefile(path, target):
+            return
+
+        self.store_file(path, source_key(video_id))
+
+    def store_renditions(
+        self, video_id: str, directory: str, names: Optional[List[str]] = None
+    ):
+        target = f"{self.directory}/{video_id}"
+        if os.path.exists(target) and os.path.samefile(directory, target):
+            return
+
+        super().store_renditions(video_id, directory, names)
+
+    def store_file(self, path: str, key: str):
+        target = f"{self.directory}/{key}"
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, f"{target}.tmp")
+        os.replace(f"{target}.tmp", target)
+
+    def stat(self, key: str) -> Optional[StoredFile]:
+        try:
+            stat_result = os.stat(f"{self.directory}/{key}")
+        except FileNotFoundError:
+            return None
+
+        return StoredFile(size=stat_result.st_size, etag=make_etag(stat_result))
+
+    def read(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[bytes]:
+        with open(f"{self.directory}/{key}", mode="rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = settings.MEDIA_STORAGE_READ_CHUNK_SIZE
+                chunk = f.read(size if remaining is None else min(size, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, video_id: str):
+        shutil.rmtree(f"{self.directory}/{video_id}", ignore_errors=True)
+
+
+class GridFSMediaStorage(MediaStorage):
+    """
+    Media storage in MongoDB GridFS, on the database storage's GridFS
+    handle. Files are named by their key, the latest version is served
+    """
+
+    def __init__(self, fs: Optional[gridfs.GridFS] = None):
+        """Initializes a GridFSMediaStorage object"""
+        self._fs = fs
+
+    @property
+    def fs(self) -> gridfs.GridFS:
+        if self._fs is None:
+            # imported on first use, MongoStorage depends on this module
+            from core.storage import storage
+
+            self._fs = storage.fs
+        return self._fs
+
+    def fetch_source(self, video_id: str, destination: str):
+        try:
+            grid_out = self.fs.get_last_version(source_key(video_id))
+        except gridfs.NoFile:
+            raise FileNotFoundError(source_key(video_id))
+
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with open(f"{destination}.tmp", mode="wb") as f:
+            shutil.copyfileobj(grid_out, f, settings.MEDIA_STORAGE_READ_CHUNK_SIZE)
+        os.replace(f"{destination}.tmp", destination)
+
+    def store_file(self, path: str, key: str):
+        with open(path, mode="rb") as f:
+            file_id = self.fs.put(f, filename=key, content_type=media_type(key))
+
+        for old in self.fs.find({"filename": key, "_id": {"$ne": file_id}}):
+            self.fs.delete(old._id)
+
+    def stat(self, key: str) -> Optional[StoredFile]:
+        try:
+            grid_out = self.fs.get_last_version(key)
+        except gridfs.NoFile:
+            return None
+
+        return StoredFile(size=grid_out.length, etag=f'"{grid_out._id}"')
+
+    def read(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[bytes]:
+        try:
+            grid_out = self.fs.get_last_version(key)
+        except gridfs.NoFile:
+            raise FileNotFoundError(key)
+
+        with grid_out:
+            grid_out.seek(start)
+            end = grid_out.length - 1 if end is None else end
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = grid_out.read(
+                    min(settings.MEDIA_STORAGE_READ_CHUNK_SIZE, remaining)
+                )
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, video_id: str):
+        for grid_out in self.fs.find(
+            {"filename": {"$regex": f"^{re.escape(video_id)}/"}}
+        ):
+            self.fs.delete(grid_out._id)
+        remove_staged_upload(video_id)
+
+
+class S3MediaStorage(MediaStorage):
+    """
+    Media storage in an S3-compatible object store (AWS S3, MinIO, ...).
+    Large files are transferred as parallel multipart uploads and ranged
+    downloads of S3_MULTIPART_CHUNK_SIZE parts
+    """
+
+    def __init__(
+        self,
+        bucket: str = settings.S3_BUCKET,
+        endpoint_url: Optional[str] = settings.S3_ENDPOINT_URL,
+    ):
+        """Initializes a S3MediaStorage object"""
+        if boto3 is None:
+            raise RuntimeError("MEDIA_STORAGE=S3 requires boto3")
+
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=settings.S3_REGION,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+        )
+        self.transfer = TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_CHUNK_SIZE,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNK_SIZE,
+            max_concurrency=settings.MEDIA_STORAGE_WRITE_CONCURRENCY,
+        )
+
+    def fetch_source(self, video_id: str, destination: str):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        self.client.download_file(
+            self.bucket,
+            source_key(video_id),
+            f"{destination}.tmp",
+            Config=self.transfer,
+        )
+        os.replace(f"{destination}.tmp", destination)
+
+    def store_file(self, path: str, key: str):
+        self.client.upload_file(
+            path,
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": media_type(key)},
+            Config=self.transfer,
+        )
+
+    def stat(self, key: str) -> Optional[StoredFile]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] in ["404", "NoSuchKey", "NotFound"]:
+                return None
+            raise
+
+        return StoredFile(size=head["ContentLength"], etag=head["ETag"])
+
+    def read(
+        self, key: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[bytes]:
+        if end is not None and end < start:
+            return
+
+        options = {}
+        if start > 0 or end is not None:
+            options["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=key, **options)[
+                "Body"
+            ]
+        except ClientError as ex:
+            if ex.response["Error"]["Code"] in ["404", "NoSuchKey", "NotFound"]:
+                raise FileNotFoundError(key)
+            raise
+
+        try:
+            yield from body.iter_chunks(settings.MEDIA_STORAGE_READ_CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def delete(self, video_id: str):
+        pages = self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=f"{video_id}/"
+        )
+        for page in pages:
+            # at most 1000 keys per page, the limit of delete_objects
+            objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+            if objects:
+                self.client.delete_objects(
+                    Bucket=self.bucket, Delete={"Objects": objects, "Quiet": True}
+                )
+        remove_staged_upload(video_id)
+
+
+media_storage = None
+
+if settings.MEDIA_STORAGE == "GRIDFS":
+    media_storage = GridFSMediaStorage()
+elif settings.MEDIA_STORAGE == "S3":
+    media_storage = S3MediaStorage(settings.S3_BUCKET, settings.S3_ENDPOINT_URL)
+else:
+    media_storage = LocalMediaStorage(settings.VIDEO_DIRECTORY)
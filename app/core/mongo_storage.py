@@ -1,16 +1,34 @@
 import os
-import shutil
-from datetime import UTC, datetime
-from typing import Dict, List, Optional
+from datetime import UTC, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
 import gridfs
 from bson.objectid import ObjectId
 from core.authentication.hashing import hash_bcrypt
 from core.config import settings
+from core.events import ORIGIN, broker
+from core.indexes import apply_indexes
+from core.media_cache import media_cache
+from core.media_storage import media_storage
+from core.queries import (
+    JOB_CLAIM_SORT,
+    job_claim_filter,
+    job_expired_filter,
+    job_runnable_filter,
+    media_available_filter,
+    upload_session_expired_filter,
+    video_event_since_filter,
+)
+from core.upload import upload_session_path
 from fastapi import status
 from fastapi.exceptions import HTTPException
-from pymongo import ASCENDING
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from pymongo.mongo_client import MongoClient
+from schemas import event as s_event
+from schemas import job as s_job
+from schemas import media as s_media
+from schemas import upload as s_upload
 from schemas import user as s_user
 from schemas import video as s_video
 
@@ -29,8 +47,8 @@ class MongoStorage:
         self.db = self.client[db_name]
         self.fs = gridfs.GridFS(self.db)
 
-        # Create indexes
-        self.db["users"].create_index(keys=[("email", ASCENDING)], unique=True)
+        if settings.INDEXES_ON_STARTUP:
+            apply_indexes(self.db)
 
     # users
     def user_create_record(
@@ -151,6 +169,12 @@ class MongoStorage:
             "description": description,
             "tags": tags,
             "available": available,
+            "status": (
+                s_video.VideoStatus.AVAILABLE
+                if available
+                else s_video.VideoStatus.PROCESSING
+            ),
+            "renditions": [],
             "duration_in_sec": duration_in_sec,
         }
 
@@ -176,7 +200,10 @@ class MongoStorage:
         return video
 
     def video_get_all_records(
-        self, filter: Dict, limit: int = 0
+        self,
+        filter: Dict,
+        limit: int = 0,
+        sort: Optional[List[Tuple[str, int]]] = None,
     ) -> List[s_video.Video]:
         """Gets all video records from the db using the supplied filter"""
         videos = self.db["videos"]
@@ -184,7 +211,7 @@ class MongoStorage:
         if "_id" in filter and type(filter["_id"]) is str:
             filter["_id"] = ObjectId(filter["_id"])
 
-        videos_list = videos.find(filter).limit(limit)
+        videos_list = videos.find(filter, sort=sort).limit(limit)
 
         videos_list = [s_video.Video(**video) for video in videos_list]
 
@@ -205,22 +232,492 @@ class MongoStorage:
 
         return video
 
-    def video_update_record(self, filter: Dict, update: Dict):
-        """Updates a video record"""
-        self.video_verify_record(filter)
+    def video_update_record(
+        self,
+        filter: Dict,
+        update: Dict,
+        event: s_event.EventType = s_event.EventType.UPDATED,
+    ):
+        """Updates a video record and publishes the change as an event"""
+        video = self.video_verify_record(filter)
 
         for key in ["_id", "user_id"]:
             if key in update:
                 raise KeyError(f"Invalid Key. KEY {key} cannot be changed")
         update["date_modified"] = datetime.now(UTC)
 
-        return self.db["videos"].update_one(filter, {"$set": update})
+        result = self.db["videos"].update_one(filter, {"$set": update})
+        self.video_publish_event(event, video, data=update)
+
+        return result
 
     def video_delete_record(self, filter: Dict):
-        """Deletes a video record"""
+        """
+        Deletes a video record. Shared renditions are only
+        removed with the last video that references them
+        """
         video = self.video_verify_record(filter)
 
         self.db["videos"].delete_one(filter)
-        path = f"./{settings.VIDEO_DIRECTORY}/{video.id}"
-        if os.path.exists(path):
-            shutil.rmtree(path, ignore_errors=True)
+        ids = [video.id]
+        if video.media_id is not None:
+            last = self.media_release_reference(video.media_id)
+            if video.media_id == video.id and not last:
+                ids = []
+            elif video.media_id != video.id and last:
+                ids.append(video.media_id)
+
+        for id in ids:
+            media_storage.delete(id)
+            path = f"./{settings.VIDEO_DIRECTORY}/{id}"
+            media_cache.invalidate(os.path.realpath(path) + os.sep)
+
+        self.video_publish_event(s_event.EventType.DELETED, video)
+
+    def video_claim_recovery(
+        self, filter: Dict, stale_before: datetime
+    ) -> Optional[s_video.Video]:
+        """
+        Atomically marks a video as being recovered so that only one
+        API or worker process reconciles it per RECOVERY_STALE_AFTER_SEC
+        """
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        video = self.db["videos"].find_one_and_update(
+            {
+                **filter,
+                "$or": [
+                    {"date_recovered": {"$exists": False}},
+                    {"date_recovered": {"$lt": stale_before}},
+                ],
+            },
+            {"$set": {"date_recovered": datetime.now(UTC)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+        if video:
+            video = s_video.Video(**video)
+
+        return video
+
+    # video events
+    def video_publish_event(
+        self, type: s_event.EventType, video: s_video.Video, data: Dict = {}
+    ):
+        """
+        Publishes a video event to subscribers in this process and, when
+        EVENTS_SOURCE is CHANGE_STREAM, to other processes via video_events
+        """
+        event = s_event.VideoEvent(
+            type=type,
+            video_id=video.id,
+            user_id=video.user_id,
+            data=data,
+            origin=ORIGIN,
+            date=datetime.now(UTC),
+        )
+        broker.publish(event)
+
+        if settings.EVENTS_SOURCE == "CHANGE_STREAM":
+            self.db["video_events"].insert_one(event.model_dump())
+
+    def video_event_watch(self):
+        """Opens a change stream of newly published video events"""
+        return self.db["video_events"].watch([{"$match": {"operationType": "insert"}}])
+
+    def video_event_get_records_since(
+        self, date: datetime
+    ) -> List[Tuple[str, s_event.VideoEvent]]:
+        """Gets the video events published since a date, with their ids"""
+        events = self.db["video_events"].find(
+            video_event_since_filter(date), sort=[("_id", ASCENDING)]
+        )
+
+        return [(str(event["_id"]), s_event.VideoEvent(**event)) for event in events]
+
+    # upload sessions
+    def upload_session_create_record(
+        self,
+        session_data: s_upload.UploadSessionIn,
+        user_id: str,
+        chunk_size: int = settings.UPLOAD_SESSION_CHUNK_SIZE,
+    ) -> str:
+        """Creates a resumable upload session record"""
+
+        sessions_table = self.db["upload_sessions"]
+
+        date = datetime.now(UTC)
+        session = session_data.model_dump()
+        session["user_id"] = user_id
+        session["chunk_size"] = chunk_size
+        session["chunk_count"] = -(-session_data.size // chunk_size)
+        session["received_chunks"] = []
+        session["date_created"] = date
+        session["date_modified"] = date
+        session["expires_at"] = date + timedelta(
+            hours=settings.UPLOAD_SESSION_EXPIRE_HOURS
+        )
+
+        id = str(sessions_table.insert_one(session).inserted_id)
+
+        return id
+
+    def upload_session_get_record(
+        self, filter: Dict
+    ) -> Optional[s_upload.UploadSession]:
+        """Gets an upload session record from the db using the supplied filter"""
+        sessions = self.db["upload_sessions"]
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        session = sessions.find_one(filter)
+
+        if session:
+            session = s_upload.UploadSession(**session)
+
+        return session
+
+    def upload_session_verify_record(self, filter: Dict) -> s_upload.UploadSession:
+        """
+        Gets an upload session record using the filter
+        and raises an error if a matching, unexpired record is not found
+        """
+
+        session = self.upload_session_get_record(filter)
+
+        if session is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload session not found",
+            )
+
+        if session.expires_at.replace(tzinfo=UTC) < datetime.now(UTC):
+            self.upload_session_delete_record({"_id": session.id})
+            raise HTTPException(
+                status_code=status.HTTP_410_GONE, detail="Upload session expired"
+            )
+
+        return session
+
+    def upload_session_add_chunk(self, filter: Dict, index: int):
+        """Records a chunk as received in an upload session"""
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        return self.db["upload_sessions"].update_one(
+            filter,
+            {
+                "$addToSet": {"received_chunks": index},
+                "$set": {"date_modified": datetime.now(UTC)},
+            },
+        )
+
+    def upload_session_delete_record(
+        self, filter: Dict, remove_file: bool = True
+    ) -> s_upload.UploadSession:
+        """
+        Atomically deletes an upload session record so that only
+        one caller can finalize or abort a session
+        """
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        session = self.db["upload_sessions"].find_one_and_delete(filter)
+
+        if session is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload session not found",
+            )
+
+        session = s_upload.UploadSession(**session)
+        path = upload_session_path(session.id)
+        if remove_file and os.path.exists(path):
+            os.remove(path)
+
+        return session
+
+    def upload_session_delete_expired_records(self) -> int:
+        """Deletes expired upload session records and their partial files"""
+        sessions = self.db["upload_sessions"].find(
+            upload_session_expired_filter(datetime.now(UTC)), {"_id": 1}
+        )
+
+        count = 0
+        for session in sessions:
+            try:
+                self.upload_session_delete_record({"_id": session["_id"]})
+                count += 1
+            except HTTPException:
+                # finalized or aborted in the meantime
+                pass
+
+        return count
+
+    # media
+    def media_create_record(self, media_id: str, checksum: str, size: int) -> bool:
+        """
+        Creates a reference counted media record for a video's renditions.
+        Returns False if media with the same checksum already exists
+        """
+
+        date = datetime.now(UTC)
+        media = {
+            "_id": ObjectId(media_id),
+            "checksum": checksum,
+            "size": size,
+            "status": s_media.MediaStatus.PROCESSING,
+            "references": 1,
+            "renditions": [],
+        }
+
+        media["date_created"] = date
+        media["date_modified"] = date
+
+        try:
+            self.db["media"].insert_one(media)
+        except DuplicateKeyError:
+            return False
+
+        return True
+
+    def media_get_record(self, filter: Dict) -> Optional[s_media.Media]:
+        """Gets a media record from the db using the supplied filter"""
+        media_table = self.db["media"]
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        media = media_table.find_one(filter)
+
+        if media:
+            media = s_media.Media(**media)
+
+        return media
+
+    def media_update_record(self, filter: Dict, update: Dict):
+        """Updates a media record"""
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+        update["date_modified"] = datetime.now(UTC)
+
+        return self.db["media"].update_one(filter, {"$set": update})
+
+    def media_acquire_reference(self, checksum: str) -> Optional[s_media.Media]:
+        """
+        Atomically adds a reference to the transcoded media with a checksum
+        and returns it, or None if no such media is available
+        """
+
+        media = self.db["media"].find_one_and_update(
+            media_available_filter(checksum),
+            {"$inc": {"references": 1}, "$set": {"date_modified": datetime.now(UTC)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+        if media:
+            media = s_media.Media(**media)
+
+        return media
+
+    def media_release_reference(self, media_id: str) -> bool:
+        """
+        Removes a reference to media. Returns True if it was the last one,
+        in which case the media record is deleted and its files may go
+        """
+
+        media = self.db["media"].find_one_and_update(
+            {"_id": ObjectId(media_id)},
+            {"$inc": {"references": -1}, "$set": {"date_modified": datetime.now(UTC)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+        if media is None:
+            # not tracked, so nothing else can reference it
+            return True
+
+        if media["references"] > 0:
+            return False
+
+        # a concurrent acquire may have revived it in the meantime
+        result = self.db["media"].delete_one(
+            {"_id": media["_id"], "references": {"$lte": 0}}
+        )
+
+        return result.deleted_count == 1
+
+    # jobs
+    def job_create_record(
+        self,
+        video_id: str,
+        priority: int = 0,
+        max_attempts: int = settings.JOB_MAX_ATTEMPTS,
+    ) -> str:
+        """Creates a queued transcoding job record"""
+
+        jobs_table = self.db["jobs"]
+
+        date = datetime.now(UTC)
+        job = {
+            "video_id": video_id,
+            "status": s_job.JobStatus.QUEUED,
+            "priority": priority,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "error": None,
+            "run_after": date,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "date_started": None,
+            "date_finished": None,
+        }
+
+        job["date_created"] = date
+        job["date_modified"] = date
+
+        id = str(jobs_table.insert_one(job).inserted_id)
+
+        return id
+
+    def job_get_record(self, filter: Dict) -> Optional[s_job.Job]:
+        """
+        Gets the most recent job record from the db
+        using the supplied filter
+        """
+        jobs = self.db["jobs"]
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        job = jobs.find_one(filter, sort=[("_id", DESCENDING)])
+
+        if job:
+            job = s_job.Job(**job)
+
+        return job
+
+    def job_verify_record(self, filter: Dict) -> s_job.Job:
+        """
+        Gets a job record using the filter
+        and raises an error if a matching record is not found
+        """
+
+        job = self.job_get_record(filter)
+
+        if job is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+            )
+
+        return job
+
+    def job_claim_record(
+        self, worker_id: str, lease_sec: float = settings.JOB_LEASE_SEC
+    ) -> Optional[s_job.Job]:
+        """
+        Atomically leases the highest priority, oldest runnable job to a
+        worker and returns it, or None if there is nothing to run. Running
+        jobs whose lease has expired (e.g. their worker crashed) are reclaimed
+        while they have attempts left
+        """
+
+        date = datetime.now(UTC)
+        job = self.db["jobs"].find_one_and_update(
+            job_claim_filter(date),
+            {
+                "$set": {
+                    "status": s_job.JobStatus.RUNNING,
+                    "lease_owner": worker_id,
+                    "lease_expires_at": date + timedelta(seconds=lease_sec),
+                    "date_started": date,
+                    "date_modified": date,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=JOB_CLAIM_SORT,
+            return_document=ReturnDocument.AFTER,
+        )
+
+        if job:
+            job = s_job.Job(**job)
+
+        return job
+
+    def job_fail_expired_records(self) -> List[s_job.Job]:
+        """
+        Fails the running jobs whose lease expired on their last attempt,
+        which job_claim_record no longer reclaims, and returns them
+        """
+
+        date = datetime.now(UTC)
+        filter = job_expired_filter(date)
+
+        jobs = []
+        for job in self.db["jobs"].find(filter, {"_id": 1}):
+            # another process may sweep the same job, only one fails it
+            job = self.db["jobs"].find_one_and_update(
+                {**filter, "_id": job["_id"]},
+                {
+                    "$set": {
+                        "status": s_job.JobStatus.FAILED,
+                        "error": "Lease expired on the last attempt",
+                        "lease_owner": None,
+                        "lease_expires_at": None,
+                        "date_finished": date,
+                        "date_modified": date,
+                    }
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+            if job:
+                jobs.append(s_job.Job(**job))
+
+        return jobs
+
+    def job_count_runnable_records(self) -> int:
+        """Counts the queued jobs that are waiting for a worker"""
+        return self.db["jobs"].count_documents(job_runnable_filter(datetime.now(UTC)))
+
+    def job_renew_lease(
+        self, id: str, worker_id: str, lease_sec: float = settings.JOB_LEASE_SEC
+    ) -> bool:
+        """
+        Extends a worker's lease on a running job.
+        Returns False if the worker no longer holds the lease
+        """
+
+        date = datetime.now(UTC)
+        result = self.db["jobs"].update_one(
+            {
+                "_id": ObjectId(id),
+                "status": s_job.JobStatus.RUNNING,
+                "lease_owner": worker_id,
+            },
+            {
+                "$set": {
+                    "lease_expires_at": date + timedelta(seconds=lease_sec),
+                    "date_modified": date,
+                }
+            },
+        )
+
+        return result.matched_count == 1
+
+    def job_update_record(self, filter: Dict, update: Dict):
+        """Updates a job record"""
+
+        if "_id" in filter and type(filter["_id"]) is str:
+            filter["_id"] = ObjectId(filter["_id"])
+
+        for key in ["_id", "video_id"]:
+            if key in update:
+                raise KeyError(f"Invalid Key. KEY {key} cannot be changed")
+        update["date_modified"] = datetime.now(UTC)
+
+        return self.db["jobs"].update_one(filter, {"$set": update})
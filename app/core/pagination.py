@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import UTC, datetime, timedelta
+from typing import Dict, Optional
+
+from bson.objectid import ObjectId
+from core.queries import VIDEO_SORTS, video_after_filter
+from core.storage import async_storage
+from fastapi import HTTPException, status
+from schemas.base import Page
+from schemas.video import Video, VideoOrder
+
+EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+invalid_cursor = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+)
+
+
+def to_millis(date: datetime) -> int:
+    """Gets a date as the milliseconds since the epoch MongoDB stores it as"""
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=UTC)
+
+    return (date - EPOCH) // timedelta(milliseconds=1)
+
+
+def encode_cursor(video: Video, order: VideoOrder) -> str:
+    """Gets an opaque cursor positioned after a video in the given order"""
+    position = {"o": order.value, "i": video.id}
+    if order == VideoOrder.NEWEST:
+        position["d"] = to_millis(video.date_created)
+
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def cursor_filter(cursor: str, order: VideoOrder) -> Dict:
+    """
+    Gets the filter matching the videos after a cursor, which must have
+    been created for the same order
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor))
+        if position["o"] != order.value:
+            raise invalid_cursor
+        id = ObjectId(position["i"])
+
+        if order == VideoOrder.ID:
+            return video_after_filter(order, id)
+
+        date = EPOCH + timedelta(milliseconds=int(position["d"]))
+        return video_after_filter(order, id, date)
+    except HTTPException:
+        raise
+    except Exception:
+        raise invalid_cursor
+
+
+async def get_video_page(
+    filter: Dict, order: VideoOrder, limit: int, cursor: Optional[str] = None
+) -> Page[Video]:
+    """
+    Gets a page of the videos matching the filter. One extra video is read
+    to tell whether a next page exists, so the matches are never counted
+    """
+    if cursor:
+        filter = {**filter, **cursor_filter(cursor, order)}
+
+    videos = await async_storage.video_get_all_records(
+        filter=filter, limit=limit + 1, sort=VIDEO_SORTS[order]
+    )
+
+    next_cursor = None
+    if len(videos) > limit:
+        videos = videos[:limit]
+        next_cursor = encode_cursor(videos[-1], order)
+
+    return Page[Video](items=videos, next_cursor=next_cursor)
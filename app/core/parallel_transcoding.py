@@ -0,0 +1,265 @@
+import asyncio
+import math
+import os
+import re
+import shutil
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.checkpoints import (
+    checkpoint_plan,
+    is_checkpointed,
+    remove_checkpoint,
+    write_checkpoint,
+)
+from core.config import settings
+from core.media_probe import probe_keyframes, run_with_progress, to_float
+from core.renditions import build_hls_command
+from core.thumbnails import stitch_thumbnails
+from schemas.rendition import RenditionPlan, ThumbnailPlan
+from starlette.concurrency import run_in_threadpool
+
+
+def plan_chunks(
+    keyframes: List[float],
+    duration_in_sec: float,
+    chunk_sec: float = settings.PARALLEL_TRANSCODE_CHUNK_SEC,
+) -> List[Tuple[float, float]]:
+    """
+    Splits a source into (start, end) chunks of at least chunk_sec that
+    each start on a keyframe. A short tail is merged into the last chunk
+    """
+    boundaries = [0.0]
+    for keyframe in keyframes:
+        if (
+            keyframe - boundaries[-1] >= chunk_sec
+            and duration_in_sec - keyframe >= chunk_sec / 2
+        ):
+            boundaries.append(keyframe)
+    boundaries.append(duration_in_sec)
+
+    return list(zip(boundaries, boundaries[1:]))
+
+
+class ChunkProgress:
+    """Combines the ffmpeg progress of concurrently encoded chunks into one"""
+
+    def __init__(
+        self,
+        on_progress: Callable[[Dict[str, str]], Awaitable[None]],
+        chunk_count: int,
+    ):
+        """Initializes a ChunkProgress object"""
+        self.on_progress = on_progress
+        self.blocks: List[Dict[str, str]] = [{} for _ in range(chunk_count)]
+
+    def for_chunk(self, index: int) -> Callable[[Dict[str, str]], Awaitable[None]]:
+        """Gets the progress callback of a single chunk"""
+
+        async def on_chunk_progress(block: Dict[str, str]):
+            self.blocks[index] = block
+            done = all(b.get("progress") == "end" for b in self.blocks)
+            await self.on_progress(
+                {
+                    "out_time_us": str(
+                        sum(to_float(b.get("out_time_us")) for b in self.blocks)
+                    ),
+                    "fps": str(sum(to_float(b.get("fps")) for b in self.blocks)),
+                    "speed": f"{sum(to_float(b.get('speed')) for b in self.blocks)}x",
+                    "progress": "end" if done else "continue",
+                }
+            )
+
+        return on_chunk_progress
+
+
+def stitch_playlists(prefix: str, chunks_prefix: str, chunk_count: int):
+    """
+    Joins the HLS output of each chunk into continuous variant playlists
+    under prefix. Media files are moved up (MPEG-TS segments are renumbered,
+    fMP4 files are prefixed with their chunk) and each chunk boundary is
+    marked with EXT-X-DISCONTINUITY
+    """
+    first = f"{chunks_prefix}/{0:05d}"
+    streams = sorted(name for name in os.listdir(first) if name.startswith("stream_"))
+
+    for stream in streams:
+        os.makedirs(f"{prefix}/{stream}", exist_ok=True)
+        header = []
+        body = []
+        target_duration = 0
+        segment_count = 0
+
+        for chunk in range(chunk_count):
+            directory = f"{chunks_prefix}/{chunk:05d}/{stream}"
+            if chunk > 0:
+                body.append("#EXT-X-DISCONTINUITY")
+
+            moved = {}
+
+            def move(name: str) -> str:
+                nonlocal segment_count
+                if name not in moved:
+                    if name.endswith(".ts"):
+                        moved[name] = f"data{segment_count:03d}.ts"
+                        segment_count += 1
+                    else:
+                        moved[name] = f"chunk{chunk:05d}_{name}"
+                    os.replace(
+                        f"{directory}/{name}", f"{prefix}/{stream}/{moved[name]}"
+                    )
+                return moved[name]
+
+            with open(f"{directory}/playlist.m3u8", mode="r") as f:
+                lines = f.read().splitlines()
+
+            in_header = True
+            duration = 0
+            for line in lines:
+                if line.startswith("#EXTINF:"):
+                    in_header = False
+                    duration = float(line[len("#EXTINF:") :].split(",")[0])
+                    target_duration = max(target_duration, math.ceil(duration))
+                    body.append(line)
+                elif line.startswith("#EXT-X-BYTERANGE"):
+                    body.append(line)
+                elif line.startswith("#EXT-X-MAP:"):
+                    # each chunk has its own fMP4 init section
+                    uri = re.search(r'URI="([^"]+)"', line).group(1)
+                    body.append(line.replace(f'URI="{uri}"', f'URI="{move(uri)}"'))
+                elif line and not line.startswith("#"):
+                    body.append(move(line))
+                elif (
+                    chunk == 0
+                    and in_header
+                    and not line.startswith("#EXT-X-TARGETDURATION")
+                    and not line.startswith("#EXT-X-MEDIA-SEQUENCE")
+                ):
+                    header.append(line)
+
+        playlist = header + [
+            f"#EXT-X-TARGETDURATION:{target_duration}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            *body,
+            "#EXT-X-ENDLIST",
+        ]
+        path = f"{prefix}/{stream}/playlist.m3u8"
+        with open(f"{path}.tmp", mode="w") as f:
+            f.write("\n".join(playlist) + "\n")
+        os.replace(f"{path}.tmp", path)
+
+    os.replace(f"{first}/master.m3u8", f"{prefix}/master.m3u8")
+
+
+async def transcode_chunked(
+    input_file: str,
+    prefix: str,
+    renditions: List[RenditionPlan],
+    has_audio: bool,
+    audio_group: List[int],
+    duration_in_sec: float,
+    on_progress: Callable[[Dict[str, str]], Awaitable[None]],
+    processes: int = settings.PARALLEL_TRANSCODE_PROCESSES,
+    preset: str = settings.X264_DEFAULT_PRESET,
+    thumbnails: Optional[ThumbnailPlan] = None,
+) -> List[Tuple[str, float, int]]:
+    """
+    Converts a source to HLS by cutting it at keyframes into chunks,
+    encoding up to `processes` chunks at a time and stitching the results
+    into the same layout a single ffmpeg run produces. Chunks checkpointed
+    by an interrupted attempt are reused instead of encoded again.
+    Returns the segments of the thumbnail track, one per chunk
+    """
+    logger = getLogger(__name__ + ".transcode_chunked")
+
+    keyframes = await probe_keyframes(input_file)
+    if keyframes:
+        # ffmpeg seeks relative to the start of the file
+        keyframes = [keyframe - keyframes[0] for keyframe in keyframes]
+    chunks = plan_chunks(keyframes, duration_in_sec)
+    logger.info(
+        f"Encoding {len(chunks)} chunks of {input_file} with {processes} processes"
+    )
+
+    chunks_prefix = f"{prefix}/chunks"
+    slots = asyncio.Semaphore(processes)
+    progress = ChunkProgress(on_progress, len(chunks))
+
+    async def encode(index: int, start: float, end: float):
+        chunk_prefix = f"{chunks_prefix}/{index:05d}"
+        chunk_thumbnails = thumbnails
+        if thumbnails and index > 0:
+            # the poster is cut from the first chunk
+            chunk_thumbnails = thumbnails.model_copy(update={"poster_time_sec": None})
+        plan = checkpoint_plan(
+            start=start,
+            end=end,
+            renditions=[r.model_dump() for r in renditions],
+            has_audio=has_audio,
+            audio_group=audio_group,
+            preset=preset,
+            packaging=settings.HLS_PACKAGING,
+            thumbnails=chunk_thumbnails and chunk_thumbnails.model_dump(),
+        )
+        if await run_in_threadpool(is_checkpointed, chunk_prefix, plan):
+            # encoded by an earlier attempt that was interrupted
+            logger.info(f"Chunk {index} of {input_file} resumed from checkpoint")
+            await progress.for_chunk(index)(
+                {"out_time_us": str((end - start) * 1_000_000), "progress": "end"}
+            )
+            return
+
+        async with slots:
+            await run_in_threadpool(shutil.rmtree, chunk_prefix, ignore_errors=True)
+            if chunk_thumbnails:
+                os.makedirs(f"{chunk_prefix}/thumbnails")
+            command = build_hls_command(
+                input_file=input_file,
+                prefix=chunk_prefix,
+                renditions=renditions,
+                has_audio=has_audio,
+                audio_group=audio_group,
+                input_options=["-ss", f"{start:.6f}", "-t", f"{end - start:.6f}"],
+                # keep timestamps continuous across chunks
+                output_options=["-output_ts_offset", f"{start:.6f}"],
+                preset=preset,
+                thumbnails=chunk_thumbnails,
+            )
+            returncode = await run_with_progress(command, progress.for_chunk(index))
+            if returncode != 0:
+                raise RuntimeError(
+                    f"ffmpeg exited with code {returncode} on chunk {index}"
+                )
+            await run_in_threadpool(write_checkpoint, chunk_prefix, plan)
+
+    # a failing chunk cancels the others, which kills their ffmpeg. Finished
+    # chunks are kept so that the job's next attempt only encodes the rest
+    async with asyncio.TaskGroup() as group:
+        for index, (start, end) in enumerate(chunks):
+            group.create_task(encode(index, start, end))
+
+    # stitching moves files out of the chunks, so they cannot be resumed after
+    for index in range(len(chunks)):
+        await run_in_threadpool(remove_checkpoint, f"{chunks_prefix}/{index:05d}")
+    await run_in_threadpool(stitch_playlists, prefix, chunks_prefix, len(chunks))
+    segments = []
+    if thumbnails:
+        segments = await run_in_threadpool(
+            stitch_thumbnails,
+            f"{prefix}/thumbnails",
+            [
+                (f"{chunks_prefix}/{index:05d}/thumbnails", start)
+                for index, (start, _) in enumerate(chunks)
+            ],
+        )
+    await run_in_threadpool(shutil.rmtree, chunks_prefix, ignore_errors=True)
+
+    return segments
+
+
+def use_parallel_transcoding(duration_in_sec: float) -> bool:
+    """Checks if a source is long enough to be worth transcoding in chunks"""
+    return (
+        settings.PARALLEL_TRANSCODE_PROCESSES > 1
+        and duration_in_sec >= settings.PARALLEL_TRANSCODE_MIN_DURATION_SEC
+    )
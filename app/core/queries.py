@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from schemas import job as s_job
+from schemas import media as s_media
+from schemas import video as s_video
+
+# every order ends on _id so that videos created in the same millisecond
+# keep a stable position between pages
+VIDEO_SORTS: Dict[s_video.VideoOrder, List[Tuple[str, int]]] = {
+    s_video.VideoOrder.NEWEST: [("date_created", DESCENDING), ("_id", DESCENDING)],
+    s_video.VideoOrder.ID: [("_id", ASCENDING)],
+}
+
+JOB_CLAIM_SORT: List[Tuple[str, int]] = [
+    ("priority", DESCENDING),
+    ("run_after", ASCENDING),
+]
+
+
+def video_after_filter(
+    order: s_video.VideoOrder, id: ObjectId, date: Optional[datetime] = None
+) -> Dict:
+    """
+    Gets the filter matching the videos after a position in the given
+    order. The date is the video's date_created, needed by NEWEST only
+    """
+    if order == s_video.VideoOrder.ID:
+        return {"_id": {"$gt": id}}
+
+    return {
+        "date_created": {"$lte": date},
+        "$or": [
+            {"date_created": {"$lt": date}},
+            {"date_created": date, "_id": {"$lt": id}},
+        ],
+    }
+
+
+def video_stale_filter(stale_before: datetime) -> Dict:
+    """Gets the filter matching the videos left processing since a date"""
+    return {
+        "$or": [
+            {
+                "status": {
+                    "$in": [
+                        s_video.VideoStatus.PROCESSING,
+                        s_video.VideoStatus.PARTIALLY_AVAILABLE,
+                    ]
+                }
+            },
+            # records created before statuses existed
+            {"status": {"$exists": False}, "available": False},
+        ],
+        "date_modified": {"$lt": stale_before},
+    }
+
+
+def video_event_since_filter(date: datetime) -> Dict:
+    """Gets the filter matching the video events published since a date"""
+    return {"_id": {"$gte": ObjectId.from_datetime(date)}}
+
+
+def job_runnable_filter(date: datetime) -> Dict:
+    """Gets the filter matching the queued jobs that may run at a date"""
+    return {"status": s_job.JobStatus.QUEUED, "run_after": {"$lte": date}}
+
+
+def job_claim_filter(date: datetime) -> Dict:
+    """
+    Gets the filter matching the jobs a worker may lease at a date: those
+    runnable, and those running whose lease has expired with attempts left
+    """
+    return {
+        "$or": [
+            job_runnable_filter(date),
+            {
+                "status": s_job.JobStatus.RUNNING,
+                "lease_expires_at": {"$lt": date},
+                "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+            },
+        ]
+    }
+
+
+def job_expired_filter(date: datetime) -> Dict:
+    """
+    Gets the filter matching the running jobs whose lease expired by a date
+    on their last attempt
+    """
+    return {
+        "status": s_job.JobStatus.RUNNING,
+        "lease_expires_at": {"$lt": date},
+        "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+    }
+
+
+def media_available_filter(checksum: str) -> Dict:
+    """Gets the filter matching the transcoded media with a checksum"""
+    return {"checksum": checksum, "status": s_media.MediaStatus.AVAILABLE}
+
+
+def upload_session_expired_filter(date: datetime) -> Dict:
+    """Gets the filter matching the upload sessions expired by a date"""
+    return {"expires_at": {"$lt": date}}
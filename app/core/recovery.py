@@ -0,0 +1,140 @@
+import os
+import shutil
+import threading
+from datetime import UTC, datetime, timedelta
+from logging import getLogger
+from typing import Dict
+
+from bson.objectid import ObjectId
+from core.config import settings
+from core.media_storage import media_storage
+from core.queries import video_stale_filter
+from core.scheduling import get_uploader_tier, job_priority
+from core.storage import storage
+from schemas.job import JobStatus
+
+
+def has_active_job(video_id: str) -> bool:
+    """Checks if a video has a queued or running transcoding job"""
+    job = storage.job_get_record(
+        {"video_id": video_id, "status": {"$in": [JobStatus.QUEUED, JobStatus.RUNNING]}}
+    )
+    return job is not None
+
+
+def reconcile_videos(
+    stale_after_sec: float = settings.RECOVERY_STALE_AFTER_SEC,
+) -> Dict[str, int]:
+    """
+    Finds videos left processing by a process that died before their
+    transcoding job was queued and re-queues them, or deletes them when
+    their source never finished uploading. Jobs that were running are
+    recovered by workers when their lease expires
+    """
+    logger = getLogger(__name__ + ".reconcile_videos")
+    stale_before = datetime.now(UTC) - timedelta(seconds=stale_after_sec)
+    counts = {"requeued": 0, "deleted": 0}
+
+    videos = storage.video_get_all_records(video_stale_filter(stale_before))
+
+    for video in videos:
+        if has_active_job(video.id):
+            continue
+        if storage.video_claim_recovery({"_id": video.id}, stale_before) is None:
+            # being reconciled by another process
+            continue
+
+        prefix = media_storage.local_directory(video.id)
+        if prefix is not None:
+            source = f"{prefix}/{video.id}.mp4"
+            if not os.path.exists(source):
+                logger.warning(f"Video ({video.id}) has no source. Deleting")
+                storage.video_delete_record({"_id": video.id})
+                counts["deleted"] += 1
+                continue
+            if os.path.getmtime(source) > stale_before.timestamp():
+                # still being uploaded
+                continue
+
+        priority = job_priority(video.duration_in_sec, get_uploader_tier(video.user_id))
+        job_id = storage.job_create_record(video.id, priority)
+        logger.info(f"Video ({video.id}) re-queued for transcoding as job ({job_id})")
+        counts["requeued"] += 1
+
+    return counts
+
+
+def remove_orphan_directories(
+    directory: str = settings.VIDEO_DIRECTORY,
+    stale_after_sec: float = settings.RECOVERY_STALE_AFTER_SEC,
+) -> int:
+    """
+    Removes video directories whose video record no longer exists, e.g.
+    because the process died between deleting the record and its files
+    """
+    logger = getLogger(__name__ + ".remove_orphan_directories")
+    if not os.path.isdir(directory):
+        return 0
+
+    stale_before = datetime.now(UTC).timestamp() - stale_after_sec
+    count = 0
+    for name in os.listdir(directory):
+        path = f"{directory}/{name}"
+        if not os.path.isdir(path) or not ObjectId.is_valid(name):
+            continue
+        if os.path.getmtime(path) > stale_before:
+            continue
+        if storage.video_get_record({"_id": name}) is not None:
+            continue
+        if storage.media_get_record({"_id": name}) is not None:
+            # renditions shared by other videos outlive the original upload
+            continue
+
+        logger.info(f"Removing orphaned video directory {path}")
+        shutil.rmtree(path, ignore_errors=True)
+        count += 1
+
+    return count
+
+
+def remove_stale_scratch(directory: str = settings.WORKER_SCRATCH_DIRECTORY) -> int:
+    """
+    Removes scratch directories of jobs that are no longer running
+    on a worker of this host
+    """
+    if not os.path.isdir(directory):
+        return 0
+
+    count = 0
+    for name in os.listdir(directory):
+        if ObjectId.is_valid(name) and has_active_job(name):
+            continue
+        shutil.rmtree(f"{directory}/{name}", ignore_errors=True)
+        count += 1
+
+    return count
+
+
+def reconcile():
+    """
+    Runs the startup reconciliation pass, so that a restart during an
+    upload or encode does not leave stuck videos or leaked files behind
+    """
+    logger = getLogger(__name__ + ".reconcile")
+    try:
+        counts = reconcile_videos()
+        counts["orphaned_directories"] = remove_orphan_directories()
+        counts["expired_upload_sessions"] = (
+            storage.upload_session_delete_expired_records()
+        )
+        logger.info(f"Reconciliation done: {counts}")
+    except Exception as ex:
+        logger.error(ex, stack_info=True)
+
+
+def start_reconciliation() -> threading.Thread:
+    """Starts reconcile in a daemon thread"""
+    thread = threading.Thread(target=reconcile, name="reconcile", daemon=True)
+    thread.start()
+
+    return thread
@@ -0,0 +1,364 @@
+from typing import List, Optional, Tuple
+
+from core.config import settings
+from schemas.rendition import Rendition, RenditionPlan, ThumbnailPlan
+from schemas.video import MediaInfo
+
+
+def even(value: float) -> int:
+    """Rounds a dimension to the nearest even number, as libx264 requires"""
+    return max(2, int(round(value / 2)) * 2)
+
+
+def plan_renditions(
+    media_info: MediaInfo, ladder: List[Rendition] = settings.RENDITION_LADDER
+) -> List[RenditionPlan]:
+    """
+    Selects the renditions of the ladder that do not upscale the source.
+    Output dimensions preserve the source aspect ratio and bit rates
+    are capped at the source bit rate
+
+    Args:
+        media_info: probed metadata of the source video
+        ladder: renditions to choose from, highest first
+
+    Returns:
+        the renditions to encode, highest first
+    """
+    width, height = media_info.width, media_info.height
+    if not width or not height:
+        # unknown dimensions, so fall back to the ladder at 16:9
+        width, height = 1920, 1080
+    short_side = min(width, height)
+
+    selected = [r for r in ladder if r.height <= short_side]
+    if not selected:
+        # the source is below the whole ladder. Encode it once at its own size
+        lowest = min(ladder, key=lambda r: r.height)
+        selected = [
+            lowest.model_copy(update={"name": f"{short_side}p", "height": short_side})
+        ]
+
+    source_video_kbps = (media_info.video_bit_rate or 0) // 1000
+    source_audio_kbps = (media_info.audio_bit_rate or 0) // 1000
+    # only cap the frame rate, never raise it
+    fps = settings.MAX_FPS if media_info.fps > settings.MAX_FPS else None
+
+    plans = []
+    for rendition in selected:
+        scale = rendition.height / short_side
+        video_bit_rate = rendition.video_bit_rate
+        if source_video_kbps:
+            video_bit_rate = min(video_bit_rate, source_video_kbps)
+        audio_bit_rate = rendition.audio_bit_rate
+        if source_audio_kbps:
+            audio_bit_rate = min(audio_bit_rate, source_audio_kbps)
+
+        plans.append(
+            RenditionPlan(
+                name=rendition.name,
+                width=even(width * scale),
+                height=even(height * scale),
+                video_bit_rate=video_bit_rate,
+                # same maxrate/bufsize ratios as the original fixed ladder
+                max_rate=int(video_bit_rate * 1.07),
+                buffer_size=int(video_bit_rate * 1.5),
+                audio_bit_rate=audio_bit_rate,
+                fps=fps,
+            )
+        )
+
+    return plans
+
+
+def plan_audio(
+    media_info: MediaInfo, ladder: List[int] = settings.AUDIO_LADDER
+) -> List[int]:
+    """
+    Gets the bit rates of the shared audio renditions, highest first,
+    capped at the source audio bit rate
+    """
+    if not media_info.has_audio:
+        return []
+
+    source_audio_kbps = (media_info.audio_bit_rate or 0) // 1000
+    if source_audio_kbps:
+        ladder = [min(bit_rate, source_audio_kbps) for bit_rate in ladder]
+
+    return sorted(set(ladder), reverse=True)
+
+
+def plan_thumbnails(media_info: MediaInfo) -> Optional[ThumbnailPlan]:
+    """
+    Plans the poster, seek thumbnails and sprite sheets of a video,
+    or returns None if they are disabled or the source has no picture
+    """
+    width, height = media_info.width, media_info.height
+    if not settings.THUMBNAILS or not width or not height:
+        return None
+
+    duration = media_info.duration_in_sec
+    interval = settings.THUMBNAIL_INTERVAL_SEC
+    if duration > 0:
+        interval = max(interval, duration / settings.THUMBNAIL_MAX_COUNT)
+    poster_width = min(width, settings.POSTER_WIDTH)
+
+    return ThumbnailPlan(
+        width=even(settings.THUMBNAIL_WIDTH),
+        height=even(settings.THUMBNAIL_WIDTH * height / width),
+        interval_sec=round(interval, 3),
+        columns=settings.SPRITE_COLUMNS,
+        rows=settings.SPRITE_ROWS,
+        poster_width=even(poster_width),
+        poster_height=even(poster_width * height / width),
+        poster_time_sec=(
+            min(settings.POSTER_TIME_SEC, duration / 2) if duration > 0 else 0
+        ),
+    )
+
+
+def thumbnail_options(
+    thumbnails: ThumbnailPlan, label: str, directory: str
+) -> Tuple[List[str], List[str]]:
+    """
+    Gets the filters and outputs that cut thumbnails from the decoded
+    frames at label. Thumbnails are scaled once and tiled into sprite
+    sheets; the poster is a single frame at poster_time_sec
+    """
+    filters = []
+    outputs = []
+    source = label
+    if thumbnails.poster_time_sec is not None:
+        filters.append(f"{label}split=2[thumbnails_in][poster_in]")
+        filters.append(
+            f"[poster_in]trim=start={thumbnails.poster_time_sec},trim=end_frame=1,"
+            + f"scale=w={thumbnails.poster_width}:h={thumbnails.poster_height}"
+            + "[poster]"
+        )
+        outputs += [
+            "-map",
+            "[poster]",
+            "-frames:v",
+            "1",
+            "-update",
+            "1",
+            "-q:v",
+            "3",
+            f"{directory}/poster.jpg",
+        ]
+        source = "[thumbnails_in]"
+
+    filters.append(
+        f"{source}fps=1/{thumbnails.interval_sec},"
+        + f"scale=w={thumbnails.width}:h={thumbnails.height},"
+        + "split=2[thumbnails][sprites_in]"
+    )
+    filters.append(f"[sprites_in]tile={thumbnails.columns}x{thumbnails.rows}[sprites]")
+    outputs += [
+        "-map",
+        "[thumbnails]",
+        "-q:v",
+        "5",
+        "-start_number",
+        "0",
+        f"{directory}/thumb%05d.jpg",
+        "-map",
+        "[sprites]",
+        "-q:v",
+        "5",
+        "-start_number",
+        "0",
+        f"{directory}/sprite%03d.jpg",
+    ]
+
+    return filters, outputs
+
+
+def packaging_options(prefix: str, packaging: str = settings.HLS_PACKAGING):
+    """
+    Gets the HLS muxer options of a packaging mode. MPEGTS writes a .ts file
+    per segment. FMP4 writes one fragmented MP4 per rendition, with its init
+    section and segments addressed by EXT-X-MAP and EXT-X-BYTERANGE
+    """
+    if packaging == "FMP4":
+        return [
+            "-hls_flags",
+            "independent_segments+single_file",
+            "-hls_segment_type",
+            "fmp4",
+            "-hls_segment_filename",
+            f"{prefix}/stream_%v/data.mp4",
+        ]
+
+    return [
+        "-hls_flags",
+        "independent_segments",
+        "-hls_segment_type",
+        "mpegts",
+        "-hls_segment_filename",
+        f"{prefix}/stream_%v/data%03d.ts",
+    ]
+
+
+def build_hls_command(
+    input_file: str,
+    prefix: str,
+    renditions: List[RenditionPlan],
+    has_audio: bool,
+    audio_group: List[int] = [],
+    input_options: List[str] = [],
+    output_options: List[str] = [],
+    packaging: str = settings.HLS_PACKAGING,
+    preset: str = settings.X264_DEFAULT_PRESET,
+    thumbnails: Optional[ThumbnailPlan] = None,
+) -> List[str]:
+    """
+    Builds a single ffmpeg command that encodes all renditions to HLS.
+    If audio_group has bit rates, audio is encoded once per bit rate into
+    an audio group referenced by every video rendition instead of being
+    muxed into each of them. input_options go before -i (e.g. seeking)
+    and output_options before the HLS muxer options. preset is the x264
+    speed/quality preset. If thumbnails is given, they are cut from the
+    same decoded frames into {prefix}/thumbnails, which must exist
+    """
+    outputs = "".join(f"[v{i}]" for i in range(len(renditions)))
+    if thumbnails:
+        outputs += "[images]"
+    filters = [f"[0:v]split={len(renditions) + bool(thumbnails)}{outputs}"]
+    for i, rendition in enumerate(renditions):
+        filter = f"[v{i}]scale=w={rendition.width}:h={rendition.height}"
+        if rendition.fps:
+            filter += f",fps={rendition.fps}"
+        filters.append(filter + f"[v{i}out]")
+
+    command = [
+        "ffmpeg",
+        "-progress",
+        "pipe:1",
+        "-nostats",
+        *input_options,
+        "-i",
+        input_file,
+    ]
+    image_outputs = []
+    if thumbnails:
+        image_filters, image_outputs = thumbnail_options(
+            thumbnails, "[images]", f"{prefix}/thumbnails"
+        )
+        filters += image_filters
+    if renditions:
+        command += ["-filter_complex", "; ".join(filters)]
+
+    for i, rendition in enumerate(renditions):
+        command += [
+            "-map",
+            f"[v{i}out]",
+            f"-c:v:{i}",
+            "libx264",
+            f"-preset:v:{i}",
+            preset,
+            f"-b:v:{i}",
+            f"{rendition.video_bit_rate}k",
+            f"-maxrate:v:{i}",
+            f"{rendition.max_rate}k",
+            f"-bufsize:v:{i}",
+            f"{rendition.buffer_size}k",
+        ]
+
+    if has_audio and audio_group:
+        for i, bit_rate in enumerate(audio_group):
+            command += [
+                "-map",
+                "a:0",
+                f"-c:a:{i}",
+                "aac",
+                f"-b:a:{i}",
+                f"{bit_rate}k",
+                f"-ac:a:{i}",
+                "2",
+            ]
+        stream_map = " ".join(
+            [f"v:{i},agroup:audio" for i in range(len(renditions))]
+            + [
+                f"a:{i},agroup:audio,default:{'yes' if i == 0 else 'no'}"
+                for i in range(len(audio_group))
+            ]
+        )
+    elif has_audio:
+        for i, rendition in enumerate(renditions):
+            command += [
+                "-map",
+                "a:0",
+                "-c:a",
+                "aac",
+                f"-b:a:{i}",
+                f"{rendition.audio_bit_rate}k",
+                "-ac",
+                "2",
+            ]
+        stream_map = " ".join(f"v:{i},a:{i}" for i in range(len(renditions)))
+    else:
+        stream_map = " ".join(f"v:{i}" for i in range(len(renditions)))
+
+    command += [
+        *output_options,
+        "-f",
+        "hls",
+        "-hls_time",
+        str(settings.HLS_SEGMENT_SEC),
+        "-hls_playlist_type",
+        "vod",
+        *packaging_options(prefix, packaging),
+        "-master_pl_name",
+        "master.m3u8",
+        "-var_stream_map",
+        stream_map,
+        f"{prefix}/stream_%v/playlist.m3u8",
+        *image_outputs,
+    ]
+
+    return command
+
+
+def build_master_playlist(
+    variants: List[Tuple[RenditionPlan, str]],
+    audio: List[Tuple[int, str]] = [],
+    has_audio: bool = False,
+) -> str:
+    """
+    Builds a master playlist for the given variant playlists
+
+    Args:
+        variants: renditions and the relative URIs of their playlists
+        audio: bit rates and relative URIs of shared audio group playlists
+        has_audio: whether the variants have audio muxed in
+
+    Returns:
+        the contents of master.m3u8
+    """
+    lines = ["#EXTM3U", "#EXT-X-VERSION:6", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for i, (bit_rate, uri) in enumerate(audio):
+        lines.append(
+            '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",'
+            + f'NAME="audio_{bit_rate}k",DEFAULT={"YES" if i == 0 else "NO"},'
+            + f'AUTOSELECT=YES,URI="{uri}"'
+        )
+
+    audio_kbps = max((bit_rate for bit_rate, _ in audio), default=0)
+    for rendition, uri in sorted(
+        variants, key=lambda variant: variant[0].height, reverse=True
+    ):
+        kbps = rendition.max_rate
+        if audio:
+            kbps += audio_kbps
+        elif has_audio:
+            kbps += rendition.audio_bit_rate
+        stream_inf = (
+            f"#EXT-X-STREAM-INF:BANDWIDTH={kbps * 1000},"
+            + f"RESOLUTION={rendition.width}x{rendition.height}"
+        )
+        if audio:
+            stream_inf += ',AUDIO="audio"'
+        lines += [stream_inf, uri]
+
+    return "\n".join(lines) + "\n"
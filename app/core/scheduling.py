@@ -0,0 +1,67 @@
+from core.config import settings
+from core.storage import storage
+from schemas.user import UserTier
+
+# fastest first
+X264_PRESETS = [
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+]
+
+
+def get_uploader_tier(user_id: str) -> UserTier:
+    """Gets the tier of a video's uploader"""
+    user = storage.user_get_record({"_id": user_id})
+
+    return user.tier if user is not None else UserTier.STANDARD
+
+
+def job_priority(duration_in_sec: float, tier: UserTier) -> int:
+    """
+    Gets the queue priority of a transcoding job. Premium uploads and
+    short videos, which finish quickly, are run first
+    """
+    priority = settings.JOB_PRIORITY_BY_TIER.get(tier.value, 0)
+    if 0 < duration_in_sec <= settings.SHORT_VIDEO_SEC:
+        priority += settings.JOB_SHORT_VIDEO_PRIORITY
+
+    return priority
+
+
+def choose_preset(queue_depth: int, duration_in_sec: float, tier: UserTier) -> str:
+    """
+    Picks the x264 preset for a job from the current backlog, trading
+    quality for throughput as the queue grows. Long sources step one preset
+    faster and premium uploads one slower, within the configured presets
+    """
+    preset = next(
+        (
+            preset
+            for limit, preset in settings.X264_PRESET_LADDER
+            if queue_depth < limit
+        ),
+        settings.X264_BUSY_PRESET,
+    )
+
+    step = 0
+    if duration_in_sec >= settings.LONG_VIDEO_SEC:
+        step -= 1
+    if tier == UserTier.PREMIUM:
+        step += 1
+
+    allowed = [
+        X264_PRESETS.index(p)
+        for p in [settings.X264_BUSY_PRESET]
+        + [p for _, p in settings.X264_PRESET_LADDER]
+    ]
+    index = X264_PRESETS.index(preset) + step
+    index = max(min(allowed), min(max(allowed), index))
+
+    return X264_PRESETS[index]
@@ -1,9 +1,39 @@
+from core.async_mongo_storage import AsyncMongoStorage
 from core.config import settings
 from core.mongo_storage import MongoStorage
+from starlette.concurrency import run_in_threadpool
 
+
+class ThreadedStorage:
+    """
+    Awaitable methods of a synchronous storage, each call run in the
+    threadpool. Used by request handlers with DATABSE_SERVICE=MONGO_SYNC
+    """
+
+    def __init__(self, storage: MongoStorage):
+        """Initializes a ThreadedStorage object"""
+        self.storage = storage
+
+    def __getattr__(self, name: str):
+        method = getattr(self.storage, name)
+
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(method, *args, **kwargs)
+
+        return call
+
+
+# storage is used by workers and background threads, async_storage by
+# request handlers on the event loop
 storage = None
+async_storage = None
 
 if settings.DATABSE_SERVICE == "MONGO":
     storage = MongoStorage(settings.MONGO_URI, settings.DATABSE_NAME)
+    async_storage = AsyncMongoStorage(settings.MONGO_URI, settings.DATABSE_NAME)
+elif settings.DATABSE_SERVICE == "MONGO_SYNC":
+    storage = MongoStorage(settings.MONGO_URI, settings.DATABSE_NAME)
+    async_storage = ThreadedStorage(storage)
 else:
     storage = MongoStorage()
+    async_storage = AsyncMongoStorage()
@@ -0,0 +1,112 @@
+import base64
+import hashlib
+import hmac
+import time
+from datetime import UTC, datetime
+from typing import Dict, Optional, Tuple
+
+from core.config import settings
+from fastapi import HTTPException, status
+from schemas.video import Video, VideoPlayback
+
+SIGNATURE_BYTES = 16
+
+forbidden = HTTPException(
+    status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired stream token"
+)
+
+
+def load_keys() -> Dict[str, "hmac.HMAC"]:
+    """
+    Gets a keyed HMAC for each stream signing key id. Without configured
+    keys, a single key "0" is derived from SECRET_KEY
+    """
+    keys = settings.STREAM_SIGNING_KEYS or {
+        "0": hmac.new(
+            settings.SECRET_KEY.encode(), b"stream-signing", hashlib.sha256
+        ).hexdigest()
+    }
+
+    return {
+        key_id: hmac.new(secret.encode(), digestmod=hashlib.sha256)
+        for key_id, secret in keys.items()
+    }
+
+
+signing_keys = load_keys()
+
+
+def sign(key: "hmac.HMAC", key_id: str, prefix: str, expires: int) -> str:
+    """Gets the signature of a video prefix until expires (unix seconds)"""
+    mac = key.copy()
+    mac.update(f"{key_id}:{prefix}:{expires}".encode())
+
+    digest = mac.digest()[:SIGNATURE_BYTES]
+
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def create_stream_token(
+    prefix: str,
+    ttl_sec: float = settings.STREAM_TOKEN_TTL_SEC,
+    key_id: Optional[str] = None,
+) -> Tuple[str, int]:
+    """
+    Mints a token that grants access to every file under /stream/{prefix}/
+    for ttl_sec seconds, less up to STREAM_TOKEN_WINDOW_SEC. Returns the
+    token and its expiry in unix seconds
+    """
+    key_id = key_id or settings.STREAM_SIGNING_KEY_ID or next(iter(signing_keys))
+    expires = int(time.time() + ttl_sec)
+    window = settings.STREAM_TOKEN_WINDOW_SEC
+    if 0 < window <= ttl_sec:
+        # tokens minted in the same window are identical
+        expires -= expires % window
+    signature = sign(signing_keys[key_id], key_id, prefix, expires)
+
+    return f"{key_id}.{expires}.{signature}", expires
+
+
+def verify_stream_token(token: str, prefix: str) -> int:
+    """
+    Verifies that a token grants access to a video prefix and returns its
+    expiry in unix seconds. Only the signature and expiry are checked, so
+    no database lookup is needed.
+    Tokens signed with any configured key are accepted, so keys can be
+    rotated by adding the new key, making it current, and removing the old
+    one once its tokens have expired
+    """
+    key_id, _, rest = token.partition(".")
+    expires, _, signature = rest.partition(".")
+    key = signing_keys.get(key_id)
+    if key is None or not expires.isdigit() or int(expires) < time.time():
+        raise forbidden
+
+    if not hmac.compare_digest(signature, sign(key, key_id, prefix, int(expires))):
+        raise forbidden
+
+    return int(expires)
+
+
+def create_playback(video: Video) -> VideoPlayback:
+    """
+    Gets signed URLs to play a video. The token outlives the video's
+    duration so playback started near its expiry can finish
+    """
+    prefix = video.media_id or video.id
+    token, expires = create_stream_token(
+        prefix, ttl_sec=settings.STREAM_TOKEN_TTL_SEC + video.duration_in_sec
+    )
+    base_url = f"{settings.STREAM_BASE_URL}/signed/{token}/{prefix}"
+
+    thumbnails = video.thumbnails
+    return VideoPlayback(
+        url=f"{base_url}/master.m3u8",
+        poster_url=(
+            f"{base_url}/{thumbnails.poster}"
+            if thumbnails and thumbnails.poster
+            else None
+        ),
+        thumbnail_track_url=f"{base_url}/{thumbnails.track}" if thumbnails else None,
+        expires_at=datetime.fromtimestamp(expires, UTC),
+    )
@@ -0,0 +1,136 @@
+import os
+from typing import List, Tuple
+
+from schemas.rendition import ThumbnailPlan
+from schemas.video import VideoThumbnails
+
+TRACK_FILE = "thumbnails.vtt"
+
+
+def count_thumbnails(directory: str) -> int:
+    """Counts the thumbnails ffmpeg wrote to a directory"""
+    if not os.path.isdir(directory):
+        return 0
+
+    return sum(
+        1
+        for name in os.listdir(directory)
+        if name.startswith("thumb") and name.endswith(".jpg")
+    )
+
+
+def format_timestamp(seconds: float) -> str:
+    """Formats seconds as a WebVTT timestamp"""
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def build_thumbnail_track(
+    thumbnails: ThumbnailPlan,
+    segments: List[Tuple[str, float, int]],
+    duration_in_sec: float,
+) -> str:
+    """
+    Builds a WebVTT track that maps each thumbnail interval to its cell
+    in a sprite sheet
+
+    Args:
+        thumbnails: the plan the thumbnails were cut with
+        segments: (sprite file prefix, start time, thumbnail count) of each
+            run of thumbnails, e.g. one per chunk of a chunked encode
+        duration_in_sec: duration of the source
+
+    Returns:
+        the content of the track
+    """
+    per_sheet = thumbnails.columns * thumbnails.rows
+    lines = ["WEBVTT", ""]
+
+    for index, (sprite_prefix, start, count) in enumerate(segments):
+        end_of_segment = (
+            segments[index + 1][1] if index + 1 < len(segments) else duration_in_sec
+        )
+        for i in range(count):
+            begin = start + i * thumbnails.interval_sec
+            end = begin + thumbnails.interval_sec
+            if end_of_segment > begin:
+                end = min(end, end_of_segment)
+
+            cell = i % per_sheet
+            x = (cell % thumbnails.columns) * thumbnails.width
+            y = (cell // thumbnails.columns) * thumbnails.height
+            lines += [
+                f"{format_timestamp(begin)} --> {format_timestamp(end)}",
+                f"{sprite_prefix}sprite{i // per_sheet:03d}.jpg"
+                + f"#xywh={x},{y},{thumbnails.width},{thumbnails.height}",
+                "",
+            ]
+
+    return "\n".join(lines)
+
+
+def stitch_thumbnails(
+    directory: str, chunk_directories: List[Tuple[str, float]]
+) -> List[Tuple[str, float, int]]:
+    """
+    Moves the thumbnails and sprite sheets of each chunk of a chunked
+    encode into directory. Thumbnails are renumbered and sprite sheets
+    are prefixed with their chunk, as chunks have their own sheets
+
+    Args:
+        directory: the video's thumbnail directory
+        chunk_directories: (thumbnail directory, start time) of each chunk
+
+    Returns:
+        the segments of the thumbnail track
+    """
+    os.makedirs(directory, exist_ok=True)
+    segments = []
+    number = 0
+
+    for chunk, (chunk_directory, start) in enumerate(chunk_directories):
+        sprite_prefix = f"chunk{chunk:05d}_"
+        count = count_thumbnails(chunk_directory)
+        for name in sorted(os.listdir(chunk_directory)):
+            path = f"{chunk_directory}/{name}"
+            if name.startswith("thumb"):
+                os.replace(path, f"{directory}/thumb{number:05d}.jpg")
+                number += 1
+            elif name.startswith("sprite"):
+                os.replace(path, f"{directory}/{sprite_prefix}{name}")
+            elif name == "poster.jpg":
+                os.replace(path, f"{directory}/{name}")
+        segments.append((sprite_prefix, start, count))
+
+    return segments
+
+
+def write_thumbnail_track(
+    directory: str,
+    thumbnails: ThumbnailPlan,
+    segments: List[Tuple[str, float, int]],
+    duration_in_sec: float,
+    relative_to: str,
+) -> VideoThumbnails:
+    """
+    Writes the WebVTT thumbnail track next to the sprite sheets and
+    describes the result, with paths relative to the video's directory
+    """
+    with open(f"{directory}/{TRACK_FILE}", mode="w") as f:
+        f.write(build_thumbnail_track(thumbnails, segments, duration_in_sec))
+
+    base = os.path.relpath(directory, relative_to)
+    poster = None
+    if os.path.exists(f"{directory}/poster.jpg"):
+        poster = f"{base}/poster.jpg"
+
+    return VideoThumbnails(
+        poster=poster,
+        track=f"{base}/{TRACK_FILE}",
+        interval_sec=thumbnails.interval_sec,
+        count=sum(count for _, _, count in segments),
+    )
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import time
+from logging import getLogger
+
+from core.config import settings
+from fastapi import HTTPException, Request, UploadFile, status
+from schemas.upload import UploadResult
+from starlette.concurrency import run_in_threadpool
+
+
+def upload_session_path(session_id: str) -> str:
+    """Gets the path of the partial file backing an upload session"""
+    return f"{settings.UPLOAD_DIRECTORY}/{session_id}.part"
+
+
+def verify_upload_size(size: int, max_size: int = settings.MAX_UPLOAD_SIZE):
+    """Raises an error if the upload size exceeds the maximum allowed size"""
+    if size > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload exceeds the maximum size of {max_size} bytes",
+        )
+
+
+async def save_upload_file(
+    upload_file: UploadFile,
+    path: str,
+    chunk_size: int = settings.UPLOAD_CHUNK_SIZE,
+    max_size: int = settings.MAX_UPLOAD_SIZE,
+) -> UploadResult:
+    """
+    Streams an uploaded file to disk in fixed size chunks
+
+    Args:
+        upload_file: the file being uploaded
+        path: destination path of the file
+        chunk_size: number of bytes read into memory at a time
+        max_size: maximum number of bytes accepted
+
+    Returns:
+        UploadResult containing the size and sha256 checksum of the file
+    """
+    logger = getLogger(__name__ + ".save_upload_file")
+
+    if upload_file.size is not None:
+        verify_upload_size(upload_file.size, max_size)
+
+    checksum = hashlib.sha256()
+    size = 0
+    start = time.perf_counter()
+
+    def write_chunk(f, chunk: bytes):
+        # hashlib releases the GIL for large buffers so both run off the loop
+        checksum.update(chunk)
+        f.write(chunk)
+
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        while chunk := await upload_file.read(chunk_size):
+            size += len(chunk)
+            verify_upload_size(size, max_size)
+            await run_in_threadpool(write_chunk, f, chunk)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    await run_in_threadpool(f.close)
+
+    elapsed = time.perf_counter() - start
+    rate = size / elapsed if elapsed > 0 else 0
+    logger.info(
+        f"Wrote {size} bytes to {path} in {elapsed:.2f}s ({rate / 1e6:.2f} MB/s)"
+    )
+
+    return UploadResult(size=size, checksum=checksum.hexdigest(), elapsed_sec=elapsed)
+
+
+def hash_file(path: str, chunk_size: int = settings.UPLOAD_CHUNK_SIZE) -> UploadResult:
+    """Computes the size and sha256 checksum of a file already on disk"""
+    checksum = hashlib.sha256()
+    size = 0
+    start = time.perf_counter()
+
+    with open(path, mode="rb") as f:
+        while chunk := f.read(chunk_size):
+            size += len(chunk)
+            checksum.update(chunk)
+
+    return UploadResult(
+        size=size,
+        checksum=checksum.hexdigest(),
+        elapsed_sec=time.perf_counter() - start,
+    )
+
+
+def allocate_upload_file(path: str, size: int):
+    """Creates a sparse file of the given size for chunks to be written into"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode="wb") as f:
+        f.truncate(size)
+
+
+async def write_upload_chunk(
+    request: Request,
+    path: str,
+    offset: int,
+    length: int,
+    buffer_size: int = settings.UPLOAD_CHUNK_SIZE,
+) -> int:
+    """
+    Streams a request body into a file at the given offset
+
+    Args:
+        request: the request whose body holds the chunk
+        path: path of the file being written to
+        offset: byte offset of the chunk within the file
+        length: expected number of bytes in the chunk
+        buffer_size: number of bytes buffered in memory before writing
+
+    Returns:
+        number of bytes written
+    """
+    logger = getLogger(__name__ + ".write_upload_chunk")
+
+    fd = await run_in_threadpool(os.open, path, os.O_WRONLY)
+    buffer = bytearray()
+    written = 0
+    start = time.perf_counter()
+    try:
+        async for data in request.stream():
+            if written + len(buffer) + len(data) > length:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Chunk exceeds the expected size of {length} bytes",
+                )
+            buffer.extend(data)
+            if len(buffer) >= buffer_size:
+                await run_in_threadpool(os.pwrite, fd, bytes(buffer), offset + written)
+                written += len(buffer)
+                buffer.clear()
+
+        if buffer:
+            await run_in_threadpool(os.pwrite, fd, bytes(buffer), offset + written)
+            written += len(buffer)
+    finally:
+        await run_in_threadpool(os.close, fd)
+
+    if written != length:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Incomplete chunk. Expected {length} bytes, got {written}",
+        )
+
+    elapsed = time.perf_counter() - start
+    rate = written / elapsed if elapsed > 0 else 0
+    logger.debug(
+        f"Wrote {written} bytes at offset {offset} of {path} ({rate / 1e6:.2f} MB/s)"
+    )
+
+    return written
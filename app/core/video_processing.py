@@ -1,165 +1,470 @@
-import subprocess
+import asyncio
+import os
+import shutil
+import time
+from datetime import UTC, datetime
+from logging import getLogger
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
-from core.storage import storage
+from core.checkpoints import (
+    checkpoint_plan,
+    clean_partial_output,
+    is_checkpointed,
+    list_checkpoints,
+    write_checkpoint,
+)
+from core.config import settings
+from core.deduplication import deduplicate_video
+from core.media_probe import get_media_info, probe, run_with_progress, to_float
+from core.media_storage import media_storage
+from core.parallel_transcoding import (
+    ChunkProgress,
+    transcode_chunked,
+    use_parallel_transcoding,
+)
+from core.renditions import (
+    build_hls_command,
+    build_master_playlist,
+    plan_audio,
+    plan_renditions,
+    plan_thumbnails,
+)
+from core.scheduling import get_uploader_tier, job_priority
+from core.storage import async_storage, storage
+from core.thumbnails import count_thumbnails, write_thumbnail_track
+from schemas import video as s_video
+from schemas.event import EventType
+from schemas.media import MediaStatus
+from schemas.rendition import RenditionPlan, ThumbnailPlan
+from schemas.upload import UploadResult
+from starlette.concurrency import run_in_threadpool
 
 
-def generate_hls(input_file: str, prefix: str, video_id: str):
-    # Command to check if there is an audio stream
-    check_audio_cmd = ["ffmpeg", "-i", input_file]
+def parse_progress(
+    block: Dict[str, str], duration_in_sec: float
+) -> s_video.VideoProgress:
+    """Converts a block of ffmpeg -progress output to a VideoProgress"""
+    out_time = to_float(block.get("out_time_us")) / 1_000_000
+    speed = to_float(block.get("speed"))
+
+    if block.get("progress") == "end":
+        percent = 100
+    elif duration_in_sec > 0:
+        percent = min(99.9, 100 * out_time / duration_in_sec)
+    else:
+        percent = 0
+
+    eta_sec = None
+    if speed > 0 and duration_in_sec > 0:
+        eta_sec = max(0, duration_in_sec - out_time) / speed
+
+    return s_video.VideoProgress(
+        percent=round(percent, 1),
+        fps=to_float(block.get("fps")),
+        speed=speed,
+        eta_sec=eta_sec,
+        date_updated=datetime.now(UTC),
+    )
+
+
+class ProgressReporter:
+    """Writes parsed ffmpeg progress into a video record, at most once per interval"""
+
+    def __init__(
+        self,
+        video_id: str,
+        duration_in_sec: float,
+        interval: float = settings.PROGRESS_UPDATE_INTERVAL_SEC,
+    ):
+        """Initializes a ProgressReporter object"""
+        self.video_id = video_id
+        self.duration_in_sec = duration_in_sec
+        self.interval = interval
+        self.last_update = 0
+
+    async def __call__(self, block: Dict[str, str]):
+        now = time.monotonic()
+        if block.get("progress") != "end" and now - self.last_update < self.interval:
+            return
+        self.last_update = now
+
+        progress = parse_progress(block, self.duration_in_sec)
+        try:
+            await run_in_threadpool(
+                storage.video_update_record,
+                {"_id": self.video_id},
+                update={"progress": progress.model_dump()},
+                event=EventType.PROGRESS,
+            )
+        except Exception as ex:
+            # progress is informational and must never fail the encode
+            getLogger(__name__ + ".ProgressReporter").warning(ex)
+
+
+def remove_file(path: str):
+    """Removes a file if it exists"""
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def write_master_playlist(prefix: str, content: str):
+    """Atomically replaces the master playlist of a video"""
+    path = f"{prefix}/master.m3u8"
+    with open(f"{path}.tmp", mode="w") as f:
+        f.write(content)
+    os.replace(f"{path}.tmp", path)
+
+
+async def transcode_progressive(
+    input_file: str,
+    prefix: str,
+    video_id: str,
+    renditions: List[RenditionPlan],
+    has_audio: bool,
+    audio_group: List[int],
+    duration_in_sec: float,
+    on_progress: Callable[[Dict[str, str]], Awaitable[None]],
+    preset: str = settings.X264_DEFAULT_PRESET,
+    thumbnails: Optional[ThumbnailPlan] = None,
+):
+    """
+    Encodes each rendition as its own ffmpeg task, lowest first, and
+    rewrites master.m3u8 as each one finishes. The video becomes partially
+    available as soon as its first rendition is ready. Thumbnails are cut
+    by the lowest rendition's task
+    """
+    logger = getLogger(__name__ + ".transcode_progressive")
+    progress = ChunkProgress(on_progress, len(renditions) + bool(audio_group))
+
+    async def run(
+        output_prefix: str,
+        plan: str,
+        command: List[str],
+        index: int,
+        directories: List[str] = [],
+    ):
+        if await run_in_threadpool(is_checkpointed, output_prefix, plan):
+            # encoded by an earlier attempt that was interrupted
+            logger.info(f"Video ({video_id}) {output_prefix} resumed from checkpoint")
+            await progress.for_chunk(index)(
+                {"out_time_us": str(duration_in_sec * 1_000_000), "progress": "end"}
+            )
+            return True
+
+        await run_in_threadpool(shutil.rmtree, output_prefix, ignore_errors=True)
+        for directory in directories:
+            os.makedirs(directory, exist_ok=True)
+        returncode = await run_with_progress(command, progress.for_chunk(index))
+        if returncode == 0:
+            await run_in_threadpool(write_checkpoint, output_prefix, plan)
+        return returncode == 0
+
+    audio = []
+    if has_audio and audio_group:
+        # variants reference the audio group, so it has to exist first
+        command = build_hls_command(
+            input_file=input_file,
+            prefix=f"{prefix}/audio",
+            renditions=[],
+            has_audio=True,
+            audio_group=audio_group,
+        )
+        plan = checkpoint_plan(
+            audio_group=audio_group, packaging=settings.HLS_PACKAGING
+        )
+        if not await run(f"{prefix}/audio", plan, command, len(renditions)):
+            raise RuntimeError("ffmpeg failed on audio")
+        await run_in_threadpool(
+            media_storage.store_renditions, video_id, prefix, ["audio"]
+        )
+        audio = [
+            (bit_rate, f"audio/stream_{i}/playlist.m3u8")
+            for i, bit_rate in enumerate(audio_group)
+        ]
+
+    slots = asyncio.Semaphore(settings.PROGRESSIVE_PUBLISHING_PROCESSES)
+    publish_lock = asyncio.Lock()
+    published: List[Tuple[RenditionPlan, str]] = []
+
+    async def encode(index: int, rendition: RenditionPlan):
+        async with slots:
+            output_prefix = f"{prefix}/{rendition.name}"
+            rendition_thumbnails = thumbnails if index == 0 else None
+            command = build_hls_command(
+                input_file=input_file,
+                prefix=output_prefix,
+                renditions=[rendition],
+                has_audio=has_audio and not audio_group,
+                preset=preset,
+                thumbnails=rendition_thumbnails,
+            )
+            plan = checkpoint_plan(
+                rendition=rendition.model_dump(),
+                has_audio=has_audio and not audio_group,
+                preset=preset,
+                packaging=settings.HLS_PACKAGING,
+                thumbnails=rendition_thumbnails and rendition_thumbnails.model_dump(),
+            )
+            directories = (
+                [f"{output_prefix}/thumbnails"] if rendition_thumbnails else []
+            )
+            if not await run(output_prefix, plan, command, index, directories):
+                raise RuntimeError(f"ffmpeg failed on {rendition.name}")
+
+        async with publish_lock:
+            published.append((rendition, f"{rendition.name}/stream_0/playlist.m3u8"))
+            master = build_master_playlist(
+                published, audio=audio, has_audio=has_audio and not audio_group
+            )
+            await run_in_threadpool(write_master_playlist, prefix, master)
+            await run_in_threadpool(
+                media_storage.store_renditions,
+                video_id,
+                prefix,
+                [rendition.name, "master.m3u8"],
+            )
+            logger.info(f"Video ({video_id}) rendition {rendition.name} published")
+
+            if len(published) < len(renditions):
+                await run_in_threadpool(
+                    storage.video_update_record,
+                    {"_id": video_id},
+                    update={
+                        "available": True,
+                        "status": s_video.VideoStatus.PARTIALLY_AVAILABLE,
+                        "renditions": [r.name for r, _ in published],
+                    },
+                    event=EventType.PARTIALLY_AVAILABLE,
+                )
+
+    # a failing rendition cancels the others, which kills their ffmpeg
+    async with asyncio.TaskGroup() as group:
+        for index, rendition in enumerate(sorted(renditions, key=lambda r: r.height)):
+            group.create_task(encode(index, rendition))
+
+
+async def generate_hls(
+    input_file: str,
+    prefix: str,
+    video_id: str,
+    media_info: Optional[s_video.MediaInfo] = None,
+    encoding: Optional[s_video.VideoEncoding] = None,
+):
+    """
+    Converts a video to HLS using a rendition ladder planned from the source.
+    media_info is reused from upload time when given, otherwise the source
+    is probed. encoding holds the preset chosen by the scheduler and is
+    recorded on the video with the achieved encode speed
+    """
+    logger = getLogger(__name__ + ".generate_hls")
 
     try:
-        # Run the command to check for audio
-        result = subprocess.run(
-            check_audio_cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        if media_info is None:
+            media_info = get_media_info(await probe(input_file))
+
+        renditions = plan_renditions(media_info)
+        logger.info(
+            f"Video ({video_id}) renditions: {[r.name for r in renditions]},"
+            + f" has audio: {media_info.has_audio}"
+        )
+        audio_group = (
+            plan_audio(media_info) if settings.HLS_AUDIO_MODE == "GROUP" else []
+        )
+        thumbnails = plan_thumbnails(media_info)
+        thumbnails_directory = f"{prefix}/thumbnails"
+        thumbnail_segments = None
+
+        # an interrupted attempt may have left output behind. Checkpointed
+        # chunks and renditions are kept and resumed, the rest is re-encoded.
+        # master.m3u8 is kept as viewers may be playing its published renditions
+        await run_in_threadpool(
+            clean_partial_output,
+            prefix,
+            keep=[os.path.basename(input_file), "chunks", "master.m3u8"],
         )
-        has_audio = "Audio" in result.stderr
-        print(has_audio)
-
-        if not has_audio:
-            command = [
-                "ffmpeg",
-                "-i",
-                input_file,
-                "-filter_complex",
-                "[0:v]split=3[v1][v2][v3]; "
-                "[v1]scale=w=1920:h=1080[v1out]; "
-                "[v2]scale=w=1280:h=720[v2out]; "
-                "[v3]scale=w=854:h=480[v3out]",
-                "-map",
-                "[v1out]",
-                "-c:v:0",
-                "libx264",
-                "-b:v:0",
-                "5000k",
-                "-maxrate:v:0",
-                "5350k",
-                "-bufsize:v:0",
-                "7500k",
-                "-map",
-                "[v2out]",
-                "-c:v:1",
-                "libx264",
-                "-b:v:1",
-                "2800k",
-                "-maxrate:v:1",
-                "2996k",
-                "-bufsize:v:1",
-                "4200k",
-                "-map",
-                "[v3out]",
-                "-c:v:2",
-                "libx264",
-                "-b:v:2",
-                "1400k",
-                "-maxrate:v:2",
-                "1498k",
-                "-bufsize:v:2",
-                "2100k",
-                "-f",
-                "hls",
-                "-hls_time",
-                "10",
-                "-hls_playlist_type",
-                "vod",
-                "-hls_flags",
-                "independent_segments",
-                "-hls_segment_type",
-                "mpegts",
-                "-hls_segment_filename",
-                f"{prefix}/stream_%v/data%03d.ts",
-                "-master_pl_name",
-                f"master.m3u8",
-                "-var_stream_map",
-                "v:0 v:1 v:2",
-                f"{prefix}/stream_%v/playlist.m3u8",
-            ]
+
+        if encoding is None:
+            encoding = s_video.VideoEncoding(preset=settings.X264_DEFAULT_PRESET)
+        update = {"encoding": encoding.model_dump()}
+        published = await run_in_threadpool(list_checkpoints, prefix)
+        if not set(published) - {"audio", "chunks"}:
+            # no rendition to resume, so none published earlier is playable
+            await run_in_threadpool(remove_file, f"{prefix}/master.m3u8")
+            update["available"] = False
+            update["status"] = s_video.VideoStatus.PROCESSING
+            update["renditions"] = []
+        await run_in_threadpool(
+            storage.video_update_record,
+            {"_id": video_id},
+            update=update,
+            event=EventType.TRANSCODING,
+        )
+        started = time.monotonic()
+
+        if settings.PROGRESSIVE_PUBLISHING:
+            tasks = len(renditions) + bool(audio_group)
+            await transcode_progressive(
+                input_file=input_file,
+                prefix=prefix,
+                video_id=video_id,
+                renditions=renditions,
+                has_audio=media_info.has_audio,
+                audio_group=audio_group,
+                duration_in_sec=media_info.duration_in_sec,
+                on_progress=ProgressReporter(
+                    video_id, media_info.duration_in_sec * tasks
+                ),
+                preset=encoding.preset,
+                thumbnails=thumbnails,
+            )
+            lowest = min(renditions, key=lambda r: r.height)
+            thumbnails_directory = f"{prefix}/{lowest.name}/thumbnails"
+        elif use_parallel_transcoding(media_info.duration_in_sec):
+            thumbnail_segments = await transcode_chunked(
+                input_file=input_file,
+                prefix=prefix,
+                renditions=renditions,
+                has_audio=media_info.has_audio,
+                audio_group=audio_group,
+                duration_in_sec=media_info.duration_in_sec,
+                on_progress=ProgressReporter(video_id, media_info.duration_in_sec),
+                preset=encoding.preset,
+                thumbnails=thumbnails,
+            )
         else:
-            command = [
-                "ffmpeg",
-                "-i",
-                input_file,
-                "-filter_complex",
-                "[0:v]split=3[v1][v2][v3]; "
-                "[v1]scale=w=1920:h=1080[v1out]; "
-                "[v2]scale=w=1280:h=720[v2out]; "
-                "[v3]scale=w=854:h=480[v3out]",
-                "-map",
-                "[v1out]",
-                "-c:v:0",
-                "libx264",
-                "-b:v:0",
-                "5000k",
-                "-maxrate:v:0",
-                "5350k",
-                "-bufsize:v:0",
-                "7500k",
-                "-map",
-                "[v2out]",
-                "-c:v:1",
-                "libx264",
-                "-b:v:1",
-                "2800k",
-                "-maxrate:v:1",
-                "2996k",
-                "-bufsize:v:1",
-                "4200k",
-                "-map",
-                "[v3out]",
-                "-c:v:2",
-                "libx264",
-                "-b:v:2",
-                "1400k",
-                "-maxrate:v:2",
-                "1498k",
-                "-bufsize:v:2",
-                "2100k",
-                "-map",
-                "a:0",
-                "-c:a",
-                "aac",
-                "-b:a:0",
-                "192k",
-                "-ac",
-                "2",
-                "-map",
-                "a:0",
-                "-c:a",
-                "aac",
-                "-b:a:1",
-                "128k",
-                "-ac",
-                "2",
-                "-map",
-                "a:0",
-                "-c:a",
-                "aac",
-                "-b:a:2",
-                "96k",
-                "-ac",
-                "2",
-                "-f",
-                "hls",
-                "-hls_time",
-                "10",
-                "-hls_playlist_type",
-                "vod",
-                "-hls_flags",
-                "independent_segments",
-                "-hls_segment_type",
-                "mpegts",
-                "-hls_segment_filename",
-                f"{prefix}/stream_%v/data%03d.ts",
-                "-master_pl_name",
-                "master.m3u8",
-                "-var_stream_map",
-                "v:0,a:0 v:1,a:1 v:2,a:2",
-                f"{prefix}/stream_%v/playlist.m3u8",
-            ]
-
-        subprocess.run(command, check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error during HLS conversion: {e}")
-        print(e.stderr)
-        storage.video_delete_record({"_id": video_id})
+            if thumbnails:
+                os.makedirs(thumbnails_directory, exist_ok=True)
+            command = build_hls_command(
+                input_file=input_file,
+                prefix=prefix,
+                renditions=renditions,
+                has_audio=media_info.has_audio,
+                audio_group=audio_group,
+                preset=encoding.preset,
+                thumbnails=thumbnails,
+            )
+            returncode = await run_with_progress(
+                command,
+                on_progress=ProgressReporter(video_id, media_info.duration_in_sec),
+            )
+            if returncode != 0:
+                raise RuntimeError(f"ffmpeg exited with code {returncode}")
+
+        video_thumbnails = None
+        if thumbnails:
+            if thumbnail_segments is None:
+                # cut by a single ffmpeg run, so there is one run of thumbnails
+                count = count_thumbnails(thumbnails_directory)
+                thumbnail_segments = [("", 0, count)]
+            video_thumbnails = await run_in_threadpool(
+                write_thumbnail_track,
+                thumbnails_directory,
+                thumbnails,
+                thumbnail_segments,
+                media_info.duration_in_sec,
+                relative_to=prefix,
+            )
+
+        # progressive publishing stored each rendition as it finished
+        names = None
+        if settings.PROGRESSIVE_PUBLISHING:
+            names = (
+                [os.path.relpath(thumbnails_directory, prefix)] if thumbnails else []
+            )
+        await run_in_threadpool(media_storage.store_renditions, video_id, prefix, names)
+
+        encoding.elapsed_sec = time.monotonic() - started
+        if encoding.elapsed_sec > 0:
+            encoding.speed = media_info.duration_in_sec / encoding.elapsed_sec
+        logger.info(
+            f"Video ({video_id}) encoded with preset {encoding.preset}"
+            + f" at {encoding.speed or 0:.2f}x"
+        )
+    except Exception as e:
+        logger.error(f"Error during HLS conversion of video ({video_id}): {e}")
+        video = await run_in_threadpool(storage.video_get_record, {"_id": video_id})
+        if video is not None:
+            await run_in_threadpool(
+                storage.video_publish_event,
+                EventType.FAILED,
+                video,
+                data={"error": str(e)},
+            )
+        raise
     else:
-        storage.video_update_record({"_id": video_id}, update={"available": True})
+        update = {
+            "renditions": [rendition.name for rendition in renditions],
+            "thumbnails": video_thumbnails.model_dump() if video_thumbnails else None,
+        }
+        # make the renditions available to later uploads of the same content
+        await run_in_threadpool(
+            storage.media_update_record,
+            {"_id": video_id},
+            {
+                **update,
+                "status": MediaStatus.AVAILABLE,
+                "duration_in_sec": media_info.duration_in_sec,
+                "media_info": media_info.model_dump(),
+            },
+        )
+        await run_in_threadpool(
+            storage.video_update_record,
+            {"_id": video_id},
+            update={
+                **update,
+                "available": True,
+                "status": s_video.VideoStatus.AVAILABLE,
+                "encoding": encoding.model_dump(),
+            },
+            event=EventType.AVAILABLE,
+        )
+
+
+async def ingest_video(
+    video_id: str, user_id: str, upload: Optional[UploadResult] = None
+) -> s_video.Video:
+    """
+    Probes an uploaded source video and queues its HLS conversion. If the
+    upload's checksum matches a source that was already transcoded, the
+    video shares its renditions instead
+    """
+    logger = getLogger(__name__ + ".ingest_video")
+    video_path = f"{settings.VIDEO_DIRECTORY}/{video_id}/{video_id}.mp4"
+
+    if upload is not None:
+        video = await deduplicate_video(video_id, user_id, upload.checksum)
+        if video is not None:
+            return video
+
+    media_info = get_media_info(await probe(video_path))
+
+    update = {
+        "duration_in_sec": media_info.duration_in_sec,
+        "media_info": media_info.model_dump(),
+    }
+    if upload is not None:
+        # later uploads of the same content can share this video's renditions
+        # once transcoded. If identical content is still being transcoded,
+        # this one is transcoded on its own
+        registered = await async_storage.media_create_record(
+            video_id, upload.checksum, upload.size
+        )
+        update["checksum"] = upload.checksum
+        update["media_id"] = video_id if registered else None
+    await async_storage.video_update_record(
+        filter={"_id": video_id, "user_id": user_id},
+        update=update,
+        event=EventType.PROBED,
+    )
+
+    # workers fetch the source from the media storage
+    await run_in_threadpool(media_storage.store_source, video_id, video_path)
+
+    tier = await run_in_threadpool(get_uploader_tier, user_id)
+    priority = job_priority(media_info.duration_in_sec, tier)
+    job_id = await async_storage.job_create_record(video_id, priority)
+    logger.info(f"Video ({video_id}) queued for transcoding as job ({job_id})")
+
+    return await async_storage.video_verify_record(
+        filter={"_id": video_id, "user_id": user_id}
+    )
@@ -0,0 +1,28 @@
+import argparse
+import logging
+import sys
+
+from core.config import settings
+from core.indexes import apply_indexes, find_collection_scans
+from pymongo.mongo_client import MongoClient
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Them-Tube index management")
+    parser.add_argument(
+        "--check-plans",
+        action="store_true",
+        help="explain the storage's frequent queries and fail if any scans a collection",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    db = MongoClient(settings.MONGO_URI)[settings.DATABSE_NAME]
+
+    failed = apply_indexes(db)
+    if failed:
+        sys.exit(f"Unable to create indexes: {', '.join(failed)}")
+
+    if args.check_plans:
+        scans = find_collection_scans(db)
+        if scans:
+            sys.exit(f"Queries scanning a collection: {', '.join(scans)}")
@@ -1,18 +1,27 @@
-from api.v1.routers import health, stream, user, video
+from contextlib import asynccontextmanager
+
+from api.v1.routers import events, health, stream, upload, user, video
 from core.config import settings
+from core.events import start_change_stream_relay
+from core.recovery import start_reconciliation
+from core.storage import storage
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
-from fastapi.staticfiles import StaticFiles
 
-app = FastAPI(title="Them-Tube API", version=settings.RELEASE_ID)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.EVENTS_SOURCE == "CHANGE_STREAM":
+        # relay events published by transcoding workers to SSE subscribers
+        start_change_stream_relay(storage)
+    if settings.RECOVERY_ON_STARTUP:
+        start_reconciliation()
+    yield
+
+
+app = FastAPI(title="Them-Tube API", version=settings.RELEASE_ID, lifespan=lifespan)
 
-app.mount(
-    path="/stream",
-    app=StaticFiles(directory=f"{settings.VIDEO_DIRECTORY}"),
-    name="stream",
-)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_ORIGINS.split(","),
@@ -25,8 +34,11 @@ app.include_router(router=health.router, prefix=settings.API_V1_STR, tags=["heal
 
 app.include_router(router=user.router, prefix=settings.API_V1_STR, tags=["user"])
 
-# app.include_router(router=stream.router, prefix=settings.API_V1_STR, tags=["stream"])
+# players resolve segment URLs relative to /stream/{id}/master.m3u8
+app.include_router(router=stream.router, tags=["stream"])
 app.include_router(router=video.router, prefix=settings.API_V1_STR, tags=["video"])
+app.include_router(router=upload.router, prefix=settings.API_V1_STR, tags=["upload"])
+app.include_router(router=events.router, prefix=settings.API_V1_STR, tags=["events"])
 
 
 @app.get(path="/", include_in_schema=False)
@@ -0,0 +1,26 @@
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict
+
+from pydantic import BaseModel
+
+
+class EventType(str, Enum):
+    STATE = "state"
+    PROBED = "probed"
+    TRANSCODING = "transcoding"
+    PROGRESS = "progress"
+    PARTIALLY_AVAILABLE = "partially_available"
+    AVAILABLE = "available"
+    FAILED = "failed"
+    UPDATED = "updated"
+    DELETED = "deleted"
+
+
+class VideoEvent(BaseModel):
+    type: EventType
+    video_id: str
+    user_id: str
+    data: Dict[str, Any] = {}
+    origin: str = ""
+    date: datetime
@@ -9,6 +9,19 @@ class Status(str, Enum):
     WARN = "warn"
 
 
+class CacheStats(BaseModel):
+    policy: str
+    entries: int
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    hit_ratio: float
+    evictions: int
+    rejections: int
+    coalesced: int
+
+
 class Health(BaseModel):
     status: Status
     version: str
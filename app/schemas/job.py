@@ -0,0 +1,30 @@
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from pydantic import BaseModel, Field
+from schemas.base import PyObjectId
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+    DONE = "done"
+
+
+class Job(BaseModel):
+    id: PyObjectId = Field(validation_alias="_id")
+    video_id: str
+    status: JobStatus = JobStatus.QUEUED
+    priority: int = 0
+    attempts: int = 0
+    max_attempts: int
+    error: Optional[str] = None
+    run_after: datetime
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    date_started: Optional[datetime] = None
+    date_finished: Optional[datetime] = None
+    date_created: datetime
+    date_modified: datetime
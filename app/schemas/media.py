@@ -0,0 +1,36 @@
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+from schemas.base import PyObjectId
+from schemas.video import MediaInfo, VideoThumbnails
+
+
+class MediaStatus(str, Enum):
+    PROCESSING = "processing"
+    AVAILABLE = "available"
+
+
+class StoredFile(BaseModel):
+    size: int
+    etag: str
+
+
+class Media(BaseModel):
+    """
+    Renditions transcoded from one source file, shared by every video
+    uploaded with the same content. Stored under {id}/ in the media storage
+    """
+
+    id: PyObjectId = Field(validation_alias="_id")
+    checksum: str
+    size: int
+    status: MediaStatus = MediaStatus.PROCESSING
+    references: int = 1
+    renditions: List[str] = []
+    duration_in_sec: float = 0
+    media_info: Optional[MediaInfo] = None
+    thumbnails: Optional[VideoThumbnails] = None
+    date_created: datetime
+    date_modified: datetime
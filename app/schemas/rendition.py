@@ -0,0 +1,33 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class Rendition(BaseModel):
+    name: str
+    height: int
+    video_bit_rate: int
+    audio_bit_rate: int = 128
+
+
+class RenditionPlan(BaseModel):
+    name: str
+    width: int
+    height: int
+    video_bit_rate: int
+    max_rate: int
+    buffer_size: int
+    audio_bit_rate: int
+    fps: Optional[float] = None
+
+
+class ThumbnailPlan(BaseModel):
+    width: int
+    height: int
+    interval_sec: float
+    columns: int
+    rows: int
+    poster_width: int
+    poster_height: int
+    # None when the poster is cut from another part of the source
+    poster_time_sec: Optional[float] = None
@@ -0,0 +1,39 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+from schemas.base import PyObjectId
+
+
+class UploadResult(BaseModel):
+    size: int
+    checksum: str
+    elapsed_sec: float
+
+
+class UploadSessionIn(BaseModel):
+    title: str
+    description: Optional[str] = None
+    tags: List[str] = []
+    size: int = Field(gt=0)
+
+
+class UploadSession(BaseModel):
+    id: PyObjectId = Field(validation_alias="_id")
+    user_id: str
+    title: str
+    description: Optional[str] = None
+    tags: List[str]
+    size: int
+    chunk_size: int
+    chunk_count: int
+    received_chunks: List[int] = []
+    date_created: datetime
+    date_modified: datetime
+    expires_at: datetime
+
+
+class UploadChunk(BaseModel):
+    index: int
+    offset: int
+    size: int
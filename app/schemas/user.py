@@ -21,6 +21,11 @@ class UserStatus(str, Enum):
     DISABLED = "disabled"
 
 
+class UserTier(str, Enum):
+    STANDARD = "standard"
+    PREMIUM = "premium"
+
+
 class UserIn(BaseModel):
     username: str
     email: str
@@ -34,18 +39,24 @@ class User(BaseModel):
     password: str
     role: Role
     status: UserStatus = UserStatus.ENABLED
+    tier: UserTier = UserTier.STANDARD
     sign_in_type: SignInType = "NORMAL"
     verified: bool
     date_created: datetime
     date_modified: datetime
 
 
+class UserTierUpdate(BaseModel):
+    tier: UserTier
+
+
 class UserOut(BaseModel):
     id: PyObjectId
     username: str
     email: str
     role: Role
     status: UserStatus = UserStatus.ENABLED
+    tier: UserTier = UserTier.STANDARD
     sign_in_type: SignInType = "NORMAL"
     verified: bool
     date_created: datetime
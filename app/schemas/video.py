@@ -1,10 +1,63 @@
 from datetime import datetime
+from enum import Enum
 from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from schemas.base import PyObjectId
 
 
+class VideoStatus(str, Enum):
+    PROCESSING = "processing"
+    PARTIALLY_AVAILABLE = "partially_available"
+    AVAILABLE = "available"
+
+
+class VideoOrder(str, Enum):
+    NEWEST = "newest"
+    ID = "id"
+
+
+class VideoProgress(BaseModel):
+    percent: float = 0
+    fps: float = 0
+    speed: float = 0
+    eta_sec: Optional[float] = None
+    date_updated: Optional[datetime] = None
+
+
+class VideoEncoding(BaseModel):
+    preset: str
+    priority: int = 0
+    queue_depth: int = 0
+    speed: Optional[float] = None
+    elapsed_sec: Optional[float] = None
+
+
+class VideoThumbnails(BaseModel):
+    # paths are relative to the video's stream directory
+    poster: Optional[str] = None
+    track: str
+    interval_sec: float
+    count: int = 0
+
+
+class VideoPlayback(BaseModel):
+    url: str
+    poster_url: Optional[str] = None
+    thumbnail_track_url: Optional[str] = None
+    expires_at: datetime
+
+
+class MediaInfo(BaseModel):
+    width: int = 0
+    height: int = 0
+    fps: float = 0
+    video_bit_rate: Optional[int] = None
+    has_audio: bool = False
+    audio_bit_rate: Optional[int] = None
+    duration_in_sec: float = 0
+
+
 class Video(BaseModel):
     id: PyObjectId = Field(validation_alias="_id")
     user_id: str
@@ -12,10 +65,32 @@ class Video(BaseModel):
     description: Optional[str] = None
     tags: List[str]
     available: bool = False
+    status: VideoStatus = VideoStatus.PROCESSING
+    renditions: List[str] = []
     duration_in_sec: float
+    media_info: Optional[MediaInfo] = None
+    progress: Optional[VideoProgress] = None
+    encoding: Optional[VideoEncoding] = None
+    thumbnails: Optional[VideoThumbnails] = None
+    # renditions are stored under {media_id}/ in the media storage, shared with
+    # other uploads of the same content
+    media_id: Optional[str] = None
+    checksum: Optional[str] = None
     date_created: datetime
     date_modified: datetime
 
+    @model_validator(mode="before")
+    @classmethod
+    def default_status(cls, data):
+        # records created before statuses existed only have `available`
+        if isinstance(data, dict) and "status" not in data:
+            data["status"] = (
+                VideoStatus.AVAILABLE
+                if data.get("available")
+                else VideoStatus.PROCESSING
+            )
+        return data
+
 
 class VideoUpdate(BaseModel):
     title: str = ""
@@ -0,0 +1,17 @@
+import os
+
+# settings are read when core.config is imported, and the storage client is
+# created with core.storage. The clients connect lazily, so without startup
+# indexes no database is needed to import the modules under test
+for name, value in {
+    "MONGO_URI": "mongodb://localhost:27017",
+    "DATABSE_SERVICE": "MONGO",
+    "DATABSE_NAME": "them-tube-test",
+    "ALLOWED_ORIGINS": "*",
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_DAYS": "1",
+    "INDEXES_ON_STARTUP": "false",
+    "RECOVERY_ON_STARTUP": "false",
+}.items():
+    os.environ.setdefault(name, value)
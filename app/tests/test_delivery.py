@@ -0,0 +1,31 @@
+import pytest
+from core.delivery import parse_range
+from fastapi import HTTPException
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-200", (800, 999)),
+        ("bytes=-2000", (0, 999)),
+        ("bytes=900-5000", (900, 999)),
+        # served whole
+        ("bytes=0-99,200-299", None),
+        ("items=0-99", None),
+        ("bytes=a-b", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=500-400"])
+def test_parse_range_outside_the_file(header):
+    with pytest.raises(HTTPException) as info:
+        parse_range(header, 1000)
+
+    assert info.value.status_code == 416
+    assert info.value.headers == {"content-range": "bytes */1000"}
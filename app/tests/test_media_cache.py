@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from core.media_cache import CachedFile, MediaCache, SingleFlight
+
+
+def cached(size: int, ttl: float = 60) -> CachedFile:
+    return CachedFile(b"x" * size, {}, "video/mp2t", ttl)
+
+
+def test_lru_evicts_the_least_recently_used_file():
+    cache = MediaCache(max_bytes=30, max_entry_bytes=30, policy="LRU")
+    cache.put("a", cached(10))
+    cache.put("b", cached(10))
+    cache.put("c", cached(10))
+    cache.get("a")
+
+    cache.put("d", cached(10))
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ["a", "c", "d"])
+    assert cache.size == 30
+    assert cache.evictions == 1
+
+
+def test_lfu_evicts_the_least_frequently_used_file():
+    cache = MediaCache(max_bytes=30, max_entry_bytes=30, policy="LFU")
+    for key in ["a", "b", "c"]:
+        cache.put(key, cached(10))
+    cache.get("a")
+    cache.get("a")
+    cache.get("c")
+
+    cache.put("d", cached(10))
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ["a", "c", "d"])
+
+
+def test_large_files_are_not_admitted():
+    cache = MediaCache(max_bytes=100, max_entry_bytes=20)
+
+    assert not cache.put("a", cached(21))
+    assert cache.get("a") is None
+    assert cache.stats().rejections == 1
+
+
+def test_expired_files_are_not_served():
+    cache = MediaCache(max_bytes=100, max_entry_bytes=100)
+    cache.put("a", cached(10, ttl=0))
+
+    assert cache.get("a") is None
+    assert cache.size == 0
+    assert cache.stats().misses == 1
+
+
+def test_invalidate_removes_a_prefix():
+    cache = MediaCache(max_bytes=100, max_entry_bytes=100)
+    for key in ["v1/a.ts", "v1/b.ts", "v2/a.ts"]:
+        cache.put(key, cached(10))
+
+    assert cache.invalidate("v1/") == 2
+    assert cache.get("v2/a.ts") is not None
+    assert cache.size == 10
+
+
+def test_load_reads_a_miss_once():
+    cache = MediaCache(max_bytes=100, max_entry_bytes=100)
+    reads = []
+
+    def read(key: str) -> CachedFile:
+        reads.append(key)
+        time.sleep(0.05)
+        return cached(10)
+
+    async def load_all():
+        return await asyncio.gather(*[cache.load("a", read) for _ in range(5)])
+
+    entries = asyncio.run(load_all())
+
+    assert reads == ["a"]
+    assert all(entry is entries[0] for entry in entries)
+    assert cache.stats().coalesced == 4
+    assert cache.get("a") is entries[0]
+
+
+def test_single_flight_raises_the_error_to_every_caller():
+    flights = SingleFlight()
+
+    def fail():
+        time.sleep(0.05)
+        raise ValueError("unreadable")
+
+    async def call_all():
+        return await asyncio.gather(
+            *[flights.do("a", fail) for _ in range(3)], return_exceptions=True
+        )
+
+    results = asyncio.run(call_all())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.flights == {}
+
+
+def test_single_flight_waiters_time_out_without_cancelling_the_call():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "done"
+
+    async def call():
+        first = asyncio.ensure_future(flights.do("a", slow))
+        await asyncio.sleep(0)
+        with pytest.raises(TimeoutError):
+            await flights.do("a", slow, timeout=0.01)
+        release.set()
+        return await first
+
+    assert asyncio.run(call()) == "done"
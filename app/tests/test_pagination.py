@@ -0,0 +1,66 @@
+import base64
+import json
+from datetime import UTC, datetime
+
+import pytest
+from bson.objectid import ObjectId
+from core.pagination import cursor_filter, encode_cursor
+from fastapi import HTTPException
+from schemas.video import Video, VideoOrder
+
+VIDEO = Video(
+    _id="6710a0000000000000000000",
+    user_id="user1",
+    title="title",
+    tags=[],
+    duration_in_sec=1,
+    date_created=datetime(2026, 1, 1, 12, 0, 0, 123456, tzinfo=UTC),
+    date_modified=datetime(2026, 1, 1, tzinfo=UTC),
+)
+
+
+def test_an_id_cursor_continues_after_the_video():
+    cursor = encode_cursor(VIDEO, VideoOrder.ID)
+
+    assert cursor_filter(cursor, VideoOrder.ID) == {"_id": {"$gt": ObjectId(VIDEO.id)}}
+
+
+def test_a_newest_cursor_continues_after_the_video_at_millisecond_precision():
+    cursor = encode_cursor(VIDEO, VideoOrder.NEWEST)
+    # MongoDB stores dates in milliseconds
+    date = datetime(2026, 1, 1, 12, 0, 0, 123000, tzinfo=UTC)
+
+    assert cursor_filter(cursor, VideoOrder.NEWEST) == {
+        "date_created": {"$lte": date},
+        "$or": [
+            {"date_created": {"$lt": date}},
+            {"date_created": date, "_id": {"$lt": ObjectId(VIDEO.id)}},
+        ],
+    }
+
+
+def test_a_cursor_of_another_order_is_refused():
+    cursor = encode_cursor(VIDEO, VideoOrder.ID)
+
+    with pytest.raises(HTTPException) as info:
+        cursor_filter(cursor, VideoOrder.NEWEST)
+
+    assert info.value.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64!",
+        base64.urlsafe_b64encode(b"not json").decode(),
+        base64.urlsafe_b64encode(json.dumps({"o": "newest"}).encode()).decode(),
+        base64.urlsafe_b64encode(
+            json.dumps({"o": "id", "i": "not an id"}).encode()
+        ).decode(),
+    ],
+)
+def test_an_invalid_cursor_is_refused(cursor):
+    with pytest.raises(HTTPException) as info:
+        cursor_filter(cursor, VideoOrder.NEWEST)
+
+    assert info.value.status_code == 400
@@ -0,0 +1,116 @@
+import os
+
+from core.parallel_transcoding import plan_chunks, stitch_playlists
+
+
+def write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode="w") as f:
+        f.write(content)
+
+
+def read_lines(path: str):
+    with open(path, mode="r") as f:
+        return f.read().splitlines()
+
+
+def test_plan_chunks_starts_each_chunk_on_a_keyframe():
+    keyframes = [0, 2, 4, 6, 8, 10, 12, 14, 16, 18]
+
+    assert plan_chunks(keyframes, 20, chunk_sec=6) == [(0, 6), (6, 12), (12, 20)]
+
+
+def test_plan_chunks_merges_a_short_tail():
+    # a chunk at 10s would leave a 1s tail, shorter than half a chunk
+    assert plan_chunks([5, 10], 11, chunk_sec=5) == [(0, 5), (5, 11)]
+
+
+def test_plan_chunks_without_keyframes_is_one_chunk():
+    assert plan_chunks([], 30, chunk_sec=10) == [(0, 30)]
+
+
+def test_stitch_playlists_renumbers_ts_segments(tmp_path):
+    prefix, chunks = f"{tmp_path}/out", f"{tmp_path}/chunks"
+    for chunk, durations in enumerate([[4.0, 3.5], [5.2]]):
+        directory = f"{chunks}/{chunk:05d}/stream_0"
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:6"]
+        lines.append("#EXT-X-MEDIA-SEQUENCE:0")
+        for index, duration in enumerate(durations):
+            lines += [f"#EXTINF:{duration},", f"data{index:03d}.ts"]
+            write(f"{directory}/data{index:03d}.ts", f"{chunk}/{index}")
+        write(f"{directory}/playlist.m3u8", "\n".join(lines + ["#EXT-X-ENDLIST"]))
+    write(f"{chunks}/00000/master.m3u8", "#EXTM3U")
+
+    stitch_playlists(prefix, chunks, 2)
+
+    assert read_lines(f"{prefix}/stream_0/playlist.m3u8") == [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-TARGETDURATION:6",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXTINF:4.0,",
+        "data000.ts",
+        "#EXTINF:3.5,",
+        "data001.ts",
+        "#EXT-X-DISCONTINUITY",
+        "#EXTINF:5.2,",
+        "data002.ts",
+        "#EXT-X-ENDLIST",
+    ]
+    assert read_lines(f"{prefix}/stream_0/data002.ts") == ["1/0"]
+    assert os.path.exists(f"{prefix}/master.m3u8")
+
+
+def test_stitch_playlists_keeps_fmp4_maps_and_byteranges(tmp_path):
+    prefix, chunks = f"{tmp_path}/out", f"{tmp_path}/chunks"
+    for chunk in range(2):
+        directory = f"{chunks}/{chunk:05d}/stream_0"
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            "#EXT-X-TARGETDURATION:4",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+            '#EXT-X-MAP:URI="data.mp4",BYTERANGE="800@0"',
+            "#EXTINF:4.0,",
+            "#EXT-X-BYTERANGE:1000@800",
+            "data.mp4",
+            "#EXTINF:2.0,",
+            "#EXT-X-BYTERANGE:500@1800",
+            "data.mp4",
+            "#EXT-X-ENDLIST",
+        ]
+        write(f"{directory}/data.mp4", str(chunk))
+        write(f"{directory}/playlist.m3u8", "\n".join(lines))
+    write(f"{chunks}/00000/master.m3u8", "#EXTM3U")
+
+    stitch_playlists(prefix, chunks, 2)
+
+    chunk_lines = [
+        "#EXTINF:4.0,",
+        "#EXT-X-BYTERANGE:1000@800",
+        "#EXTINF:2.0,",
+        "#EXT-X-BYTERANGE:500@1800",
+    ]
+    assert read_lines(f"{prefix}/stream_0/playlist.m3u8") == [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        "#EXT-X-TARGETDURATION:4",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        '#EXT-X-MAP:URI="chunk00000_data.mp4",BYTERANGE="800@0"',
+        chunk_lines[0],
+        chunk_lines[1],
+        "chunk00000_data.mp4",
+        chunk_lines[2],
+        chunk_lines[3],
+        "chunk00000_data.mp4",
+        "#EXT-X-DISCONTINUITY",
+        '#EXT-X-MAP:URI="chunk00001_data.mp4",BYTERANGE="800@0"',
+        chunk_lines[0],
+        chunk_lines[1],
+        "chunk00001_data.mp4",
+        chunk_lines[2],
+        chunk_lines[3],
+        "chunk00001_data.mp4",
+        "#EXT-X-ENDLIST",
+    ]
+    assert read_lines(f"{prefix}/stream_0/chunk00001_data.mp4") == ["1"]
@@ -0,0 +1,70 @@
+from core.renditions import plan_renditions
+from schemas.rendition import Rendition
+from schemas.video import MediaInfo
+
+LADDER = [
+    Rendition(name="1080p", height=1080, video_bit_rate=5000, audio_bit_rate=192),
+    Rendition(name="720p", height=720, video_bit_rate=2800),
+    Rendition(name="480p", height=480, video_bit_rate=1400),
+]
+
+
+def test_plan_renditions_never_upscales():
+    plans = plan_renditions(MediaInfo(width=1280, height=720, fps=30), LADDER)
+
+    assert [(p.name, p.width, p.height) for p in plans] == [
+        ("720p", 1280, 720),
+        ("480p", 854, 480),
+    ]
+
+
+def test_plan_renditions_scales_portrait_sources_by_their_short_side():
+    plans = plan_renditions(MediaInfo(width=1080, height=1920, fps=30), LADDER)
+
+    assert [(p.name, p.width, p.height) for p in plans] == [
+        ("1080p", 1080, 1920),
+        ("720p", 720, 1280),
+        ("480p", 480, 854),
+    ]
+
+
+def test_plan_renditions_encodes_a_small_source_once_at_its_size():
+    plans = plan_renditions(MediaInfo(width=320, height=240, fps=30), LADDER)
+
+    assert [(p.name, p.width, p.height) for p in plans] == [("240p", 320, 240)]
+    assert plans[0].video_bit_rate == 1400
+
+
+def test_plan_renditions_caps_bit_rates_at_the_source():
+    media_info = MediaInfo(
+        width=1920,
+        height=1080,
+        fps=30,
+        video_bit_rate=2_000_000,
+        has_audio=True,
+        audio_bit_rate=96_000,
+    )
+    plans = plan_renditions(media_info, LADDER)
+
+    assert [p.video_bit_rate for p in plans] == [2000, 2000, 1400]
+    assert [p.audio_bit_rate for p in plans] == [96, 96, 96]
+    assert plans[0].max_rate == 2140
+    assert plans[0].buffer_size == 3000
+
+
+def test_plan_renditions_only_caps_the_frame_rate():
+    high = plan_renditions(MediaInfo(width=1280, height=720, fps=120), LADDER)
+    low = plan_renditions(MediaInfo(width=1280, height=720, fps=24), LADDER)
+
+    assert {p.fps for p in high} == {60}
+    assert {p.fps for p in low} == {None}
+
+
+def test_plan_renditions_falls_back_to_16_9_for_unknown_dimensions():
+    plans = plan_renditions(MediaInfo(), LADDER)
+
+    assert [(p.width, p.height) for p in plans] == [
+        (1920, 1080),
+        (1280, 720),
+        (854, 480),
+    ]
@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+import time
+
+import pytest
+from core import stream_signing
+from core.stream_signing import create_stream_token, verify_stream_token
+from fastapi import HTTPException
+
+
+def test_a_token_grants_access_to_its_prefix():
+    token, expires = create_stream_token("video1", ttl_sec=3600)
+
+    assert verify_stream_token(token, "video1") == expires
+    assert expires > time.time()
+
+
+def test_tokens_minted_in_the_same_window_are_identical(monkeypatch):
+    monkeypatch.setattr(time, "time", lambda: 1_800_000_000)
+    first = create_stream_token("video1", ttl_sec=7200)
+    monkeypatch.setattr(time, "time", lambda: 1_800_000_000 + 1000)
+
+    assert create_stream_token("video1", ttl_sec=7200) == first
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        "",
+        "0",
+        "0.not-a-date.signature",
+        "unknown.9999999999.signature",
+        "0.9999999999.signature",
+    ],
+)
+def test_malformed_tokens_are_refused(token):
+    with pytest.raises(HTTPException) as info:
+        verify_stream_token(token, "video1")
+
+    assert info.value.status_code == 403
+
+
+def test_a_token_is_refused_for_another_prefix():
+    token, _ = create_stream_token("video1", ttl_sec=3600)
+
+    with pytest.raises(HTTPException):
+        verify_stream_token(token, "video2")
+
+
+def test_an_expired_token_is_refused():
+    key_id = next(iter(stream_signing.signing_keys))
+    expires = int(time.time()) - 1
+    signature = stream_signing.sign(
+        stream_signing.signing_keys[key_id], key_id, "video1", expires
+    )
+
+    with pytest.raises(HTTPException):
+        verify_stream_token(f"{key_id}.{expires}.{signature}", "video1")
+
+
+def test_tokens_of_a_rotated_key_stay_valid(monkeypatch):
+    keys = {
+        key_id: hmac.new(secret.encode(), digestmod=hashlib.sha256)
+        for key_id, secret in {"old": "old-secret", "new": "new-secret"}.items()
+    }
+    monkeypatch.setattr(stream_signing, "signing_keys", keys)
+    old_token, _ = create_stream_token("video1", ttl_sec=3600, key_id="old")
+    new_token, _ = create_stream_token("video1", ttl_sec=3600, key_id="new")
+
+    verify_stream_token(old_token, "video1")
+    verify_stream_token(new_token, "video1")
+
+    monkeypatch.setattr(stream_signing, "signing_keys", {"new": keys["new"]})
+    with pytest.raises(HTTPException):
+        verify_stream_token(old_token, "video1")
@@ -0,0 +1,30 @@
+from core.video_processing import parse_progress
+
+
+def test_parse_progress_reports_percent_and_eta():
+    progress = parse_progress(
+        {"out_time_us": "30000000", "fps": "48.5", "speed": "2.0x"}, 120
+    )
+
+    assert progress.percent == 25
+    assert progress.fps == 48.5
+    assert progress.speed == 2
+    assert progress.eta_sec == 45
+    assert progress.date_updated is not None
+
+
+def test_parse_progress_is_only_complete_at_the_end():
+    running = parse_progress({"out_time_us": "130000000", "speed": "1x"}, 120)
+    ended = parse_progress({"out_time_us": "120000000", "progress": "end"}, 120)
+
+    assert running.percent == 99.9
+    assert running.eta_sec == 0
+    assert ended.percent == 100
+
+
+def test_parse_progress_ignores_missing_values():
+    progress = parse_progress({"out_time_us": "N/A", "speed": "N/A"}, 0)
+
+    assert progress.percent == 0
+    assert progress.speed == 0
+    assert progress.eta_sec is None
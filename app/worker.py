@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+
+from core.config import settings
+from core.jobs import run_worker
+from core.recovery import reconcile
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Them-Tube transcoding worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.TRANSCODE_CONCURRENCY,
+        help="number of concurrent ffmpeg processes",
+    )
+    parser.add_argument(
+        "--worker-id",
+        default=None,
+        help="identifier used to lease jobs. Defaults to <hostname>-<pid>",
+    )
+    parser.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="run the reconciliation pass for stuck videos and leaked files, then exit",
+    )
+    args = parser.parse_args()
+
+    if args.reconcile:
+        reconcile()
+    else:
+        asyncio.run(run_worker(concurrency=args.concurrency, worker_id=args.worker_id))